@@ -57,6 +57,9 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'online_clinics.middleware.InstrumentationMiddleware',
+    'online_clinics.middleware.CompressionMiddleware',
+    'online_clinics.middleware.ReplicaPinMiddleware',
 ]
 
 ROOT_URLCONF = 'Doctor_Online.urls'
@@ -79,14 +82,83 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'Doctor_Online.wsgi.application'
 
+# Worker threads behind the async read endpoints
+ASYNC_VIEW_WORKERS = int(os.environ.get("ASYNC_VIEW_WORKERS", 16))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
-DATABASES = {
+# DB_ENGINE selects sqlite (default) or postgres. Behind a transaction-mode
+# pooler such as PgBouncer set DB_POOLER=1, server-side cursors do not
+# survive a connection being handed to another client.
+DB_ENGINE = os.environ.get("DB_ENGINE", "sqlite")
+
+if DB_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get("DB_NAME", 'doctor_online'),
+            'USER': os.environ.get("DB_USER", 'postgres'),
+            'PASSWORD': os.environ.get("DB_PASSWORD", ''),
+            'HOST': os.environ.get("DB_HOST", 'localhost'),
+            'PORT': os.environ.get("DB_PORT", '5432'),
+            'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", 60)),
+            'DISABLE_SERVER_SIDE_CURSORS': bool(int(os.environ.get("DB_POOLER", 0))),
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get("DB_CONNECT_TIMEOUT", 5)),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get("DB_NAME", BASE_DIR / 'db.sqlite3'),
+            # Opening a SQLite file is cheap, connections are not kept by default
+            'CONN_MAX_AGE': int(os.environ.get("DB_CONN_MAX_AGE", 0)),
+            'OPTIONS': {
+                'timeout': int(os.environ.get("DB_BUSY_TIMEOUT", 5000)) / 1000,
+            },
+            # A file, not shared-cache memory, so tests see real WAL locking
+            'TEST': {
+                'NAME': os.environ.get("DB_TEST_NAME", BASE_DIR / 'test_db.sqlite3'),
+            },
+        }
+    }
+
+# DB_REPLICAS lists read replicas, SQLite files or Postgres hosts separated
+# by commas. Leave it unset for the test suite, test mirrors cannot see the
+# rows of a TestCase transaction.
+DB_REPLICAS = [replica for replica in os.environ.get("DB_REPLICAS", '').split(',') if replica]
+for index, replica in enumerate(DB_REPLICAS, start=1):
+    DATABASES[f'replica_{index}'] = {
+        **DATABASES['default'],
+        'NAME' if DB_ENGINE == 'sqlite' else 'HOST': replica,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['online_clinics.routers.ReplicaRouter']
+
+# Connection tuning, write retries and replica routing, see online_clinics.db
+DATABASE_TUNING = {
+    'SQLITE_JOURNAL_MODE': os.environ.get("DB_JOURNAL_MODE", 'WAL'),
+    'SQLITE_SYNCHRONOUS': os.environ.get("DB_SYNCHRONOUS", 'NORMAL'),
+    'SQLITE_BUSY_TIMEOUT': int(os.environ.get("DB_BUSY_TIMEOUT", 5000)),
+    'HEALTH_CHECKS': bool(int(os.environ.get("DB_HEALTH_CHECKS", 1))),
+    'WRITE_RETRIES': int(os.environ.get("DB_WRITE_RETRIES", 5)),
+    'REPLICAS': [f'replica_{index}' for index in range(1, len(DB_REPLICAS) + 1)],
+    'REPLICA_PIN_SECONDS': int(os.environ.get("DB_REPLICA_PIN_SECONDS", 5)),
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'doctor-online'),
     }
 }
 
@@ -109,6 +181,14 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Password hashing runs on a bounded pool, see online_clinics.hashing
+PASSWORD_HASHING = {
+    'WORKERS': int(os.environ.get("PASSWORD_HASHING_WORKERS", os.cpu_count() or 4)),
+    'QUEUE': int(os.environ.get("PASSWORD_HASHING_QUEUE", 16)),
+    'HASHER': os.environ.get("PASSWORD_HASHER", 'default'),
+    'ITERATIONS': int(os.environ.get("PASSWORD_HASHING_ITERATIONS", 0)) or None,
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/3.2/topics/i18n/
@@ -143,6 +223,18 @@ REST_FRAMEWORK = {
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ],
 
+    # orjson backed when installed, the stock JSON classes otherwise
+    'DEFAULT_RENDERER_CLASSES': [
+        'online_clinics.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+
+    'DEFAULT_PARSER_CLASSES': [
+        'online_clinics.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+
     'TEST_REQUEST_RENDERER_CLASSES': [
         'rest_framework.renderers.MultiPartRenderer',
         'rest_framework.renderers.JSONRenderer',
@@ -157,4 +249,52 @@ REST_FRAMEWORK = {
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1)
-}
\ No newline at end of file
+}
+
+# Per-view timing and query histograms, see online_clinics.instrumentation
+INSTRUMENTATION = {
+    'ENABLED': bool(int(os.environ.get("INSTRUMENTATION", 0))),
+    'SERVER_TIMING': bool(int(os.environ.get("INSTRUMENTATION_SERVER_TIMING", 1))),
+    'FLUSH_EVERY': int(os.environ.get("INSTRUMENTATION_FLUSH_EVERY", 20)),
+}
+
+# Background jobs, see online_clinics.jobs and the run_jobs command
+JOBS = {
+    'BATCH_SIZE': int(os.environ.get("JOBS_BATCH_SIZE", 100)),
+    'REMINDER_HOURS': int(os.environ.get("JOBS_REMINDER_HOURS", 24)),
+    'PURGE_BATCH_SIZE': int(os.environ.get("JOBS_PURGE_BATCH_SIZE", 500)),
+}
+
+# Used by the archive_reservations command
+ARCHIVE = {
+    'AFTER_DAYS': int(os.environ.get("ARCHIVE_AFTER_DAYS", 365)),
+    'BATCH_SIZE': int(os.environ.get("ARCHIVE_BATCH_SIZE", 1000)),
+    'PAUSE': float(os.environ.get("ARCHIVE_PAUSE", 0)),
+}
+
+# Brotli is used when the brotli package is installed, gzip otherwise
+RESPONSE_COMPRESSION = {
+    'ENABLED': bool(int(os.environ.get("RESPONSE_COMPRESSION", 1))),
+    'MIN_SIZE': int(os.environ.get("RESPONSE_COMPRESSION_MIN_SIZE", 1024)),
+    'GZIP_LEVEL': int(os.environ.get("RESPONSE_GZIP_LEVEL", 6)),
+    'BROTLI_QUALITY': int(os.environ.get("RESPONSE_BROTLI_QUALITY", 4)),
+}
+
+# Token buckets of the sign-up and login endpoints, see online_clinics.throttling
+THROTTLING = {
+    'ENABLED': bool(int(os.environ.get("THROTTLING", 1))),
+    # Empty keeps buckets in process memory
+    'CACHE': os.environ.get("THROTTLING_CACHE", 'default') or None,
+    'RATES': {
+        'ip': os.environ.get("THROTTLE_IP_RATE", '30/m'),
+        'email': os.environ.get("THROTTLE_EMAIL_RATE", '10/m'),
+        # Shared by every client of an endpoint, empty turns it off
+        'endpoint': os.environ.get("THROTTLE_ENDPOINT_RATE") or None,
+    },
+}
+
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", 'django.core.mail.backends.console.EmailBackend')
+DEFAULT_FROM_EMAIL = os.environ.get("DEFAULT_FROM_EMAIL", 'Doctor Online <no-reply@doctor-online.local>')
+
+# Seconds a refresh token's blacklist state is cached
+JWT_BLACKLIST_CACHE_TTL = int(os.environ.get("JWT_BLACKLIST_CACHE_TTL", 60))
\ No newline at end of file
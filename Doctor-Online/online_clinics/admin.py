@@ -6,11 +6,20 @@ from .models import *
 class ReservationInline(admin.StackedInline):
     model = Reservation
     extra = 0
+    raw_id_fields = ('clinic', 'patient')
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('clinic__doctor', 'patient').only(
+            'id', 'time', 'description', 'clinic', 'patient',
+            'clinic__date', 'clinic__doctor', 'clinic__doctor__name', 'patient__name',
+        )
 
 
 @admin.register(Clinic)
 class ClinicAdmin(admin.ModelAdmin):
     inlines = [ReservationInline, ]
+    list_select_related = ('doctor', )
+    raw_id_fields = ('doctor', )
 
 
 @admin.register(Patient)
@@ -20,4 +29,17 @@ class PatientAdmin(admin.ModelAdmin):
 
 @admin.register(Reservation)
 class ReservationAdmin(admin.ModelAdmin):
-    pass
+    list_select_related = ('clinic__doctor', 'patient')
+    raw_id_fields = ('clinic', 'patient')
+
+
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(admin.ModelAdmin):
+    list_select_related = ('clinic__doctor', 'patient')
+    raw_id_fields = ('clinic', 'patient')
+
+
+@admin.register(ClinicSchedule)
+class ClinicScheduleAdmin(admin.ModelAdmin):
+    list_select_related = ('doctor', )
+    raw_id_fields = ('doctor', )
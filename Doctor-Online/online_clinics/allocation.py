@@ -0,0 +1,127 @@
+from collections import defaultdict, deque
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .db import bulk_insert, retry_on_contention
+from .models import ClinicSlot, Reservation
+from .slots import clinic_slots, clinics_slots
+from .stats import touch_clinic
+
+# Attempts made before giving up on a heavily contended clinic
+MAX_ALLOCATION_RETRIES = 3
+
+
+def generate_slots(clinic):
+    '''
+        (Re)build the slot table of a clinic.
+
+        Free slots are replaced by the current grid, booked slots are kept
+        even if they fall outside of it after an edit.
+    '''
+    with transaction.atomic():
+        ClinicSlot.objects.filter(clinic=clinic, is_booked=False).delete()
+        ClinicSlot.objects.bulk_create(
+            [ClinicSlot(clinic=clinic, time=time) for time in clinic_slots(clinic)],
+            ignore_conflicts=True,
+        )
+        touch_clinic(clinic.id)
+
+
+# Slots of freshly created clinics, written with a single bulk_create
+def generate_slots_bulk(clinics):
+    ClinicSlot.objects.bulk_create([
+        ClinicSlot(clinic_id=clinic_id, time=time)
+        for clinic_id, times in clinics_slots(clinics).items() for time in times
+    ])
+
+
+# Mark the first free slot of a clinic as booked and return its time
+def claim_slot(clinic_id, now):
+    table = connection.ops.quote_name(ClinicSlot._meta.db_table)
+    skip_locked = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET is_booked = %s '
+            f'WHERE is_booked = %s AND id = ('
+            f'SELECT id FROM {table} WHERE clinic_id = %s AND is_booked = %s AND time >= %s '
+            f'ORDER BY time LIMIT 1{skip_locked}) '
+            f'RETURNING time',
+            [True, False, clinic_id, False, now],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        return None
+    time = parse_datetime(row[0]) if isinstance(row[0], str) else row[0]
+    if timezone.is_naive(time):
+        time = timezone.make_aware(time, timezone.utc)
+    return time
+
+
+# Return a slot to the pool once its reservation is gone
+def release_slot(clinic_id, time):
+    ClinicSlot.objects.filter(clinic=clinic_id, time=time).update(is_booked=False)
+
+
+@retry_on_contention
+def allocate_reservation(clinic_id, patient_id, description=None):
+    '''
+        Book the next free slot of a clinic.
+
+        The slot is claimed with a single UPDATE ... RETURNING on the
+        precomputed slot table, and the unique (clinic, time) constraint on
+        reservations catches anything that slips through. Only a clash on
+        that constraint is retried, other integrity errors propagate.
+    '''
+    for attempt in range(MAX_ALLOCATION_RETRIES):
+        time = None
+        try:
+            with transaction.atomic():
+                time = claim_slot(clinic_id, timezone.now())
+                if time is None:
+                    raise ValidationError('No free slots left in this clinic.')
+                return Reservation.objects.create(
+                    clinic_id=clinic_id,
+                    patient_id=patient_id,
+                    description=description,
+                    time=time,
+                )
+        except IntegrityError:
+            if time is None or not Reservation.objects.filter(clinic_id=clinic_id, time=time).exists():
+                raise
+    raise ValidationError('Clinic is busy, try again.')
+
+
+def allocate_reservations(requests):
+    '''
+        Book many reservations in one pass.
+
+        ``requests`` are (clinic_id, patient_id, description) tuples. The
+        free slots of every clinic involved are read with one query, claimed
+        with one UPDATE and the reservations are written with a single
+        bulk_create. Returns a Reservation, or None when the clinic is full,
+        for each request.
+    '''
+    with transaction.atomic():
+        slots = ClinicSlot.objects.filter(
+            clinic__in={clinic_id for clinic_id, _, _ in requests}, is_booked=False, time__gte=timezone.now(),
+        ).order_by('clinic', 'time')
+        if connection.features.has_select_for_update_skip_locked:
+            slots = slots.select_for_update(skip_locked=True)
+        free = defaultdict(deque)
+        for slot_id, clinic_id, time in slots.values_list('id', 'clinic_id', 'time'):
+            free[clinic_id].append((slot_id, time))
+
+        claimed, results = [], []
+        for clinic_id, patient_id, description in requests:
+            if not free[clinic_id]:
+                results.append(None)
+                continue
+            slot_id, time = free[clinic_id].popleft()
+            claimed.append(slot_id)
+            results.append(Reservation(clinic_id=clinic_id, patient_id=patient_id, description=description, time=time))
+
+        ClinicSlot.objects.filter(id__in=claimed).update(is_booked=True)
+        bulk_insert(Reservation, [reservation for reservation in results if reservation is not None])
+    return results
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OnlineClinicsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'online_clinics'
+
+    def ready(self):
+        from . import signals  # noqa: F401
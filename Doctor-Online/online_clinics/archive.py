@@ -0,0 +1,69 @@
+from datetime import timedelta
+from time import sleep
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedReservation, Reservation
+
+# Reservations older than AFTER_DAYS are moved BATCH_SIZE rows per
+# transaction, sleeping PAUSE seconds in between to let other writers in
+DEFAULTS = {
+    'AFTER_DAYS': 365,
+    'BATCH_SIZE': 1000,
+    'PAUSE': 0.0,
+}
+
+COLUMNS = 'id, clinic_id, patient_id, time, description, created_at'
+
+
+def archive_setting(name):
+    return getattr(settings, 'ARCHIVE', {}).get(name, DEFAULTS[name])
+
+
+def archive_batch(before, batch_size):
+    '''
+        Move up to ``batch_size`` reservations booked for a time before ``before``
+        into the archive and return how many were moved.
+
+        Rows are picked in id order, so a batch stops at its last id instead
+        of sorting every old row. Copy and delete are plain SQL in one
+        transaction: archiving is not a cancellation, slots, stats and
+        notification jobs must not see it.
+    '''
+    live = connection.ops.quote_name(Reservation._meta.db_table)
+    archive = connection.ops.quote_name(ArchivedReservation._meta.db_table)
+    with transaction.atomic():
+        ids = list(Reservation.objects.filter(time__lt=before).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return 0
+        params = [connection.ops.adapt_datetimefield_value(before), ids[-1]]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {archive} ({COLUMNS}, archived_at) '
+                f'SELECT {COLUMNS}, %s FROM {live} WHERE time < %s AND id <= %s',
+                [connection.ops.adapt_datetimefield_value(timezone.now()), *params],
+            )
+            cursor.execute(f'DELETE FROM {live} WHERE time < %s AND id <= %s', params)
+            return cursor.rowcount
+
+
+def archive_reservations(days=None, batch_size=None, pause=None, limit=None):
+    '''
+        Archive reservations older than ``days`` batch by batch, until none
+        are left or ``limit`` rows were moved. Yields the size of each batch.
+    '''
+    days = archive_setting('AFTER_DAYS') if days is None else days
+    batch_size = batch_size or archive_setting('BATCH_SIZE')
+    pause = archive_setting('PAUSE') if pause is None else pause
+    before = timezone.now() - timedelta(days=days)
+    moved = 0
+    while limit is None or moved < limit:
+        count = archive_batch(before, batch_size if limit is None else min(batch_size, limit - moved))
+        if not count:
+            break
+        moved += count
+        yield count
+        if pause:
+            sleep(pause)
@@ -0,0 +1,43 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+from .views import ClinicView, ListClinic, PatientView
+
+# Bounded pool the read views run on, each worker holds one DB connection
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'ASYNC_VIEW_WORKERS', 16), thread_name_prefix='async-view',
+)
+
+
+def async_view(view):
+    '''
+        Serve a sync DRF view from the event loop.
+
+        Under ASGI Django runs every sync view on one shared thread, so
+        requests queue behind each other. Here the view runs and renders on
+        the worker pool while the event loop keeps serving other clients,
+        and the worker's DB connection is released once it is done.
+    '''
+    def run(request, *args, **kwargs):
+        try:
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+            return response
+        finally:
+            close_old_connections()
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(run, thread_sensitive=False, executor=executor)(request, *args, **kwargs)
+
+    return wrapper
+
+
+list_clinics = async_view(ListClinic.as_view())
+clinic_reservations = async_view(ClinicView.as_view(http_method_names=['get']))
+patient_reservations = async_view(PatientView.as_view(http_method_names=['get']))
@@ -0,0 +1,100 @@
+from collections import defaultdict
+from hashlib import md5
+
+from django.db.models import F
+
+from .models import ClinicDayStats, ClinicSlot
+from .schedules import active_schedules, expand
+from .slots import clinic_slots
+
+# Longest date range served by one availability request
+MAX_AVAILABILITY_DAYS = 31
+
+
+def clinic_filters(prefix, date_from, date_to, doctor=None, clinic=None):
+    filters = {f'{prefix}date__range': (date_from, date_to), f'{prefix}is_active': True}
+    if doctor is not None:
+        filters[f'{prefix}doctor'] = doctor
+    if clinic is not None:
+        filters[f'{prefix}pk'] = clinic
+    return filters
+
+
+def clinic_days(**filters):
+    '''
+        Versions of the active clinic days matching the filters, with the
+        days of recurring schedules that have no clinic row yet.
+
+        This is all a conditional request needs, the slots themselves are
+        only read when the client's copy turned out to be stale.
+    '''
+    days = list(
+        ClinicDayStats.objects.filter(**clinic_filters('clinic__', **filters)).values(
+            'clinic', 'doctor', 'date', 'version', 'modified_at',
+            schedule=F('clinic__schedule'), slot_minutes=F('clinic__slot_minutes'),
+        )
+    )
+    days += schedule_days(**filters)
+    return sorted(days, key=lambda day: (day['date'], day['clinic'] is None, day['clinic'] or day['schedule']))
+
+
+def schedule_days(date_from, date_to, doctor=None, clinic=None):
+    '''
+        Days of active schedules in the range that were never booked. They
+        carry the unsaved clinic they would become, with no version of
+        their own: their ETag follows the schedule.
+    '''
+    if clinic is not None:
+        return []
+    return [
+        {
+            'clinic': None, 'schedule': occurrence.schedule.pk, 'doctor': occurrence.doctor_id,
+            'date': occurrence.date, 'version': 0, 'modified_at': occurrence.schedule.modified_at,
+            'slot_minutes': occurrence.slot_minutes, 'occurrence': occurrence,
+        }
+        for occurrence in expand(active_schedules(date_from, date_to, doctor), date_from, date_to)
+    ]
+
+
+def day_etag(day):
+    key = f"{day['clinic']}:{day['schedule']}:{day['date']}:{day['version']}:{day['modified_at'].isoformat()}"
+    return f'"{md5(key.encode()).hexdigest()}"'
+
+
+# One ETag for a whole response, it changes with any of its days or the filters
+def days_etag(days, filters):
+    digest = md5(repr(sorted(filters.items())).encode())
+    for day in days:
+        digest.update(day_etag(day).encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def last_modified(days):
+    return max((day['modified_at'] for day in days), default=None)
+
+
+def day_key(day):
+    return day['clinic'] if day['clinic'] is not None else (day['schedule'], day['date'])
+
+
+def availability(days, **filters):
+    '''
+        Free and booked slot times of the given clinic days, read with a
+        single query over the slot table. Unbooked schedule days are all
+        free, their slots are computed.
+    '''
+    slots = defaultdict(lambda: ([], []))
+    rows = ClinicSlot.objects.filter(**clinic_filters('clinic__', **filters)).order_by('clinic', 'time')
+    for clinic_id, time, is_booked in rows.values_list('clinic', 'time', 'is_booked'):
+        slots[clinic_id][is_booked].append(time)
+    for day in days:
+        if day['clinic'] is None:
+            slots[day['schedule'], day['date']] = (clinic_slots(day['occurrence']), [])
+    return [
+        {
+            'clinic': day['clinic'], 'schedule': day['schedule'], 'doctor': day['doctor'], 'date': day['date'],
+            'slot_minutes': day['slot_minutes'], 'etag': day_etag(day), 'last_modified': day['modified_at'],
+            'free': slots[day_key(day)][False], 'booked': slots[day_key(day)][True],
+        }
+        for day in days
+    ]
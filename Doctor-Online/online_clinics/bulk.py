@@ -0,0 +1,108 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .allocation import allocate_reservations, generate_slots_bulk
+from .cache import invalidate_directory
+from .conditional import bump_reservations
+from .db import bulk_insert, retry_on_contention
+from .jobs import enqueue_many
+from .models import Clinic, Doctor, Patient
+from .search import index_documents
+from .serializers import BulkClinicSerializer, BulkReservationSerializer
+from .stats import record_bookings, sync_clinics_bulk
+from .tasks import booking_jobs
+
+# Largest batch accepted by one request
+MAX_BATCH_SIZE = 1000
+
+
+# Validate every item on its own, returns serializers and per-item errors
+def validate_items(items, serializer_class):
+    serializers = [serializer_class(data=item) for item in items]
+    errors = {index: serializer.errors for index, serializer in enumerate(serializers) if not serializer.is_valid()}
+    return serializers, errors
+
+
+# Flag items that reference rows missing from ``existing``
+def check_references(serializers, errors, field, existing, message):
+    for index, serializer in enumerate(serializers):
+        if index not in errors and serializer.validated_data[field] not in existing:
+            errors[index] = {field: [message]}
+
+
+def create_clinics(items):
+    '''
+        Create a batch of clinics with their slots.
+
+        Returns the created clinics and a dict of errors keyed by item index,
+        invalid items are skipped and do not fail the rest of the batch.
+    '''
+    serializers, errors = validate_items(items, BulkClinicSerializer)
+    doctor_ids = {
+        serializer.validated_data['doctor'] for index, serializer in enumerate(serializers) if index not in errors
+    }
+    doctors = dict(Doctor.objects.filter(pk__in=doctor_ids).values_list('pk', 'name'))
+    check_references(serializers, errors, 'doctor', doctors, 'Doctor does not exist.')
+
+    clinics = []
+    for index, serializer in enumerate(serializers):
+        if index not in errors:
+            data = dict(serializer.validated_data)
+            clinics.append(Clinic(doctor_id=data.pop('doctor'), **data))
+    if not clinics:
+        return clinics, errors
+
+    with transaction.atomic():
+        bulk_insert(Clinic, clinics)
+        generate_slots_bulk(clinics)
+        sync_clinics_bulk(clinics)
+        index_documents([(clinic.pk, clinic.description, doctors[clinic.doctor_id]) for clinic in clinics])
+        invalidate_directory()
+    return clinics, errors
+
+
+def create_reservations(items):
+    '''
+        Book a batch of reservations, slots are allocated in one pass.
+
+        Returns the created reservations and a dict of errors keyed by item
+        index, invalid items and full clinics do not fail the rest of the batch.
+    '''
+    serializers, errors = validate_items(items, BulkReservationSerializer)
+    valid = [serializer.validated_data for index, serializer in enumerate(serializers) if index not in errors]
+    clinic_ids = set(Clinic.objects.filter(
+        pk__in={data['clinic'] for data in valid}, deleted_at=None,
+    ).values_list('pk', flat=True))
+    patient_ids = set(Patient.objects.filter(
+        pk__in={data['patient'] for data in valid}, deleted_at=None,
+    ).values_list('pk', flat=True))
+    check_references(serializers, errors, 'clinic', clinic_ids, 'Clinic does not exist.')
+    check_references(serializers, errors, 'patient', patient_ids, 'Patient does not exist.')
+
+    indexes = [index for index in range(len(serializers)) if index not in errors]
+    results = book_reservations([
+        (serializers[index].validated_data['clinic'], serializers[index].validated_data['patient'],
+         serializers[index].validated_data.get('description'))
+        for index in indexes
+    ]) if indexes else []
+    reservations = []
+    for index, reservation in zip(indexes, results):
+        if reservation is None:
+            errors[index] = {'clinic': ['No free slots left in this clinic.']}
+        else:
+            reservations.append(reservation)
+    return reservations, errors
+
+
+@retry_on_contention
+def book_reservations(requests):
+    with transaction.atomic():
+        results = allocate_reservations(requests)
+        booked = [reservation for reservation in results if reservation]
+        # bulk_create sends no signals, count the bookings per clinic here
+        for clinic_id, count in Counter(reservation.clinic_id for reservation in booked).items():
+            record_bookings(clinic_id, count)
+        enqueue_many(booking_jobs(booked))
+        bump_reservations(booked)
+    return results
@@ -0,0 +1,71 @@
+from hashlib import md5
+
+from django.core.cache import cache
+from django.db import transaction
+
+# Directory pages only change through Clinic/Doctor signals, the timeout
+# merely bounds how long an orphaned entry can live
+DIRECTORY_TIMEOUT = 60 * 60
+
+VERSION_KEY = 'clinic-directory:version'
+HITS_KEY = 'clinic-directory:hits'
+MISSES_KEY = 'clinic-directory:misses'
+
+
+# Increment a counter that may not exist yet
+def _incr(key, delta=1):
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        cache.set(key, delta, None)
+        return delta
+
+
+def _record(hit):
+    _incr(HITS_KEY if hit else MISSES_KEY)
+
+
+def directory_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def page_key(request):
+    digest = md5(request.build_absolute_uri().encode()).hexdigest()
+    return f'clinic-directory:page:{directory_version()}:{digest}'
+
+
+def get_page(request):
+    data = cache.get(page_key(request))
+    _record(data is not None)
+    return data
+
+
+def set_page(request, data):
+    cache.set(page_key(request), data, DIRECTORY_TIMEOUT)
+
+
+def invalidate_directory():
+    '''
+        Drop every cached page, old versions simply expire. The version is
+        bumped again on commit, so a page read before the write committed
+        cannot stay cached under the version that follows it.
+    '''
+    _incr(VERSION_KEY)
+    transaction.on_commit(lambda: _incr(VERSION_KEY))
+
+
+def directory_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': hits / total if total else 0.0,
+        'version': directory_version(),
+    }
@@ -0,0 +1,78 @@
+import gzip
+import zlib
+
+from django.conf import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Bodies under MIN_SIZE bytes are sent as they are, compressing them saves
+# less than the headers it adds. Brotli is preferred when installed and
+# accepted, QUALITY 4 compresses JSON about as fast as gzip level 6.
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_SIZE': 1024,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 4,
+    'CONTENT_TYPES': ['application/json', 'application/x-ndjson', 'text/'],
+}
+
+
+def compression_setting(name):
+    return getattr(settings, 'RESPONSE_COMPRESSION', {}).get(name, DEFAULTS[name])
+
+
+def compressible(content_type):
+    return any(content_type.startswith(prefix) for prefix in compression_setting('CONTENT_TYPES'))
+
+
+# Quality values of an Accept-Encoding header, keyed by coding
+def accepted_codings(header):
+    codings = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding:
+            codings[coding.strip().lower()] = quality
+    return codings
+
+
+def choose_coding(header):
+    codings = accepted_codings(header)
+    for coding in (['br'] if brotli else []) + ['gzip']:
+        if codings.get(coding, codings.get('*', 0)) > 0:
+            return coding
+    return None
+
+
+def compress(body, coding):
+    if coding == 'br':
+        return brotli.compress(body, quality=compression_setting('BROTLI_QUALITY'))
+    return gzip.compress(body, compresslevel=compression_setting('GZIP_LEVEL'), mtime=0)
+
+
+def compress_stream(chunks, coding):
+    '''
+        Compress a streamed body. Output is buffered by the compressor
+        rather than flushed per chunk, so small lines still compress well.
+    '''
+    if coding == 'br':
+        compressor = brotli.Compressor(quality=compression_setting('BROTLI_QUALITY'))
+        write, finish = compressor.process, compressor.finish
+    else:
+        # wbits 31 writes a gzip header and trailer around the deflate stream
+        compressor = zlib.compressobj(compression_setting('GZIP_LEVEL'), zlib.DEFLATED, 31)
+        write, finish = compressor.compress, compressor.flush
+    for chunk in chunks:
+        data = write(chunk.encode() if isinstance(chunk, str) else chunk)
+        if data:
+            yield data
+    yield finish()
@@ -0,0 +1,85 @@
+from hashlib import md5
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+# Versions are random tokens, a lost or expired one is simply replaced and
+# only costs clients one full download
+VERSION_TIMEOUT = 24 * 60 * 60
+
+RESERVATIONS_KEY = 'reservations:version:{}:{}'
+PATIENTS_KEY = 'reservations:version:patients'
+
+
+def version(key):
+    value = cache.get(key)
+    if value is None:
+        cache.add(key, uuid4().hex, VERSION_TIMEOUT)
+        value = cache.get(key)
+    return value
+
+
+def reservations_version(owner, pk):
+    return version(RESERVATIONS_KEY.format(owner, pk))
+
+
+def patients_version():
+    return version(PATIENTS_KEY)
+
+
+def forget(keys):
+    '''
+        Drop versions now and again on commit, so a read racing the write
+        transaction cannot store a new version next to the old rows.
+    '''
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def bump_reservations(reservations):
+    keys = set()
+    for reservation in reservations:
+        keys.add(RESERVATIONS_KEY.format('clinic', reservation.clinic_id))
+        keys.add(RESERVATIONS_KEY.format('patient', reservation.patient_id))
+    if keys:
+        forget(list(keys))
+
+
+# Patient details are embedded in every clinic's reservation list
+def bump_patients():
+    forget([PATIENTS_KEY])
+
+
+def weak_etag(request, *versions):
+    '''
+        ETag of a GET derived from the versions of what it shows, so it is
+        known before any row is read. The URL and negotiated media type keep
+        pages and representations apart.
+    '''
+    parts = [*map(str, versions), request.accepted_media_type, request.get_full_path()]
+    return 'W/"{}"'.format(md5('|'.join(parts).encode()).hexdigest())
+
+
+# Lists relative to now change as time passes, a minute late at most
+def clock_version(params):
+    return timezone.now().strftime('%Y%m%d%H%M') if params.get('ordering') in ('past', 'upcoming') else ''
+
+
+def private(response, etag=None):
+    '''
+        Let the client, but no shared cache, keep the response and have it
+        revalidate before every use.
+    '''
+    if etag:
+        response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    patch_vary_headers(response, ('Accept', 'Authorization'))
+    return response
+
+
+def not_modified(request, etag):
+    response = get_conditional_response(request, etag=etag)
+    return private(response, etag) if response is not None else None
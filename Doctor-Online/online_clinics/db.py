@@ -0,0 +1,76 @@
+import random
+from functools import wraps
+from time import sleep
+
+from django.conf import settings
+from django.db import OperationalError, connection
+
+# SQLITE_* apply to every new SQLite connection. WRITE_RETRIES is how many
+# times a write transaction is re-run after losing a lock, sleeping about
+# RETRY_BACKOFF * 2 ** attempt seconds in between. REPLICAS are the aliases
+# read-only views may read from, REPLICA_PIN_SECONDS the replication lag a
+# client writing is shielded from.
+DEFAULTS = {
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'HEALTH_CHECKS': False,
+    'WRITE_RETRIES': 5,
+    'RETRY_BACKOFF': 0.02,
+    'REPLICAS': [],
+    'REPLICA_PIN_SECONDS': 5,
+}
+
+# Postgres serialization failure and deadlock
+RETRYABLE_PGCODES = {'40001', '40P01'}
+
+
+def database_setting(name):
+    return getattr(settings, 'DATABASE_TUNING', {}).get(name, DEFAULTS[name])
+
+
+def is_contention(error):
+    message = str(error).lower()
+    return (
+        'database is locked' in message or 'database table is locked' in message
+        or getattr(error.__cause__, 'pgcode', None) in RETRYABLE_PGCODES
+    )
+
+
+def retry_on_contention(func):
+    '''
+        Re-run a write transaction that lost a lock.
+
+        SQLite reports a busy database once busy_timeout runs out, Postgres
+        reports serialization failures and deadlocks. Either way the
+        transaction was rolled back and can simply be run again. Calls
+        nested in an outer transaction are not retried, the outer block
+        has to be rolled back first.
+    '''
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        retries = database_setting('WRITE_RETRIES')
+        for attempt in range(retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as error:
+                if attempt == retries or connection.in_atomic_block or not is_contention(error):
+                    raise
+            sleep(database_setting('RETRY_BACKOFF') * 2 ** attempt * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+def bulk_insert(model, objects, batch_size=None):
+    '''
+        bulk_create that always leaves primary keys set on ``objects``.
+
+        Django cannot return ids from SQLite bulk inserts, but inside the
+        caller's transaction the write lock keeps the new ids consecutive,
+        so they are read back in insertion order.
+    '''
+    model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is None:
+        ids = model.objects.order_by('-pk').values_list('pk', flat=True)[:len(objects)]
+        for obj, pk in zip(objects, reversed(ids)):
+            obj.pk = pk
+    return objects
@@ -0,0 +1,74 @@
+import csv
+from datetime import datetime, time, timedelta
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+
+from .models import ReservationHistory
+
+COLUMNS = ('id', 'clinic', 'doctor', 'patient', 'patient_name', 'patient_email', 'time', 'created_at', 'description')
+FIELDS = (
+    'id', 'clinic_id', 'clinic__doctor__name', 'patient_id', 'patient__name', 'patient__email',
+    'time', 'created_at', 'description',
+)
+
+# Rows fetched per round trip, server-side cursors are used where supported
+CHUNK_SIZE = 2000
+
+
+# Midnight starting a local date, as an aware datetime
+def day_start(date):
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+# Dates are bounded on the bare time column, a date cast would keep the
+# (clinic, time) and (patient, time) indexes out of the plan
+def reservation_queryset(clinic=None, patient=None, date_from=None, date_to=None, **kwargs):
+    queryset = ReservationHistory.objects.order_by('id')
+    if clinic is not None:
+        queryset = queryset.filter(clinic=clinic)
+    if patient is not None:
+        queryset = queryset.filter(patient=patient)
+    if date_from is not None:
+        queryset = queryset.filter(time__gte=day_start(date_from))
+    if date_to is not None:
+        queryset = queryset.filter(time__lt=day_start(date_to + timedelta(days=1)))
+    return queryset
+
+
+def reservation_rows(**filters):
+    return reservation_queryset(**filters).values_list(*FIELDS).iterator(chunk_size=CHUNK_SIZE)
+
+
+class Echo:
+    '''
+        File-like object handing each written line straight back to csv.writer
+    '''
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def ndjson_lines(rows):
+    encoder = DjangoJSONEncoder()
+    for row in rows:
+        yield encoder.encode(dict(zip(COLUMNS, row))) + '\n'
+
+
+FORMATS = {
+    'csv': (csv_lines, 'text/csv'),
+    'ndjson': (ndjson_lines, 'application/x-ndjson'),
+}
+
+
+# Lines and content type of an export in the given format
+def export_lines(output='csv', **filters):
+    render, content_type = FORMATS[output]
+    return render(reservation_rows(**filters)), content_type
@@ -0,0 +1,117 @@
+import random
+from datetime import time, timedelta
+from uuid import uuid4
+
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .allocation import generate_slots_bulk
+from .cache import invalidate_directory
+from .db import bulk_insert
+from .hashing import hash_password
+from .models import BaseUser, Clinic, ClinicSlot, Doctor, Patient, Reservation
+from .search import index_documents
+from .slots import clinic_bounds, clinics_slots
+from .stats import rebuild_stats
+
+SPECIALITIES = ['Cardiology', 'Dermatology', 'Pediatrics', 'Neurology', 'Dentistry', 'Orthopedics', 'Ophthalmology']
+NAMES = ['Ahmed', 'Mona', 'Sara', 'Omar', 'Youssef', 'Nour', 'Hassan', 'Laila', 'Karim', 'Salma']
+BATCH_SIZE = 2000
+
+
+def seed_users(model, count, encoded_password, prefix):
+    '''
+        Insert ``count`` doctors or patients without going through save().
+
+        Multi-table inheritance rules out bulk_create on the child model, so
+        the BaseUser rows are bulk inserted and the child rows are written
+        with a single executemany.
+    '''
+    role = model.__name__.lower()
+    users = bulk_insert(BaseUser, [
+        BaseUser(
+            email=f'{prefix}-{role}-{i}@example.com', password=encoded_password,
+            name=f'{random.choice(NAMES)} {role} {i}', phone='+123456789',
+        )
+        for i in range(count)
+    ], batch_size=BATCH_SIZE)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {model._meta.db_table} (baseuser_ptr_id) VALUES (%s)', [(user.pk,) for user in users],
+        )
+    return users
+
+
+def seed_clinics(doctors, count, days):
+    today = timezone.now().date()
+    clinics = bulk_insert(Clinic, [
+        Clinic(
+            doctor_id=random.choice(doctors).pk, price=random.choice([150, 200, 250, 300, 500]),
+            date=today + timedelta(days=random.randint(1, days)), start_time=time(8, 0), end_time=time(20, 0),
+            description=f'{random.choice(SPECIALITIES)} clinic', is_active=random.random() < 0.9,
+        )
+        for _ in range(count)
+    ], batch_size=BATCH_SIZE)
+    generate_slots_bulk(clinics)
+    names = {doctor.pk: doctor.name for doctor in doctors}
+    index_documents([(clinic.pk, clinic.description, names[clinic.doctor_id]) for clinic in clinics])
+    return clinics
+
+
+def seed_reservations(clinics, patients, count):
+    free = {clinic_id: list(times) for clinic_id, times in clinics_slots(clinics).items()}
+    reservations = []
+    while len(reservations) < count and free:
+        clinic_id = random.choice(list(free))
+        reservations.append(Reservation(
+            clinic_id=clinic_id, patient_id=random.choice(patients).pk, time=free[clinic_id].pop(0),
+            description='Seeded reservation',
+        ))
+        if not free[clinic_id]:
+            del free[clinic_id]
+    Reservation.objects.bulk_create(reservations, batch_size=BATCH_SIZE)
+    ClinicSlot.objects.filter(clinic__in=[clinic.pk for clinic in clinics]).filter(
+        Exists(Reservation.objects.filter(clinic=OuterRef('clinic'), time=OuterRef('time'))),
+    ).update(is_booked=True)
+    return reservations
+
+
+def seed_histories(count, prefix):
+    '''
+        One patient booked into ``count - 1`` clinics and one clinic booked
+        by ``count - 1`` patients, for measuring pages of a whole history.
+    '''
+    doctors = seed_users(Doctor, 10, 'unusable', prefix)
+    patients = seed_users(Patient, count, 'unusable', prefix)
+    clinics = seed_clinics(doctors, count, days=30)
+    patient, clinic = patients[0], clinics[0]
+    start = clinic_bounds(clinic)[0]
+    Reservation.objects.bulk_create([
+        Reservation(clinic=other, patient_id=patient.pk, time=clinic_bounds(other)[0], description='Checkup')
+        for other in clinics[1:]
+    ] + [
+        Reservation(clinic=clinic, patient_id=other.pk, time=start + timedelta(minutes=index))
+        for index, other in enumerate(patients[1:])
+    ], batch_size=BATCH_SIZE)
+    return {'doctors': doctors, 'patient': patient, 'clinic': clinic}
+
+
+def seed(doctors=100, patients=1000, clinics=1000, reservations=10000, days=30, password='benchmark-pass'):
+    '''
+        Seed a realistic data set with bulk inserts.
+
+        Returns the seeded users, clinics and the email prefix they share.
+        Every derived table (slots, search index, stats, directory cache)
+        is brought up to date as well.
+    '''
+    prefix = f'seed-{uuid4().hex[:8]}'
+    encoded = hash_password(password)
+    with transaction.atomic():
+        seeded_doctors = seed_users(Doctor, doctors, encoded, prefix)
+        seeded_patients = seed_users(Patient, patients, encoded, prefix)
+        seeded_clinics = seed_clinics(seeded_doctors, clinics, days)
+        seed_reservations(seeded_clinics, seeded_patients, reservations)
+        rebuild_stats()
+    invalidate_directory()
+    return {'prefix': prefix, 'doctors': seeded_doctors, 'patients': seeded_patients, 'clinics': seeded_clinics}
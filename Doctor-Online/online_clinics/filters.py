@@ -0,0 +1,56 @@
+from rest_framework import filters, serializers
+from rest_framework.exceptions import ValidationError
+
+from .search import search_clinics
+
+
+class ClinicSearchFilter(filters.BaseFilterBackend):
+    '''
+        Filter clinics by full-text search, date range and price range.
+
+        ``search`` matches the description and the doctor's name through the
+        search index, ``date_from``/``date_to`` and ``price_min``/``price_max``
+        are inclusive bounds.
+    '''
+    range_params = {
+        'date_from': ('date__gte', serializers.DateField()),
+        'date_to': ('date__lte', serializers.DateField()),
+        'price_min': ('price__gte', serializers.DecimalField(max_digits=10, decimal_places=2)),
+        'price_max': ('price__lte', serializers.DecimalField(max_digits=10, decimal_places=2)),
+    }
+
+    def lookups(self, request):
+        params = request.query_params
+        lookups = {}
+        for param, (lookup, field) in self.range_params.items():
+            if params.get(param):
+                try:
+                    lookups[lookup] = field.to_internal_value(params[param])
+                except ValidationError as error:
+                    raise ValidationError({param: error.detail})
+        return lookups
+
+    def filter_queryset(self, request, queryset, view):
+        return search_clinics(queryset.filter(**self.lookups(request)), request.query_params.get('search'))
+
+
+class StatsFilter(filters.BaseFilterBackend):
+    '''
+        Filter precomputed stats rows by doctor, clinic and inclusive date range
+    '''
+    params = {
+        'doctor': ('doctor', serializers.IntegerField()),
+        'clinic': ('clinic', serializers.IntegerField()),
+        'date_from': ('date__gte', serializers.DateField()),
+        'date_to': ('date__lte', serializers.DateField()),
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        lookups = {}
+        for param, (lookup, field) in self.params.items():
+            if request.query_params.get(param):
+                try:
+                    lookups[lookup] = field.to_internal_value(request.query_params[param])
+                except ValidationError as error:
+                    raise ValidationError({param: error.detail})
+        return queryset.filter(**lookups)
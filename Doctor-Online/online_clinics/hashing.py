@@ -0,0 +1,143 @@
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, check_password, get_hasher, identify_hasher
+from rest_framework.exceptions import Throttled
+
+from .instrumentation import record_phase
+
+# hashlib releases the GIL while stretching, so threads hash in parallel.
+# ITERATIONS overrides the cost of PBKDF2 hashers, None keeps Django's.
+DEFAULTS = {
+    'WORKERS': 4,
+    'QUEUE': 16,
+    'HASHER': 'default',
+    'ITERATIONS': None,
+    'RETRY_AFTER': 1,
+}
+
+
+def hashing_setting(name):
+    return getattr(settings, 'PASSWORD_HASHING', {}).get(name, DEFAULTS[name])
+
+
+class HashingBusy(Throttled):
+    default_detail = 'Too many sign-ups and logins in progress, try again shortly.'
+
+
+class HashingService:
+    '''
+        Run password hashing on a bounded worker pool.
+
+        At most WORKERS hashes run at once and QUEUE more may wait for a
+        worker; anything beyond that is refused with HashingBusy (429) so a
+        burst of sign-ups cannot starve the request threads.
+    '''
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(max_workers=hashing_setting('WORKERS'), thread_name_prefix='hashing')
+        self.slots = threading.BoundedSemaphore(hashing_setting('WORKERS') + hashing_setting('QUEUE'))
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=1000))
+        self.counts = defaultdict(int)
+
+    def run(self, operation, func, *args):
+        if not self.slots.acquire(blocking=False):
+            self.record('rejected', None)
+            raise HashingBusy(wait=hashing_setting('RETRY_AFTER'))
+        try:
+            started = perf_counter()
+            result = self.executor.submit(func, *args).result()
+            self.record(operation, perf_counter() - started)
+            record_phase('hash', perf_counter() - started)
+            return result
+        finally:
+            self.slots.release()
+
+    def record(self, operation, seconds):
+        with self.lock:
+            self.counts[operation] += 1
+            if seconds is not None:
+                self.samples[operation].append(seconds * 1000)
+
+    def stats(self):
+        with self.lock:
+            result = {}
+            for operation, count in self.counts.items():
+                samples = sorted(self.samples[operation])
+                result[operation] = {'count': count}
+                if samples:
+                    result[operation].update({
+                        'p50_ms': samples[len(samples) // 2],
+                        'p99_ms': samples[min(len(samples) - 1, len(samples) * 99 // 100)],
+                        'max_ms': samples[-1],
+                    })
+            return result
+
+
+service = HashingService()
+
+
+# ITERATIONS of a PBKDF2 hasher, other hashers take no iteration count
+def _iterations(hasher):
+    return hashing_setting('ITERATIONS') if isinstance(hasher, PBKDF2PasswordHasher) else None
+
+
+def _encode(password):
+    hasher = get_hasher(hashing_setting('HASHER'))
+    iterations = _iterations(hasher)
+    if iterations:
+        return hasher.encode(password, hasher.salt(), iterations=iterations)
+    return hasher.encode(password, hasher.salt())
+
+
+# Whether a stored hash uses another hasher or cost than configured
+def needs_rehash(encoded):
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return True
+    if hasher.algorithm != get_hasher(hashing_setting('HASHER')).algorithm:
+        return True
+    iterations = _iterations(hasher)
+    if iterations:
+        return hasher.decode(encoded).get('iterations') != iterations
+    return hasher.must_update(encoded)
+
+
+# Hash of no real password, one per configured hasher and cost
+@lru_cache(maxsize=8)
+def _dummy_hash(hasher, iterations):
+    return _encode('')
+
+
+def hash_password(password):
+    return service.run('hash', _encode, password)
+
+
+def verify_password(password, encoded, setter=None):
+    '''
+        Check a password against its stored hash.
+
+        On success an outdated hash is re-encoded with the configured
+        hasher and cost and handed to ``setter`` to be stored.
+    '''
+    valid = service.run('verify', check_password, password, encoded)
+    if valid and setter is not None and needs_rehash(encoded):
+        setter(hash_password(password))
+    return valid
+
+
+def reject_password(password):
+    '''
+        Spend one verification on a login without a user, so an unknown
+        email takes as long to refuse as a wrong password and timing does
+        not tell which emails have accounts. Always False.
+    '''
+    encoded = _dummy_hash(hashing_setting('HASHER'), hashing_setting('ITERATIONS'))
+    service.run('verify', check_password, password, encoded)
+    return False
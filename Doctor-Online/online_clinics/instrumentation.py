@@ -0,0 +1,267 @@
+import logging
+import os
+import threading
+import time as clock
+from collections import Counter, defaultdict
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+# WINDOW seconds per histogram window, WINDOWS of them are kept. Requests
+# are aggregated in-process and written to the cache every FLUSH_EVERY
+# requests, each worker process under its own key so that concurrent
+# flushes never overwrite each other. Reports merge the keys of all workers.
+DEFAULTS = {
+    'ENABLED': False,
+    'SERVER_TIMING': True,
+    'WINDOW': 60,
+    'WINDOWS': 60,
+    'FLUSH_EVERY': 20,
+    'DUPLICATE_THRESHOLD': 2,
+    'N_PLUS_ONE_THRESHOLD': 5,
+}
+
+# Upper bounds of the histogram buckets, the last bucket is open ended
+MS_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+QUERY_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100]
+FLAGGED_SQL = 5
+
+# Histograms of one worker in one window, and the number of workers that wrote to a window
+WINDOW_KEY = 'instrumentation:window:{}:{}'
+WORKERS_KEY = 'instrumentation:workers:{}'
+
+current = ContextVar('instrumentation_metrics', default=None)
+
+
+def instrumentation_setting(name):
+    return getattr(settings, 'INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+def bucket(bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+class RequestMetrics:
+    '''
+        Queries and phase timings of the request being served.
+    '''
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.queries = []
+        self.phases = defaultdict(float)
+
+    def add_query(self, sql, params, seconds):
+        self.queries.append((sql, repr(params), seconds))
+
+    @property
+    def db_ms(self):
+        return sum(seconds for _, _, seconds in self.queries) * 1000
+
+    # Identical statements with identical parameters
+    def duplicates(self):
+        threshold = instrumentation_setting('DUPLICATE_THRESHOLD')
+        counts = Counter((sql, params) for sql, params, _ in self.queries)
+        return [sql for (sql, _), count in counts.items() if count >= threshold]
+
+    # One statement repeated with varying parameters, the shape of an N+1
+    def n_plus_one(self):
+        threshold = instrumentation_setting('N_PLUS_ONE_THRESHOLD')
+        counts = Counter(sql for sql, _, _ in self.queries)
+        return [sql for sql, count in counts.items() if count >= threshold]
+
+
+# Execute wrapper installed on every connection, records into the current request
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, params, perf_counter() - started)
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Time spent outside of the view body, such as rendering or hashing
+def record_phase(name, seconds):
+    metrics = current.get()
+    if metrics is not None:
+        metrics.phases[name] += seconds * 1000
+
+
+def empty_stats():
+    return {
+        'count': 0, 'wall_ms': 0.0, 'db_ms': 0.0, 'queries': 0, 'phases': {},
+        'wall_histogram': [0] * (len(MS_BUCKETS) + 1),
+        'db_histogram': [0] * (len(MS_BUCKETS) + 1),
+        'query_histogram': [0] * (len(QUERY_BUCKETS) + 1),
+        'duplicates': 0, 'n_plus_one': 0, 'flagged_sql': [],
+    }
+
+
+def merge(target, stats):
+    for name in ('count', 'wall_ms', 'db_ms', 'queries', 'duplicates', 'n_plus_one'):
+        target[name] += stats[name]
+    for name in ('wall_histogram', 'db_histogram', 'query_histogram'):
+        target[name] = [a + b for a, b in zip(target[name], stats[name])]
+    for phase, ms in stats['phases'].items():
+        target['phases'][phase] = target['phases'].get(phase, 0) + ms
+    for sql in stats['flagged_sql']:
+        if sql not in target['flagged_sql'] and len(target['flagged_sql']) < FLAGGED_SQL:
+            target['flagged_sql'].append(sql)
+
+
+class Recorder:
+    '''
+        Rolling per-view histograms of wall time, DB time and query count.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = defaultdict(lambda: defaultdict(empty_stats))
+        self.pending_requests = 0
+        self.pid = None
+        self.slots = {}
+
+    def window(self, now=None):
+        size = instrumentation_setting('WINDOW')
+        return int((now or clock.time()) // size * size)
+
+    def windows(self):
+        size = instrumentation_setting('WINDOW')
+        newest = self.window()
+        return [newest - size * index for index in range(instrumentation_setting('WINDOWS'))]
+
+    def slot(self, window, timeout):
+        '''
+            Number of this worker among the workers that wrote to the window,
+            handed out by an atomic increment. A new one is taken after a
+            fork, or when the counter was evicted from the cache.
+        '''
+        if self.pid != os.getpid():
+            self.pid, self.slots = os.getpid(), {}
+        key = WORKERS_KEY.format(window)
+        slot = self.slots.get(window)
+        if slot is None or (cache.get(key) or 0) < slot:
+            cache.add(key, 0, timeout)
+            slot = self.slots[window] = cache.incr(key)
+            kept = set(self.windows())
+            self.slots = {start: number for start, number in self.slots.items() if start in kept}
+        return slot
+
+    def record(self, view, metrics, wall_ms):
+        duplicates, n_plus_one = metrics.duplicates(), metrics.n_plus_one()
+        for sql in n_plus_one:
+            logger.warning('Possible N+1 in %s: %s', view, sql)
+        with self.lock:
+            stats = self.pending[self.window()][view]
+            stats['count'] += 1
+            stats['wall_ms'] += wall_ms
+            stats['db_ms'] += metrics.db_ms
+            stats['queries'] += len(metrics.queries)
+            stats['wall_histogram'][bucket(MS_BUCKETS, wall_ms)] += 1
+            stats['db_histogram'][bucket(MS_BUCKETS, metrics.db_ms)] += 1
+            stats['query_histogram'][bucket(QUERY_BUCKETS, len(metrics.queries))] += 1
+            stats['duplicates'] += bool(duplicates)
+            stats['n_plus_one'] += bool(n_plus_one)
+            for phase, ms in metrics.phases.items():
+                stats['phases'][phase] = stats['phases'].get(phase, 0) + ms
+            for sql in n_plus_one + duplicates:
+                if sql not in stats['flagged_sql'] and len(stats['flagged_sql']) < FLAGGED_SQL:
+                    stats['flagged_sql'].append(sql)
+            self.pending_requests += 1
+            flush = self.pending_requests >= instrumentation_setting('FLUSH_EVERY')
+        if flush:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(lambda: defaultdict(empty_stats))
+            self.pending_requests = 0
+        timeout = instrumentation_setting('WINDOW') * instrumentation_setting('WINDOWS')
+        # Only this worker writes its keys, the lock covers its own threads
+        with self.flush_lock:
+            for window, views in pending.items():
+                key = WINDOW_KEY.format(window, self.slot(window, timeout))
+                stored = cache.get(key) or {}
+                for view, stats in views.items():
+                    merge(stored.setdefault(view, empty_stats()), stats)
+                cache.set(key, stored, timeout)
+
+    # Histogram keys of every worker that wrote to the windows
+    def stored_keys(self, windows):
+        workers = cache.get_many([WORKERS_KEY.format(window) for window in windows])
+        return [
+            WINDOW_KEY.format(window, slot)
+            for window in windows for slot in range(1, workers.get(WORKERS_KEY.format(window), 0) + 1)
+        ]
+
+    def report(self):
+        '''
+            Per-view totals over the kept windows, slowest views first.
+        '''
+        self.flush()
+        totals = defaultdict(empty_stats)
+        for views in cache.get_many(self.stored_keys(self.windows())).values():
+            for view, stats in views.items():
+                merge(totals[view], stats)
+        return [
+            summarize(view, stats)
+            for view, stats in sorted(totals.items(), key=lambda item: item[1]['wall_ms'], reverse=True)
+        ]
+
+    def reset(self):
+        with self.lock:
+            self.pending.clear()
+            self.pending_requests = 0
+        windows = self.windows()
+        cache.delete_many(self.stored_keys(windows) + [WORKERS_KEY.format(window) for window in windows])
+
+
+# Upper bound of the bucket holding the given fraction of requests
+def histogram_percentile(bounds, histogram, fraction):
+    target = sum(histogram) * fraction
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if count and seen >= target:
+            return bounds[index] if index < len(bounds) else None
+    return None
+
+
+def summarize(view, stats):
+    count = stats['count'] or 1
+    return {
+        'view': view,
+        'requests': stats['count'],
+        'total_ms': round(stats['wall_ms'], 1),
+        'mean_ms': round(stats['wall_ms'] / count, 2),
+        'p50_ms': histogram_percentile(MS_BUCKETS, stats['wall_histogram'], 0.50),
+        'p95_ms': histogram_percentile(MS_BUCKETS, stats['wall_histogram'], 0.95),
+        'p99_ms': histogram_percentile(MS_BUCKETS, stats['wall_histogram'], 0.99),
+        'mean_db_ms': round(stats['db_ms'] / count, 2),
+        'mean_queries': round(stats['queries'] / count, 2),
+        'phases_mean_ms': {phase: round(ms / count, 2) for phase, ms in stats['phases'].items()},
+        'duplicate_requests': stats['duplicates'],
+        'n_plus_one_requests': stats['n_plus_one'],
+        'flagged_sql': stats['flagged_sql'],
+        'wall_histogram': dict(zip([f'<={bound}' for bound in MS_BUCKETS] + ['inf'], stats['wall_histogram'])),
+        'query_histogram': dict(zip([f'<={bound}' for bound in QUERY_BUCKETS] + ['inf'], stats['query_histogram'])),
+    }
+
+
+recorder = Recorder()
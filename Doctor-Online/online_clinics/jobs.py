@@ -0,0 +1,175 @@
+import json
+import logging
+import random
+import threading
+from collections import defaultdict
+from datetime import timedelta
+from uuid import uuid4
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# BATCH_SIZE jobs are claimed per round trip. A failed job is retried after
+# RETRY_BACKOFF * 2 ** (attempts - 1) seconds, capped at MAX_BACKOFF.
+# Running jobs not finished after STALE_AFTER seconds are handed out again.
+# Purge jobs of deleted clinics and patients remove PURGE_BATCH_SIZE rows each.
+DEFAULTS = {
+    'BATCH_SIZE': 100,
+    'POLL_INTERVAL': 1.0,
+    'RETRY_BACKOFF': 10,
+    'MAX_BACKOFF': 60 * 60,
+    'STALE_AFTER': 5 * 60,
+    'REMINDER_HOURS': 24,
+    'PURGE_BATCH_SIZE': 500,
+}
+
+TASKS = {}
+
+
+def jobs_setting(name):
+    return getattr(settings, 'JOBS', {}).get(name, DEFAULTS[name])
+
+
+def task(name, batch=False):
+    '''
+        Register a job handler under ``name``.
+
+        Batch handlers are called once with the payloads of every claimed
+        job of their task, the others once per payload.
+    '''
+    def register(func):
+        TASKS[name] = (func, batch)
+        return func
+    return register
+
+
+def job(task_name, payload, run_at=None, queue='default'):
+    return Job(task=task_name, payload=payload, run_at=run_at or timezone.now(), queue=queue)
+
+
+def enqueue(task_name, payload, run_at=None, queue='default'):
+    created = job(task_name, payload, run_at, queue)
+    created.save()
+    return created
+
+
+def enqueue_many(jobs):
+    return Job.objects.bulk_create(jobs)
+
+
+def claim(worker, queue='default', limit=None):
+    '''
+        Mark up to ``limit`` due jobs as running and return them.
+
+        Claiming is one UPDATE ... RETURNING. The status check in the outer
+        WHERE keeps two workers from both taking a job on Postgres, where the
+        inner SELECT also skips rows another worker is locking.
+    '''
+    table = connection.ops.quote_name(Job._meta.db_table)
+    skip_locked = ' FOR UPDATE SKIP LOCKED' if connection.features.has_select_for_update_skip_locked else ''
+    now = timezone.now()
+    stamp = connection.ops.adapt_datetimefield_value(now)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'UPDATE {table} SET status = %s, locked_by = %s, locked_at = %s, attempts = attempts + 1 '
+            f'WHERE status = %s AND id IN ('
+            f'SELECT id FROM {table} WHERE status = %s AND queue = %s AND run_at <= %s '
+            f'ORDER BY run_at LIMIT %s{skip_locked}) '
+            f'RETURNING id, task, payload, attempts, max_attempts',
+            [Job.RUNNING, worker, stamp, Job.QUEUED, Job.QUEUED, queue, stamp, limit or jobs_setting('BATCH_SIZE')],
+        )
+        rows = cursor.fetchall()
+    return [
+        Job(id=pk, task=task_name, payload=json.loads(payload) if isinstance(payload, str) else payload,
+            attempts=attempts, max_attempts=max_attempts, status=Job.RUNNING, locked_by=worker, locked_at=now)
+        for pk, task_name, payload, attempts, max_attempts in rows
+    ]
+
+
+def backoff(attempts):
+    delay = min(jobs_setting('RETRY_BACKOFF') * 2 ** (attempts - 1), jobs_setting('MAX_BACKOFF'))
+    return timedelta(seconds=delay * random.uniform(0.75, 1.25))
+
+
+def fail(jobs, error):
+    now = timezone.now()
+    for failed in jobs:
+        if failed.attempts >= failed.max_attempts:
+            Job.objects.filter(pk=failed.pk).update(status=Job.FAILED, last_error=error, finished_at=now)
+        else:
+            Job.objects.filter(pk=failed.pk).update(
+                status=Job.QUEUED, last_error=error, run_at=now + backoff(failed.attempts), locked_by='',
+            )
+
+
+def execute(jobs):
+    '''
+        Run claimed jobs, grouped by task. Succeeded jobs are closed with
+        one UPDATE, failed ones are rescheduled or given up on.
+    '''
+    by_task = defaultdict(list)
+    for claimed in jobs:
+        by_task[claimed.task].append(claimed)
+    done = []
+    for task_name, group in by_task.items():
+        if task_name not in TASKS:
+            fail(group, f'Unknown task {task_name}')
+            continue
+        func, batch = TASKS[task_name]
+        runs = [group] if batch else [[claimed] for claimed in group]
+        for run in runs:
+            try:
+                func([claimed.payload for claimed in run]) if batch else func(run[0].payload)
+            except Exception as error:
+                logger.exception('Job %s failed', task_name)
+                fail(run, f'{type(error).__name__}: {error}')
+            else:
+                done += [claimed.pk for claimed in run]
+    if done:
+        Job.objects.filter(pk__in=done).update(status=Job.DONE, finished_at=timezone.now(), locked_by='')
+    return len(done)
+
+
+# Hand jobs of crashed workers back to the queue
+def requeue_stale(queue='default'):
+    cutoff = timezone.now() - timedelta(seconds=jobs_setting('STALE_AFTER'))
+    return Job.objects.filter(queue=queue, status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_by='', last_error='Worker timed out',
+    )
+
+
+class Worker:
+    '''
+        Claim and run jobs of one queue until stopped.
+    '''
+
+    def __init__(self, queue='default', batch_size=None, name=None):
+        self.queue = queue
+        self.batch_size = batch_size or jobs_setting('BATCH_SIZE')
+        self.name = name or f'{threading.current_thread().name}-{uuid4().hex[:8]}'
+        self.processed = 0
+
+    def run_once(self):
+        jobs = claim(self.name, self.queue, self.batch_size)
+        if jobs:
+            execute(jobs)
+            self.processed += len(jobs)
+        return len(jobs)
+
+    def run(self, stop, drain=False):
+        requeue_stale(self.queue)
+        try:
+            while not stop.is_set():
+                close_old_connections()
+                if self.run_once():
+                    continue
+                if drain:
+                    break
+                stop.wait(jobs_setting('POLL_INTERVAL'))
+        finally:
+            connection.close()
@@ -0,0 +1,25 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from online_clinics.archive import archive_reservations, archive_setting
+
+
+class Command(BaseCommand):
+    help = 'Move reservations older than a number of days to the archive table in bounded batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=archive_setting('AFTER_DAYS'))
+        parser.add_argument('--batch-size', type=int, default=archive_setting('BATCH_SIZE'))
+        parser.add_argument('--pause', type=float, default=archive_setting('PAUSE'),
+                            help='Seconds to sleep between batches')
+        parser.add_argument('--limit', type=int, help='Stop after moving this many reservations')
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        moved = 0
+        for count in archive_reservations(options['days'], options['batch_size'], options['pause'], options['limit']):
+            moved += count
+            if options['verbosity'] > 1:
+                self.stdout.write(f'  moved {count} ({moved} so far)')
+        self.stdout.write(f'Archived {moved} reservations in {perf_counter() - started:.2f}s')
@@ -0,0 +1,101 @@
+import asyncio
+import time as clock
+from datetime import time, timedelta
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db.backends.signals import connection_created
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from Doctor_Online.asgi import application
+from online_clinics.allocation import allocate_reservation, generate_slots
+from online_clinics.models import Clinic, Doctor, Patient
+
+
+class Command(BaseCommand):
+    help = 'Compare sync and async read endpoints under concurrent clients through the ASGI application'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--reservations', type=int, default=40)
+        parser.add_argument(
+            '--db-latency', type=float, default=0,
+            help='Milliseconds added to every query, to mimic a database across the network',
+        )
+
+    def handle(self, *args, **options):
+        if options['db_latency']:
+            delay = options['db_latency'] / 1000
+
+            def slow_query(execute, sql, params, many, context):
+                clock.sleep(delay)
+                return execute(sql, params, many, context)
+
+            connection_created.connect(
+                lambda connection, **kwargs: connection.execute_wrappers.append(slow_query), weak=False,
+            )
+        user = User.objects.create(username='async-benchmark')
+        doctor = Doctor.objects.create(email='async-benchmark-doctor@example.com', name='Benchmark', phone='+123456789')
+        patient = Patient.objects.create(email='async-benchmark-patient@example.com', name='Benchmark', phone='+123456789')
+        try:
+            clinic = Clinic.objects.create(
+                doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+                start_time=time(0, 0), end_time=time(23, 30), is_active=True,
+            )
+            generate_slots(clinic)
+            for _ in range(options['reservations']):
+                allocate_reservation(clinic.id, patient.id)
+            token = str(AccessToken.for_user(user))
+            for sync_name, async_name, args in [
+                ('clinic-controller', 'async-clinic-reservations', [clinic.id]),
+                ('patient', 'async-patient-reservations', [patient.id]),
+            ]:
+                for name in (sync_name, async_name):
+                    path = reverse(name, args=args) + '?page_size=40'
+                    elapsed, statuses = asyncio.run(self.load(path, token, options['requests'], options['concurrency']))
+                    self.stdout.write(
+                        f'{name:>28}: {options["requests"] / elapsed:8.1f} req/s  '
+                        f'({elapsed:.2f}s, statuses {sorted(set(statuses))})'
+                    )
+        finally:
+            Clinic.objects.filter(doctor=doctor).delete()
+            doctor.delete()
+            patient.delete()
+            user.delete()
+
+    async def load(self, path, token, requests, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def client():
+            async with semaphore:
+                return await self.request(path, token)
+
+        started = perf_counter()
+        statuses = await asyncio.gather(*[client() for _ in range(requests)])
+        return perf_counter() - started, statuses
+
+    # Drive the ASGI application in-process, no network or server involved
+    async def request(self, path, token):
+        path, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            'headers': [(b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode())],
+        }
+        status = None
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+
+        await application(scope, receive, send)
+        return status
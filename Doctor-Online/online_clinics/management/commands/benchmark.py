@@ -0,0 +1,212 @@
+import itertools
+import json
+import random
+import subprocess
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.servers.basehttp import ThreadedWSGIServer, WSGIRequestHandler
+from django.core.wsgi import get_wsgi_application
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from online_clinics.factories import seed
+from online_clinics.models import Clinic, Doctor, Patient
+
+PASSWORD = 'benchmark-pass'
+
+
+class BenchmarkServer(ThreadedWSGIServer):
+    # socketserver's default backlog of 5 drops connections under load
+    request_queue_size = 128
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def percentile(samples, fraction):
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))] if samples else None
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed bulk data and load the REST API through an in-process HTTP server, '
+        'writing throughput, latency percentiles and query counts to JSON. '
+        'Seeded rows are kept, so point it at a scratch database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--doctors', type=int, default=100)
+        parser.add_argument('--patients', type=int, default=1000)
+        parser.add_argument('--clinics', type=int, default=1000)
+        parser.add_argument('--reservations', type=int, default=10000)
+        parser.add_argument('--prefix', help='Reuse the data of an earlier run instead of seeding')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--scenarios', nargs='+', help='Only run these scenarios')
+        parser.add_argument('--output', default='benchmark.json')
+        parser.add_argument('--compare', help='Earlier JSON result to print the difference against')
+        parser.add_argument(
+            '--throttle', action='store_true', help='Keep rate limiting on, every request comes from one address',
+        )
+
+    def handle(self, *args, **options):
+        started = perf_counter()
+        if options['prefix']:
+            prefix = options['prefix']
+        else:
+            prefix = seed(
+                doctors=options['doctors'], patients=options['patients'], clinics=options['clinics'],
+                reservations=options['reservations'], password=PASSWORD,
+            )['prefix']
+            self.stdout.write(f'seeded {prefix} in {perf_counter() - started:.1f}s')
+        doctors = list(Doctor.objects.filter(email__startswith=prefix).values_list('id', flat=True))
+        patients = list(Patient.objects.filter(email__startswith=prefix).values_list('id', 'email'))
+        clinics = list(Clinic.objects.filter(doctor__in=doctors, is_active=True).values_list('id', flat=True))
+        if not (patients and clinics):
+            raise CommandError(f'No seeded data found for prefix {prefix}')
+
+        user, _ = User.objects.get_or_create(username=f'{prefix}-client')
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}', 'Content-Type': 'application/json'}
+        emails = itertools.count()
+        scenarios = {
+            'get-clinics': lambda: ('GET', reverse('get-clinics') + f'?page={random.randint(1, 5)}', None),
+            'clinic-reservations': lambda: ('GET', reverse('clinic-controller', args=[random.choice(clinics)]), None),
+            'patient-reservations': lambda: ('GET', reverse('patient', args=[random.choice(patients)[0]]), None),
+            'reserve': lambda: (
+                'POST', reverse('reservation', args=[random.choice(patients)[0]]), {'clinic': random.choice(clinics)},
+            ),
+            'register': lambda: ('POST', reverse('register-patient'), {
+                'email': f'{prefix}-signup-{next(emails)}@example.com', 'password': PASSWORD,
+                'name': 'Benchmark', 'phone': '+123456789',
+            }),
+            'login': lambda: ('POST', reverse('login'), {'email': random.choice(patients)[1], 'password': PASSWORD}),
+        }
+        names = options['scenarios'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        server = BenchmarkServer(('127.0.0.1', 0), QuietHandler)
+        server.set_app(get_wsgi_application())
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_port}'
+        results = {}
+        throttling = None if options['throttle'] else override_settings(THROTTLING={'ENABLED': False})
+        if throttling:
+            throttling.enable()
+        try:
+            for name in names:
+                results[name] = self.run_scenario(base, headers, scenarios[name], options)
+                results[name]['queries'] = self.count_queries(headers, scenarios[name])
+                self.report(name, results[name])
+        finally:
+            if throttling:
+                throttling.disable()
+            server.shutdown()
+            server.server_close()
+
+        result = {
+            'commit': self.git_commit(),
+            'created_at': timezone.now().isoformat(),
+            'database': settings.DATABASES['default']['ENGINE'],
+            'prefix': prefix,
+            'volumes': {
+                'doctors': len(doctors), 'patients': len(patients), 'active_clinics': len(clinics),
+            },
+            'requests': options['requests'],
+            'concurrency': options['concurrency'],
+            'scenarios': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(result, output, indent=2)
+        self.stdout.write(f'results written to {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], results)
+
+    def run_scenario(self, base, headers, scenario, options):
+        def request():
+            method, path, payload = scenario()
+            body = json.dumps(payload).encode() if payload is not None else None
+            started = perf_counter()
+            try:
+                with urllib.request.urlopen(urllib.request.Request(base + path, body, headers, method=method)) as response:
+                    response.read()
+                    status = response.status
+            except urllib.error.HTTPError as error:
+                status = error.code
+            return status, (perf_counter() - started) * 1000
+
+        started = perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            outcomes = list(pool.map(lambda _: request(), range(options['requests'])))
+        elapsed = perf_counter() - started
+        samples = sorted(latency for _, latency in outcomes)
+        statuses = Counter(status for status, _ in outcomes)
+        return {
+            'throughput_rps': round(len(outcomes) / elapsed, 1),
+            'p50_ms': round(percentile(samples, 0.50), 2),
+            'p95_ms': round(percentile(samples, 0.95), 2),
+            'p99_ms': round(percentile(samples, 0.99), 2),
+            'max_ms': round(samples[-1], 2),
+            'errors': sum(count for status, count in statuses.items() if status >= 400),
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        }
+
+    # Queries of one extra request, made in this thread so they can be captured
+    def count_queries(self, headers, scenario):
+        method, path, payload = scenario()
+        client = Client(HTTP_HOST='localhost', HTTP_AUTHORIZATION=headers['Authorization'])
+        with CaptureQueriesContext(connection) as context:
+            if method == 'GET':
+                client.get(path)
+            else:
+                client.post(path, json.dumps(payload), content_type='application/json')
+        return len(context.captured_queries)
+
+    def report(self, name, result):
+        self.stdout.write(
+            f'{name:>22}: {result["throughput_rps"]:8.1f} req/s  p50 {result["p50_ms"]:7.1f}ms  '
+            f'p95 {result["p95_ms"]:7.1f}ms  p99 {result["p99_ms"]:7.1f}ms  queries {result["queries"]:3}  '
+            f'statuses {result["statuses"]}'
+        )
+
+    def compare(self, path, results):
+        with open(path) as baseline_file:
+            baseline = json.load(baseline_file)
+        self.stdout.write(f'compared with {baseline.get("commit") or path}:')
+        for name, result in results.items():
+            before = baseline['scenarios'].get(name)
+            if before is None:
+                continue
+            self.stdout.write(
+                f'{name:>22}: throughput {self.change(before["throughput_rps"], result["throughput_rps"])}  '
+                f'p95 {self.change(before["p95_ms"], result["p95_ms"])}  '
+                f'queries {before["queries"]} -> {result["queries"]}'
+            )
+
+    @staticmethod
+    def change(before, after):
+        return f'{(after - before) / before * 100:+.1f}%' if before else 'n/a'
+
+    @staticmethod
+    def git_commit():
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from online_clinics.cache import directory_stats
+
+
+class Command(BaseCommand):
+    help = 'Show hit/miss counters of the clinic directory cache'
+
+    def handle(self, *args, **options):
+        stats = directory_stats()
+        self.stdout.write(
+            f"hits: {stats['hits']}  misses: {stats['misses']}  "
+            f"hit ratio: {stats['hit_ratio']:.2%}  version: {stats['version']}"
+        )
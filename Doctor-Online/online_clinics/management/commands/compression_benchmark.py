@@ -0,0 +1,76 @@
+import gzip
+import statistics
+from time import perf_counter
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from online_clinics.compression import brotli
+from online_clinics.factories import seed_histories
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure bytes and time saved by response compression and conditional GETs on large pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        seeded = seed_histories(count, 'compression-benchmark')
+        client = APIClient(HTTP_HOST='localhost')
+        client.force_authenticate(User.objects.create(username='compression-benchmark'))
+        urls = {
+            'clinic-reservations': reverse('clinic-controller', args=[seeded['clinic'].pk]),
+            'patient-reservations': reverse('patient', args=[seeded['patient'].pk]),
+        }
+        # Largest page the reservation endpoints serve
+        params = {'page_size': 100}
+        codings = [('gzip', level) for level in (1, 6, 9)]
+        if brotli:
+            codings += [('br', quality) for quality in (1, 4, 8)]
+        for name, url in urls.items():
+            body = client.get(url, params).content
+            self.stdout.write(f'{name}: {len(body)} bytes uncompressed')
+            for coding, level in codings:
+                setting = {'GZIP_LEVEL': level} if coding == 'gzip' else {'BROTLI_QUALITY': level}
+                with override_settings(RESPONSE_COMPRESSION=setting):
+                    plain = self.time(lambda: client.get(url, params), repeat)
+                    compressed = self.time(lambda: client.get(url, params, HTTP_ACCEPT_ENCODING=coding), repeat)
+                    size = len(client.get(url, params, HTTP_ACCEPT_ENCODING=coding).content)
+                self.stdout.write(
+                    f'  {coding:4} {level}: {size:7} bytes ({size / len(body):5.1%}), '
+                    f'{compressed - plain:+6.2f} ms per request'
+                )
+            alone = self.time(lambda: gzip.compress(body, 6, mtime=0), repeat)
+            self.stdout.write(f'  gzip level 6 on its own: {alone:.2f} ms')
+            etag = client.get(url, params)['ETag']
+            full = self.time(lambda: client.get(url, params), repeat)
+            revalidated = self.time(lambda: client.get(url, params, HTTP_IF_NONE_MATCH=etag), repeat)
+            self.stdout.write(f'  full response {full:6.2f} ms, 304 Not Modified {revalidated:6.2f} ms, 0 bytes')
+
+    # Median milliseconds of ``repeat`` calls
+    @staticmethod
+    def time(call, repeat):
+        samples = []
+        for _ in range(repeat):
+            started = perf_counter()
+            call()
+            samples.append(perf_counter() - started)
+        return statistics.median(samples) * 1000
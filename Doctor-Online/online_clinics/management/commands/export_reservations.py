@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from online_clinics.export import export_lines
+from online_clinics.serializers import ReservationExportSerializer
+
+
+class Command(BaseCommand):
+    help = 'Stream reservations as CSV or NDJSON to stdout or a file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinic', type=int)
+        parser.add_argument('--patient', type=int)
+        parser.add_argument('--date-from')
+        parser.add_argument('--date-to')
+        parser.add_argument('--format', dest='output', choices=['csv', 'ndjson'], default='csv')
+        parser.add_argument('--file', help='Write to this path instead of stdout')
+
+    def handle(self, *args, **options):
+        filters = {key: options[key] for key in ('clinic', 'patient', 'date_from', 'date_to', 'output')}
+        serializer = ReservationExportSerializer(data={key: value for key, value in filters.items() if value is not None})
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+        lines, _ = export_lines(**serializer.validated_data)
+        if options['file']:
+            with open(options['file'], 'w', newline='') as out:
+                out.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
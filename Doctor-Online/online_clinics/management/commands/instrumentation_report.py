@@ -0,0 +1,35 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from online_clinics.instrumentation import recorder
+
+
+class Command(BaseCommand):
+    help = 'Show rolling per-view timings and query counts recorded by the instrumentation middleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print the full report with histograms as JSON')
+        parser.add_argument('--reset', action='store_true', help='Clear the recorded windows afterwards')
+
+    def handle(self, *args, **options):
+        report = recorder.report()
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+        elif not report:
+            self.stdout.write('Nothing recorded, is INSTRUMENTATION enabled?')
+        else:
+            self.write_table(report)
+        if options['reset']:
+            recorder.reset()
+
+    def write_table(self, report):
+        for row in report:
+            phases = '  '.join(f'{phase} {ms:.1f}ms' for phase, ms in row['phases_mean_ms'].items())
+            self.stdout.write(
+                f"{row['view']:>28}: {row['requests']:6} req  mean {row['mean_ms']:7.1f}ms  "
+                f"p95 <={row['p95_ms']}ms  db {row['mean_db_ms']:6.1f}ms  queries {row['mean_queries']:5.1f}  "
+                f"{phases}  duplicates {row['duplicate_requests']}  n+1 {row['n_plus_one_requests']}"
+            )
+            for sql in row['flagged_sql']:
+                self.stdout.write(f'{"":>30}flagged: {sql[:160]}')
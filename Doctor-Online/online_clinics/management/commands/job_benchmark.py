@@ -0,0 +1,47 @@
+import threading
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+
+from online_clinics.jobs import Worker, enqueue_many, job, task
+from online_clinics.models import Job
+
+BENCHMARK_QUEUE = 'benchmark'
+
+
+@task('benchmark_noop', batch=True)
+def noop(payloads):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Measure how fast worker threads drain no-op jobs, the jobs are deleted afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--jobs', type=int, default=20000)
+        parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+        parser.add_argument('--batch-size', type=int, nargs='+', default=[1, 100, 500])
+
+    def handle(self, *args, **options):
+        try:
+            for batch_size in options['batch_size']:
+                for threads in options['threads']:
+                    count = options['jobs'] if batch_size > 1 else options['jobs'] // 10
+                    enqueue_many([job('benchmark_noop', {'n': n}, queue=BENCHMARK_QUEUE) for n in range(count)])
+                    workers = [Worker(BENCHMARK_QUEUE, batch_size) for _ in range(threads)]
+                    stop = threading.Event()
+                    pool = [threading.Thread(target=worker.run, args=(stop, True)) for worker in workers]
+                    started = perf_counter()
+                    for thread in pool:
+                        thread.start()
+                    for thread in pool:
+                        thread.join()
+                    elapsed = perf_counter() - started
+                    done = Job.objects.filter(queue=BENCHMARK_QUEUE, status=Job.DONE).count()
+                    self.stdout.write(
+                        f'batch {batch_size:4}  threads {threads:2}: {done / elapsed:9.0f} jobs/s  '
+                        f'({done}/{count} in {elapsed:.2f}s)'
+                    )
+                    Job.objects.filter(queue=BENCHMARK_QUEUE).delete()
+        finally:
+            Job.objects.filter(queue=BENCHMARK_QUEUE).delete()
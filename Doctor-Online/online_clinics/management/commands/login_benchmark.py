@@ -0,0 +1,39 @@
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from online_clinics.models import Patient
+from online_clinics.views import LoginUserAPIView
+
+
+class Command(BaseCommand):
+    help = 'Measure queries and latency per login, the benchmark user is rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=200)
+
+    def handle(self, *args, **options):
+        view = LoginUserAPIView.as_view()
+        factory = APIRequestFactory()
+        payload = {'email': 'login-benchmark@example.com', 'password': 'benchmark-pass'}
+        with transaction.atomic():
+            Patient.objects.create_patient(name='Benchmark', phone='+123456789', **payload)
+            samples, queries = [], []
+            for _ in range(options['logins']):
+                request = factory.post('/api/v1/login/', payload, format='json')
+                with CaptureQueriesContext(connection) as context:
+                    started = perf_counter()
+                    response = view(request)
+                    samples.append((perf_counter() - started) * 1000)
+                assert response.status_code == 200, response.data
+                queries.append(len(context.captured_queries))
+            transaction.set_rollback(True)
+        samples.sort()
+        self.stdout.write(
+            f'{len(samples)} logins  queries/login {sum(queries) / len(queries):.1f}  '
+            f'p50 {samples[len(samples) // 2]:.1f}ms  p99 {samples[len(samples) * 99 // 100]:.1f}ms  '
+            f'max {samples[-1]:.1f}ms'
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from online_clinics.models import ClinicDayStats
+from online_clinics.stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the clinic utilization and revenue table from reservations'
+
+    def handle(self, *args, **options):
+        rebuild_stats()
+        self.stdout.write(f'Rebuilt {ClinicDayStats.objects.count()} clinic day rows')
@@ -0,0 +1,53 @@
+import multiprocessing
+import signal
+import threading
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from online_clinics.jobs import Worker
+
+
+def stop_on_signals(stop):
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *_: stop.set())
+
+
+def run_threads(threads, queue, batch_size, drain, stop):
+    stop_on_signals(stop)
+    workers = [Worker(queue, batch_size) for _ in range(threads)]
+    pool = [threading.Thread(target=worker.run, args=(stop, drain)) for worker in workers]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return sum(worker.processed for worker in workers)
+
+
+class Command(BaseCommand):
+    help = 'Run background jobs with a pool of worker threads, optionally in several processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', default='default')
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--processes', type=int, default=1)
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--drain', action='store_true', help='Exit once no job is due')
+
+    def handle(self, *args, **options):
+        args = (options['threads'], options['queue'], options['batch_size'], options['drain'])
+        if options['processes'] == 1:
+            processed = run_threads(*args, threading.Event())
+            self.stdout.write(f'{processed} jobs processed')
+            return
+        # Children must not share the parent's database connections
+        connections.close_all()
+        stop = multiprocessing.Event()
+        stop_on_signals(stop)
+        processes = [
+            multiprocessing.Process(target=run_threads, args=(*args, stop)) for _ in range(options['processes'])
+        ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
@@ -0,0 +1,75 @@
+import random
+from datetime import date, time, timedelta
+from statistics import mean, quantiles
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from online_clinics.models import Clinic, Doctor
+from online_clinics.search import rebuild_index, search_clinics
+
+SPECIALITIES = ['cardiology', 'dermatology', 'pediatrics', 'neurology', 'dentistry', 'orthopedics', 'ophthalmology']
+NAMES = ['Ahmed', 'Mona', 'Sara', 'Omar', 'Youssef', 'Nour', 'Hassan', 'Laila', 'Karim', 'Salma']
+
+
+class Command(BaseCommand):
+    help = 'Benchmark clinic search against a seeded directory, all rows are rolled back afterwards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinics', type=int, default=100000)
+        parser.add_argument('--doctors', type=int, default=1000)
+        parser.add_argument('--queries', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.seed(options['clinics'], options['doctors'])
+            queryset = Clinic.objects.filter(is_active=True).select_related('doctor')
+            terms = [self.random_term(options['clinics'], options['doctors']) for _ in range(options['queries'])]
+            self.report('index', [self.timed(self.page, search_clinics(queryset, term)) for term in terms])
+            self.report('icontains', [self.timed(self.page, queryset.filter(
+                Q(description__icontains=term) | Q(doctor__name__icontains=term)
+            ).order_by('date', 'id')) for term in terms])
+            transaction.set_rollback(True)
+
+    # Mix of broad speciality prefixes and selective doctor/clinic lookups
+    def random_term(self, clinics, doctors):
+        return random.choice([
+            random.choice(SPECIALITIES)[:5],
+            f'{random.choice(NAMES)} {random.randrange(doctors)}',
+            f'{random.choice(SPECIALITIES)} {random.randrange(clinics)}',
+        ])
+
+    # What a directory page costs: the count and the first 20 rows
+    def page(self, queryset):
+        queryset.count()
+        list(queryset[:20])
+
+    def seed(self, clinics, doctors):
+        started = perf_counter()
+        # Multi-table inheritance rules out bulk_create for doctors
+        doctor_ids = [
+            Doctor.objects.create(email=f'bench-{i}@example.com', name=f'{random.choice(NAMES)} {i}', phone='+123456789').pk
+            for i in range(doctors)
+        ]
+        today = date.today()
+        Clinic.objects.bulk_create([
+            Clinic(
+                doctor_id=random.choice(doctor_ids), price=random.randint(50, 1000), is_active=True,
+                date=today + timedelta(days=random.randint(0, 365)), start_time=time(9, 0), end_time=time(17, 0),
+                description=f'{random.choice(SPECIALITIES)} clinic {i}',
+            )
+            for i in range(clinics)
+        ], batch_size=5000)
+        rebuild_index()
+        self.stdout.write(f'seeded {clinics} clinics in {perf_counter() - started:.1f}s')
+
+    def timed(self, func, *args):
+        started = perf_counter()
+        func(*args)
+        return (perf_counter() - started) * 1000
+
+    def report(self, name, samples):
+        p95 = quantiles(samples, n=20)[-1] if len(samples) > 1 else samples[0]
+        self.stdout.write(f'{name:>10}: mean {mean(samples):.2f}ms  p95 {p95:.2f}ms  max {max(samples):.2f}ms')
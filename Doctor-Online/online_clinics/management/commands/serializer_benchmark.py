@@ -0,0 +1,101 @@
+import statistics
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from online_clinics.factories import seed_histories
+from online_clinics.models import Clinic, Reservation
+from online_clinics.renderers import FastJSONRenderer, orjson
+from online_clinics.rows import ClinicListRows, ClinicReservationRows, PatientReservationRows
+from online_clinics.serializers import ClinicListSerializer, ClinicReservationSerializer, PatientReservationSerializer
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Compare model serializers and the stock renderer with rows and the fast renderer on large pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'orjson {"installed" if orjson else "missing, stock encoder used"}')
+        try:
+            with transaction.atomic():
+                self.run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def run(self, count, repeat):
+        seeded = seed_histories(count, 'serializer-benchmark')
+        doctors, first, patient = seeded['doctors'], seeded['clinic'], seeded['patient']
+
+        cases = {
+            'get-clinics': (
+                lambda: Clinic.objects.filter(doctor__in=doctors).select_related('doctor').only(
+                    'id', 'price', 'date', 'start_time', 'end_time', 'slot_minutes', 'is_active',
+                    'doctor', 'doctor__email', 'doctor__name', 'doctor__phone',
+                ).order_by('date', 'id'),
+                ClinicListSerializer,
+                lambda: ClinicListRows.values(
+                    Clinic.objects.filter(doctor__in=doctors).order_by('date', 'id')
+                ),
+                ClinicListRows,
+            ),
+            'clinic-reservations': (
+                lambda: Reservation.objects.filter(clinic=first).select_related('patient').only(
+                    'id', 'created_at', 'description', 'time', 'patient', 'patient__email', 'patient__name',
+                    'patient__phone',
+                ).order_by('time', 'id'),
+                ClinicReservationSerializer,
+                lambda: ClinicReservationRows.values(Reservation.objects.filter(clinic=first).order_by('time', 'id')),
+                ClinicReservationRows,
+            ),
+            'patient-reservations': (
+                lambda: Reservation.objects.filter(patient=patient.pk).select_related('clinic').only(
+                    'id', 'created_at', 'description', 'time', 'clinic', 'clinic__doctor_id', 'clinic__price',
+                    'clinic__date', 'clinic__start_time', 'clinic__end_time', 'clinic__description',
+                ).order_by('time', 'id'),
+                PatientReservationSerializer,
+                lambda: PatientReservationRows.values(
+                    Reservation.objects.filter(patient=patient.pk).order_by('time', 'id')
+                ),
+                PatientReservationRows,
+            ),
+        }
+        for name, (queryset, serializer, rows_queryset, rows) in cases.items():
+            before = self.measure(queryset, serializer, JSONRenderer(), repeat)
+            after = self.measure(rows_queryset, rows, FastJSONRenderer(), repeat)
+            if before['body'] != after['body']:
+                self.stderr.write(f'{name}: rows and model serializer render differently')
+            self.stdout.write(f'{name} ({before["rows"]} rows)')
+            for phase in ('fetch', 'serialize', 'render', 'total'):
+                self.stdout.write(
+                    f'  {phase:9} {before[phase]:8.2f} ms -> {after[phase]:7.2f} ms  '
+                    f'({before[phase] / after[phase]:5.1f}x)'
+                )
+
+    # Median milliseconds of each phase over ``repeat`` runs
+    def measure(self, queryset, serializer_class, renderer, repeat):
+        timings = {'fetch': [], 'serialize': [], 'render': [], 'total': []}
+        for _ in range(repeat):
+            started = perf_counter()
+            page = list(queryset())
+            fetched = perf_counter()
+            data = serializer_class(page, many=True).data
+            serialized = perf_counter()
+            body = renderer.render(data)
+            rendered = perf_counter()
+            timings['fetch'].append(fetched - started)
+            timings['serialize'].append(serialized - fetched)
+            timings['render'].append(rendered - serialized)
+            timings['total'].append(rendered - started)
+        result = {phase: statistics.median(samples) * 1000 for phase, samples in timings.items()}
+        result.update(rows=len(page), body=body)
+        return result
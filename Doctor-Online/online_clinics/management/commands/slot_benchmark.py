@@ -0,0 +1,57 @@
+from datetime import datetime, time, timedelta
+from time import perf_counter
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from online_clinics.models import Clinic
+from online_clinics.slots import clinics_slots, day_slots, range_slots
+
+
+# The former per-slot loop, kept as the baseline
+def loop_slots(clinic, length):
+    tz = timezone.get_current_timezone()
+    start = timezone.make_aware(datetime.combine(clinic.date, clinic.start_time), tz)
+    end = timezone.make_aware(datetime.combine(clinic.date, clinic.end_time), tz)
+    times = []
+    while start + length <= end:
+        times.append(start)
+        start += length
+    return times
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-slot cost of slot time generation, no database access'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clinics', type=int, default=5000)
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        today = timezone.now().date()
+        length = timedelta(minutes=30)
+        clinics = [
+            Clinic(pk=index, date=today + timedelta(days=index % options['days']),
+                   start_time=time(8, 0), end_time=time(20, 0), slot_minutes=30)
+            for index in range(options['clinics'])
+        ]
+        tz = timezone.get_current_timezone()
+        last = today + timedelta(days=options['clinics'] - 1)
+        runs = {
+            'per-slot loop': lambda: [loop_slots(clinic, length) for clinic in clinics],
+            'day_slots': lambda: [
+                day_slots(clinic.date, clinic.start_time, clinic.end_time, length, tz) for clinic in clinics
+            ],
+            'clinics_slots': lambda: clinics_slots(clinics),
+            'range_slots': lambda: range_slots(today, last, time(8, 0), time(20, 0), length, tz),
+        }
+        slots = sum(len(times) for times in runs['day_slots']())
+        for name, run in runs.items():
+            best = None
+            for _ in range(options['rounds']):
+                started = perf_counter()
+                run()
+                elapsed = perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            self.stdout.write(f'{name:>14}: {best * 1e9 / slots:8.1f} ns/slot  ({slots} slots in {best * 1000:.1f}ms)')
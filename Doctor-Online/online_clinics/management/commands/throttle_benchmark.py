@@ -0,0 +1,87 @@
+import logging
+import statistics
+from time import perf_counter
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client, override_settings
+from django.urls import reverse
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from online_clinics.throttling import AUTH_THROTTLES, local_buckets
+from online_clinics.views import LoginUserAPIView
+
+# High enough that no benchmark request is refused
+OPEN_RATES = {'ip': '1000000/s', 'email': '1000000/s', 'endpoint': '1000000/s'}
+CLOSED_RATES = {'ip': '1/d', 'email': '1/d', 'endpoint': '1/d'}
+STORES = {'cache': 'default', 'local': None}
+
+
+class Command(BaseCommand):
+    help = 'Measure the per-request overhead of the login and sign-up throttles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=6000)
+        parser.add_argument('--rounds', type=int, default=6, help='Alternating rounds of whole requests')
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        factory = APIRequestFactory()
+        view = LoginUserAPIView()
+        requests = [
+            Request(factory.post('/login/', {'email': f'user-{n}@example.com'}, format='json'), parsers=[JSONParser()])
+            for n in range(count)
+        ]
+        for request in requests:
+            request.data
+        for store, alias in STORES.items():
+            for label, rates in (('granted', OPEN_RATES), ('refused', CLOSED_RATES)):
+                with override_settings(THROTTLING={'ENABLED': True, 'CACHE': alias, 'RATES': rates}):
+                    cache.clear()
+                    local_buckets.full_at.clear()
+                    for throttle_class in AUTH_THROTTLES:
+                        throttle = throttle_class()
+                        started = perf_counter()
+                        for request in requests:
+                            throttle.allow_request(request, view)
+                        elapsed = perf_counter() - started
+                        self.stdout.write(
+                            f'{store:5} {throttle_class.__name__:16} {label}: {elapsed / count * 1e6:6.1f} us per check'
+                        )
+
+        # Whole requests to a login failing validation, so no hashing is
+        # timed. Settings take turns in rotating order so drift and warm-up
+        # hit all of them alike.
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        cache.clear()
+        local_buckets.full_at.clear()
+        client = Client(HTTP_HOST='localhost')
+        variants = {'off': {'ENABLED': False}}
+        variants.update({store: {'ENABLED': True, 'CACHE': alias, 'RATES': OPEN_RATES} for store, alias in STORES.items()})
+        timings = {label: [] for label in variants}
+        per_round = max(count // options['rounds'], 1)
+        labels = list(variants)
+        for turn in range(options['rounds']):
+            shift = turn % len(labels)
+            for label in labels[shift:] + labels[:shift]:
+                with override_settings(THROTTLING=variants[label]):
+                    for n in range(per_round):
+                        started = perf_counter()
+                        response = client.post(
+                            reverse('login'), {'email': f'user-{n}@example.com'}, content_type='application/json',
+                        )
+                        timings[label].append(perf_counter() - started)
+                        if response.status_code != 400:
+                            raise CommandError(f'Expected a validation error, got {response.status_code}')
+        # The fastest requests show the added work best on a noisy machine
+        baseline = statistics.median(timings['off']), min(timings['off'])
+        for label, samples in timings.items():
+            median, fastest = statistics.median(samples), min(samples)
+            self.stdout.write(
+                f'login, throttles {label:5}: median {median * 1e6:7.1f} us ({(median - baseline[0]) * 1e6:+6.1f}), '
+                f'fastest {fastest * 1e6:6.1f} us ({(fastest - baseline[1]) * 1e6:+6.1f})'
+            )
+        cache.clear()
+        local_buckets.full_at.clear()
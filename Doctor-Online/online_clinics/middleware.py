@@ -0,0 +1,209 @@
+import asyncio
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+from rest_framework.permissions import SAFE_METHODS
+
+from .compression import choose_coding, compress, compress_stream, compressible, compression_setting
+from .instrumentation import RequestMetrics, current, install, instrumentation_setting, record_phase, recorder
+from .routers import pin_to_primary
+
+
+def install_on_connection(connection, **kwargs):
+    install(connection)
+
+
+class SyncAndAsyncMiddleware:
+    '''
+        Middleware running in the mode of the handler chain around it.
+
+        Under ASGI a sync-only middleware makes Django run the whole chain
+        on its single sync thread, so async routes would serve one request
+        at a time. Subclasses implement ``handle`` and ``ahandle``.
+    '''
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Makes the instance pass for a coroutine function, as MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.ahandle(request)
+        return self.handle(request)
+
+    def handle(self, request):
+        raise NotImplementedError
+
+    async def ahandle(self, request):
+        raise NotImplementedError
+
+
+class InstrumentationMiddleware(SyncAndAsyncMiddleware):
+    '''
+        Record wall time, DB time and query count of every view.
+
+        Opt-in through INSTRUMENTATION['ENABLED']. Queries are captured by an
+        execute wrapper on every connection, so views running on worker
+        threads are covered too. Rendering and password hashing are timed
+        as separate phases and everything is reported in a Server-Timing
+        header.
+    '''
+
+    def __init__(self, get_response):
+        if not instrumentation_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        connection_created.connect(install_on_connection, dispatch_uid='online_clinics.instrumentation')
+        for connection in connections.all():
+            install(connection)
+
+    def handle(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def ahandle(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        wall_ms = (perf_counter() - metrics.started) * 1000
+        match = getattr(request, 'resolver_match', None)
+        recorder.record(match.view_name if match else 'unresolved', metrics, wall_ms)
+        if instrumentation_setting('SERVER_TIMING'):
+            response['Server-Timing'] = self.server_timing(metrics, wall_ms)
+        return response
+
+    # Time the renderer separately from the view that built the data
+    def process_template_response(self, request, response):
+        render = response.render
+
+        def timed_render():
+            started = perf_counter()
+            try:
+                return render()
+            finally:
+                record_phase('render', perf_counter() - started)
+
+        response.render = timed_render
+        return response
+
+    @staticmethod
+    def server_timing(metrics, wall_ms):
+        entries = [f'db;dur={metrics.db_ms:.1f};desc="{len(metrics.queries)} queries"']
+        entries += [f'{phase};dur={ms:.1f}' for phase, ms in metrics.phases.items()]
+        entries.append(f'total;dur={wall_ms:.1f}')
+        return ', '.join(entries)
+
+
+class ReplicaPinMiddleware(SyncAndAsyncMiddleware):
+    '''
+        Pin clients to the primary database for a while after they write.
+    '''
+
+    def handle(self, request):
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            pin_to_primary(request, response)
+        return response
+
+    # Reads, the async routes, pass straight through. Pinning may load the
+    # user, which touches the database.
+    async def ahandle(self, request):
+        response = await self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            await sync_to_async(pin_to_primary)(request, response)
+        return response
+
+
+class CompressionMiddleware(SyncAndAsyncMiddleware):
+    '''
+        Compress text and JSON responses of at least MIN_SIZE bytes with
+        brotli or gzip, whichever the client accepts.
+
+        Streamed bodies are compressed as they go. Strong ETags are
+        weakened as the compressed bytes differ from what they describe.
+        Compression time is reported as a phase of the instrumentation.
+        Under ASGI bodies are compressed on a worker thread, off the event
+        loop.
+    '''
+
+    def __init__(self, get_response):
+        if not compression_setting('ENABLED'):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    def handle(self, request):
+        response = self.get_response(request)
+        coding = self.coding(request, response)
+        if coding is None:
+            return response
+        if response.streaming:
+            return self.compress_streaming(response, coding)
+        return self.replace_content(response, coding, self.compress(response.content, coding))
+
+    async def ahandle(self, request):
+        response = await self.get_response(request)
+        coding = self.coding(request, response)
+        if coding is None:
+            return response
+        if response.streaming:
+            return self.compress_streaming(response, coding)
+        compressed = await sync_to_async(self.compress, thread_sensitive=False)(response.content, coding)
+        return self.replace_content(response, coding, compressed)
+
+    # Coding to compress the response with, None to leave it as it is
+    @staticmethod
+    def coding(request, response):
+        if response.has_header('Content-Encoding') or not compressible(response.get('Content-Type', '')):
+            return None
+        if not response.streaming and len(response.content) < compression_setting('MIN_SIZE'):
+            return None
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return choose_coding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+
+    @staticmethod
+    def compress(content, coding):
+        started = perf_counter()
+        try:
+            return compress(content, coding)
+        finally:
+            record_phase('compress', perf_counter() - started)
+
+    def compress_streaming(self, response, coding):
+        response.streaming_content = compress_stream(response.streaming_content, coding)
+        del response['Content-Length']
+        return self.encoded(response, coding)
+
+    def replace_content(self, response, coding, compressed):
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        return self.encoded(response, coding)
+
+    @staticmethod
+    def encoded(response, coding):
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = coding
+        return response
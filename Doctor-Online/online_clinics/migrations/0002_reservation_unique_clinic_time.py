@@ -0,0 +1,17 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='reservation',
+            constraint=models.UniqueConstraint(fields=('clinic', 'time'), name='unique_clinic_reservation_time'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:35
+
+from datetime import datetime, timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+import django.db.models.deletion
+
+DELTA_TIME = 30
+
+
+def build_slots(apps, schema_editor):
+    Clinic = apps.get_model('online_clinics', 'Clinic')
+    ClinicSlot = apps.get_model('online_clinics', 'ClinicSlot')
+    Reservation = apps.get_model('online_clinics', 'Reservation')
+    delta = timedelta(minutes=DELTA_TIME)
+    tz = timezone.get_current_timezone()
+    for clinic in Clinic.objects.iterator():
+        booked = set(Reservation.objects.filter(clinic=clinic).values_list('time', flat=True))
+        start = timezone.make_aware(datetime.combine(clinic.date, clinic.start_time), tz)
+        end = timezone.make_aware(datetime.combine(clinic.date, clinic.end_time), tz)
+        slots = []
+        while start + delta <= end:
+            slots.append(ClinicSlot(clinic=clinic, time=start, is_booked=start in booked))
+            start += delta
+        ClinicSlot.objects.bulk_create(slots)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0002_reservation_unique_clinic_time'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField()),
+                ('is_booked', models.BooleanField(default=False)),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='online_clinics.clinic')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='clinicslot',
+            index=models.Index(fields=['clinic', 'is_booked', 'time'], name='clinic_free_slot_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='clinicslot',
+            constraint=models.UniqueConstraint(fields=('clinic', 'time'), name='unique_clinic_slot_time'),
+        ),
+        migrations.RunPython(build_slots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0003_clinicslot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reservation',
+            name='clinic',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reserved_patients', to='online_clinics.clinic'),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='patient',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reserved_clinics', to='online_clinics.patient'),
+        ),
+        migrations.AddIndex(
+            model_name='clinic',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['date'], name='active_clinic_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['patient', 'time'], name='reservation_patient_time_idx'),
+        ),
+    ]
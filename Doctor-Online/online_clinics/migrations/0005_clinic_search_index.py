@@ -0,0 +1,77 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+# The DDL is spelled out here rather than taken from online_clinics.search,
+# so later changes to that module do not change what this migration does
+SEARCH_TABLE = 'online_clinics_clinicsearch'
+
+CREATE_SQL = {
+    'sqlite': [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        f"USING fts5(description, doctor_name, tokenize='unicode61 remove_diacritics 2')",
+    ],
+    'postgresql': [
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+        f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+        f'rowid bigint PRIMARY KEY REFERENCES online_clinics_clinic (id) '
+        f'ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+        f'description text NULL, doctor_name text NOT NULL, document tsvector NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)',
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_doctor_trgm_idx ON {SEARCH_TABLE} '
+        f'USING gin (doctor_name gin_trgm_ops)',
+    ],
+}
+
+INSERT_SQL = {
+    'sqlite': f'INSERT INTO {SEARCH_TABLE} (rowid, description, doctor_name) VALUES (%s, %s, %s)',
+    'postgresql': (
+        f'INSERT INTO {SEARCH_TABLE} (rowid, description, doctor_name, document) '
+        f"VALUES (%s, %s, %s, to_tsvector('simple', coalesce(%s, '') || ' ' || %s))"
+    ),
+}
+
+
+def insert_params(vendor, clinic_id, description, doctor_name):
+    if vendor == 'postgresql':
+        return [clinic_id, description, doctor_name, description, doctor_name]
+    return [clinic_id, description, doctor_name]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor not in CREATE_SQL:
+        return
+    for sql in CREATE_SQL[vendor]:
+        schema_editor.execute(sql)
+    Clinic = apps.get_model('online_clinics', 'Clinic')
+    rows = Clinic.objects.values_list('id', 'description', 'doctor__name')
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(INSERT_SQL[vendor], [insert_params(vendor, *row) for row in rows.iterator()])
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_SQL:
+        schema_editor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0004_reservation_clinic_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicSearch',
+            fields=[
+                ('clinic', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_document', serialize=False, to='online_clinics.clinic')),
+                ('description', models.TextField(null=True)),
+                ('doctor_name', models.TextField()),
+            ],
+            options={
+                'db_table': 'online_clinics_clinicsearch',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
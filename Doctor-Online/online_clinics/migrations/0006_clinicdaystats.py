@@ -0,0 +1,58 @@
+# Generated by Django 3.2.25 on 2026-10-18 15:51
+
+from datetime import datetime
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+DELTA_TIME = 30
+
+
+def build_stats(apps, schema_editor):
+    Clinic = apps.get_model('online_clinics', 'Clinic')
+    ClinicDayStats = apps.get_model('online_clinics', 'ClinicDayStats')
+    rows = []
+    for clinic in Clinic.objects.annotate(booked=Count('reserved_patients')).iterator():
+        length = datetime.combine(clinic.date, clinic.end_time) - datetime.combine(clinic.date, clinic.start_time)
+        rows.append(ClinicDayStats(
+            clinic_id=clinic.id, doctor_id=clinic.doctor_id, date=clinic.date,
+            capacity=max(int(length.total_seconds() // 60) // DELTA_TIME, 0),
+            booked=clinic.booked, revenue=clinic.booked * clinic.price,
+        ))
+    ClinicDayStats.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0005_clinic_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicDayStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('capacity', models.PositiveIntegerField(default=0)),
+                ('booked', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('clinic', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='online_clinics.clinic')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_stats', to='online_clinics.doctor')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='clinicdaystats',
+            index=models.Index(fields=['date'], name='clinic_day_stats_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clinicdaystats',
+            index=models.Index(fields=['doctor', 'date'], name='clinic_day_stats_doctor_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='clinicdaystats',
+            constraint=models.UniqueConstraint(fields=('clinic', 'date'), name='unique_clinic_day_stats'),
+        ),
+        migrations.RunPython(build_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:03
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0006_clinicdaystats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinic',
+            name='slot_minutes',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(5)]),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:06
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0007_clinic_slot_minutes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinicdaystats',
+            name='modified_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='clinicdaystats',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
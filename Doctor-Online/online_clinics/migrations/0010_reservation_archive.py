@@ -0,0 +1,80 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+# The view is spelled out here rather than taken from online_clinics.archive,
+# so later changes to that module do not change what this migration does
+HISTORY_TABLE = 'online_clinics_reservationhistory'
+COLUMNS = 'id, clinic_id, patient_id, time, description, created_at'
+
+
+def create_history_view(apps, schema_editor):
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f'CREATE VIEW {quote(HISTORY_TABLE)} AS '
+        f'SELECT {COLUMNS} FROM {quote("online_clinics_reservation")} '
+        f'UNION ALL '
+        f'SELECT {COLUMNS} FROM {quote("online_clinics_archivedreservation")}'
+    )
+
+
+def drop_history_view(apps, schema_editor):
+    schema_editor.execute(f'DROP VIEW IF EXISTS {schema_editor.connection.ops.quote_name(HISTORY_TABLE)}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clinic',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedReservation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('time', models.DateTimeField()),
+                ('description', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('clinic', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_reservations', to='online_clinics.clinic')),
+                ('patient', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_reservations', to='online_clinics.patient')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedreservation',
+            index=models.Index(fields=['clinic', 'time'], name='archived_clinic_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedreservation',
+            index=models.Index(fields=['patient', 'time'], name='archived_patient_time_idx'),
+        ),
+        migrations.CreateModel(
+            name='ReservationHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('time', models.DateTimeField()),
+                ('description', models.TextField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+                ('clinic', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='history', to='online_clinics.clinic')),
+                ('patient', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='history', to='online_clinics.patient')),
+            ],
+            options={
+                'db_table': 'online_clinics_reservationhistory',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_history_view, drop_history_view),
+    ]
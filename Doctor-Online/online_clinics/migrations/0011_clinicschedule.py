@@ -0,0 +1,48 @@
+# Generated by Django 3.2.25 on 2026-10-18 16:32
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('online_clinics', '0010_reservation_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClinicSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('description', models.TextField(blank=True, null=True)),
+                ('is_active', models.BooleanField(default=True)),
+                ('slot_minutes', models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(5)])),
+                ('frequency', models.CharField(choices=[('daily', 'Daily'), ('weekly', 'Weekly')], default='weekly', max_length=8)),
+                ('interval', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('weekdays', models.JSONField(blank=True, default=list)),
+                ('starts_on', models.DateField()),
+                ('ends_on', models.DateField(blank=True, null=True)),
+                ('exceptions', models.JSONField(blank=True, default=list)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='clinicschedule',
+            name='doctor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='schedules', to='online_clinics.doctor'),
+        ),
+        migrations.AddField(
+            model_name='clinic',
+            name='schedule',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='clinics', to='online_clinics.clinicschedule'),
+        ),
+        migrations.AddConstraint(
+            model_name='clinic',
+            constraint=models.UniqueConstraint(fields=('schedule', 'date'), name='unique_schedule_occurrence'),
+        ),
+    ]
@@ -1,7 +1,10 @@
-from django.contrib.auth.hashers import make_password
-from django.db import models
+from django.core.validators import MinValueValidator
+from django.db import models, transaction
+from django.utils import timezone
 
+from .hashing import hash_password
 from .managers import DoctorManager, PatientManager
+from .utils import DELTA_TIME
 
 
 class BaseUser(models.Model):
@@ -14,13 +17,20 @@ class BaseUser(models.Model):
 
 
 class Patient(BaseUser):
+    # Set on delete, the row and its reservations are purged by a job later
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
     objects = PatientManager()
 
     def __str__(self):
         return self.email
 
     def set_password(self):
-        self.password = make_password(self.password)
+        self.password = hash_password(self.password)
+
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at'])
 
 
 class Doctor(BaseUser):
@@ -30,7 +40,48 @@ class Doctor(BaseUser):
         return self.email
 
     def set_password(self):
-        self.password = make_password(self.password)
+        self.password = hash_password(self.password)
+
+
+class ClinicSchedule(models.Model):
+    '''
+        Clinic repeating on a pattern modelled after an iCalendar RRULE:
+        FREQ is ``frequency``, INTERVAL ``interval``, BYDAY ``weekdays``,
+        DTSTART ``starts_on``, UNTIL ``ends_on`` and EXDATE ``exceptions``.
+
+        Days are expanded on demand by online_clinics.schedules, a Clinic
+        row is only created for a day once it gets booked.
+    '''
+    DAILY, WEEKLY = 'daily', 'weekly'
+    FREQUENCIES = [(DAILY, 'Daily'), (WEEKLY, 'Weekly')]
+
+    doctor = models.ForeignKey(Doctor, related_name='schedules', on_delete=models.CASCADE)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    description = models.TextField(null=True, blank=True)
+    is_active = models.BooleanField(default=True)
+    slot_minutes = models.PositiveSmallIntegerField(default=DELTA_TIME, validators=[MinValueValidator(5)])
+    frequency = models.CharField(max_length=8, choices=FREQUENCIES, default=WEEKLY)
+    interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    # Weekday codes, MO to SU. Empty means every day, or the weekday of
+    # starts_on for weekly schedules.
+    weekdays = models.JSONField(default=list, blank=True)
+    starts_on = models.DateField()
+    ends_on = models.DateField(null=True, blank=True)
+    # ISO dates the schedule skips
+    exceptions = models.JSONField(default=list, blank=True)
+    modified_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f" Schedule Dr. {self.doctor.name} | {self.frequency} from {self.starts_on} "
+
+    def skip(self, date):
+        with transaction.atomic():
+            schedule = ClinicSchedule.objects.select_for_update().get(pk=self.pk)
+            if date.isoformat() not in schedule.exceptions:
+                schedule.exceptions.append(date.isoformat())
+                schedule.save(update_fields=['exceptions', 'modified_at'])
 
 
 class Clinic(models.Model):
@@ -41,17 +92,187 @@ class Clinic(models.Model):
     end_time = models.TimeField()
     description = models.TextField(null=True, blank=True)
     is_active = models.BooleanField(default=False)
+    slot_minutes = models.PositiveSmallIntegerField(default=DELTA_TIME, validators=[MinValueValidator(5)])
+    # Set on delete, the row and its reservations are purged by a job later
+    deleted_at = models.DateTimeField(null=True, blank=True)
+    # Schedule this day was materialized from, if any
+    schedule = models.ForeignKey(
+        ClinicSchedule, related_name='clinics', null=True, blank=True, on_delete=models.SET_NULL, db_index=False,
+    )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'date'], name='unique_schedule_occurrence'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='active_clinic_date_idx', condition=models.Q(is_active=True)),
+        ]
 
     def __str__(self):
         return f" Clinic Dr. {self.doctor.name} | {self.date} "
 
+    # Deleted clinics are deactivated too, which drops them from every
+    # listing. A day of a schedule is skipped from then on.
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.is_active = False
+        self.save(update_fields=['deleted_at', 'is_active'])
+        if self.schedule_id is not None:
+            self.schedule.skip(self.date)
+
+
+class ClinicSearch(models.Model):
+    '''
+        Search document of a clinic, the table is created per database
+        vendor by online_clinics.search and kept in sync through signals.
+    '''
+    clinic = models.OneToOneField(
+        Clinic, primary_key=True, db_column='rowid', related_name='search_document', on_delete=models.DO_NOTHING,
+    )
+    description = models.TextField(null=True)
+    doctor_name = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = 'online_clinics_clinicsearch'
+
+
+class ClinicSlot(models.Model):
+    clinic = models.ForeignKey(Clinic, related_name='slots', on_delete=models.CASCADE)
+    time = models.DateTimeField()
+    is_booked = models.BooleanField(default=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['clinic', 'time'], name='unique_clinic_slot_time'),
+        ]
+        indexes = [
+            models.Index(fields=['clinic', 'is_booked', 'time'], name='clinic_free_slot_idx'),
+        ]
+
+    def __str__(self):
+        return f" {self.clinic_id} | {self.time} "
+
 
 class Reservation(models.Model):
-    clinic = models.ForeignKey(Clinic, related_name='reserved_patients', on_delete=models.CASCADE)
-    patient = models.ForeignKey(Patient, related_name='reserved_clinics', on_delete=models.CASCADE)
+    # Both foreign keys are covered by the composite indexes in Meta
+    clinic = models.ForeignKey(Clinic, related_name='reserved_patients', on_delete=models.CASCADE, db_index=False)
+    patient = models.ForeignKey(Patient, related_name='reserved_clinics', on_delete=models.CASCADE, db_index=False)
+    time = models.DateTimeField()
+    description = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['clinic', 'time'], name='unique_clinic_reservation_time'),
+        ]
+        indexes = [
+            models.Index(fields=['patient', 'time'], name='reservation_patient_time_idx'),
+        ]
+
+    def __str__(self):
+        return f" Dr. {self.clinic.doctor.name} | {self.patient.name} | {self.time} "
+
+
+class ArchivedReservation(models.Model):
+    '''
+        Past reservation moved out of the live table by the
+        archive_reservations command, ids are kept
+    '''
+    id = models.BigIntegerField(primary_key=True)
+    clinic = models.ForeignKey(Clinic, related_name='archived_reservations', on_delete=models.CASCADE, db_index=False)
+    patient = models.ForeignKey(
+        Patient, related_name='archived_reservations', on_delete=models.CASCADE, db_index=False,
+    )
     time = models.DateTimeField()
     description = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['clinic', 'time'], name='archived_clinic_time_idx'),
+            models.Index(fields=['patient', 'time'], name='archived_patient_time_idx'),
+        ]
+
+    def __str__(self):
+        return f" {self.clinic_id} | {self.patient_id} | {self.time} "
+
+
+class ReservationHistory(models.Model):
+    '''
+        Live and archived reservations together, read through a database
+        view created by online_clinics.archive
+    '''
+    clinic = models.ForeignKey(
+        Clinic, related_name='history', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+    )
+    patient = models.ForeignKey(
+        Patient, related_name='history', on_delete=models.DO_NOTHING, db_constraint=False, db_index=False,
+    )
+    time = models.DateTimeField()
+    description = models.TextField(blank=True, null=True)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'online_clinics_reservationhistory'
+
+
+class ClinicDayStats(models.Model):
+    '''
+        Bookings, capacity and revenue of a clinic on one day, maintained
+        incrementally by online_clinics.stats
+    '''
+    clinic = models.ForeignKey(Clinic, related_name='day_stats', on_delete=models.CASCADE)
+    doctor = models.ForeignKey(Doctor, related_name='day_stats', on_delete=models.CASCADE)
+    date = models.DateField()
+    capacity = models.PositiveIntegerField(default=0)
+    booked = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Bumped whenever the slots of the day change, availability ETags derive from it
+    version = models.PositiveIntegerField(default=1)
+    modified_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['clinic', 'date'], name='unique_clinic_day_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='clinic_day_stats_date_idx'),
+            models.Index(fields=['doctor', 'date'], name='clinic_day_stats_doctor_idx'),
+        ]
+
+    def __str__(self):
+        return f" {self.clinic_id} | {self.date} | {self.booked}/{self.capacity} "
+
+
+class Job(models.Model):
+    '''
+        Background job, claimed and run by the run_jobs worker, see
+        online_clinics.jobs
+    '''
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUSES = [(QUEUED, 'Queued'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed')]
+
+    queue = models.CharField(max_length=32, default='default')
+    task = models.CharField(max_length=64)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=8, choices=STATUSES, default=QUEUED)
+    run_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=5)
+    locked_by = models.CharField(max_length=64, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue', 'run_at'], name='job_ready_idx', condition=models.Q(status='queued')),
+            models.Index(fields=['locked_at'], name='job_running_idx', condition=models.Q(status='running')),
+        ]
 
     def __str__(self):
-        return f" {self.clinic.name} | {self.patient.name} | {self.time} "
+        return f" {self.task} | {self.status} | {self.run_at} "
@@ -0,0 +1,58 @@
+from bisect import bisect_left
+
+from django.db.models import Count
+from rest_framework.pagination import CursorPagination
+
+
+class ReservationCursorPagination(CursorPagination):
+    '''
+        Keyset pagination over reservation history.
+
+        Pages are fetched by seeking on time (ties broken by id), so every
+        page costs the same regardless of its depth and no COUNT(*) is
+        issued.
+        ``ordering=past`` walks backwards from the newest reservation.
+    '''
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_ordering(self, request, queryset, view):
+        if request.query_params.get('ordering') == 'past':
+            return ('-time', '-id')
+        return ('time', 'id')
+
+
+class MergedRows:
+    '''
+        Clinic rows ordered on (date, id) merged with occurrence rows of
+        schedule days, which follow the clinic rows of their date.
+
+        Only the number of clinic rows per date is read up front, a slice
+        fetches just the clinic rows falling into it with LIMIT/OFFSET. The
+        occurrences are few, they cover at most MAX_EXPANSION_DAYS.
+    '''
+
+    def __init__(self, rows, occurrences):
+        self.rows = rows
+        self.occurrences = sorted(occurrences, key=lambda row: (row['date'], row['schedule']))
+        counts = dict(rows.order_by().values_list('date').annotate(Count('id')))
+        self.total = sum(counts.values())
+        # Position of every occurrence in the merged order
+        self.positions, before, dates = [], 0, iter(sorted(counts))
+        date = next(dates, None)
+        for index, occurrence in enumerate(self.occurrences):
+            while date is not None and date <= occurrence['date']:
+                before += counts[date]
+                date = next(dates, None)
+            self.positions.append(before + index)
+
+    def count(self):
+        return self.total + len(self.occurrences)
+
+    def __getitem__(self, key):
+        first, last = bisect_left(self.positions, key.start), bisect_left(self.positions, key.stop)
+        rows = list(self.rows[key.start - first:key.stop - last])
+        return sorted([*rows, *self.occurrences[first:last]], key=lambda row: (
+            row['date'], row['id'] is None, row['id'] or row['schedule'],
+        ))
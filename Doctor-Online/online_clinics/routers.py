@@ -0,0 +1,90 @@
+import random
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+
+from .db import database_setting
+
+PIN_COOKIE = 'primary_pin'
+
+# Set while a replica-enabled view serves a read, cleared by the first write
+replica_reads = ContextVar('replica_reads', default=None)
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(request, response):
+    '''
+        Keep a client on the primary for REPLICA_PIN_SECONDS after a write,
+        so it reads its own writes even when the replicas lag behind.
+    '''
+    seconds = database_setting('REPLICA_PIN_SECONDS')
+    if not seconds or not database_setting('REPLICAS'):
+        return
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        cache.set(pin_key(user.pk), True, seconds)
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+
+
+def is_pinned(request):
+    if request.COOKIES.get(PIN_COOKIE):
+        return True
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated and cache.get(pin_key(user.pk), False)
+
+
+def reading_replica():
+    '''
+        Whether reads of the current view go to a replica. Replicas may lag
+        behind the cached versions, so what they return must not be cached
+        or tagged under those versions.
+    '''
+    state = replica_reads.get()
+    return bool(state and state['enabled'] and database_setting('REPLICAS'))
+
+
+class ReplicaRouter:
+    '''
+        Send reads of replica-enabled views to a random replica.
+
+        Everything else, and any read after a write in the same request,
+        goes to the primary.
+    '''
+
+    def db_for_read(self, model, **hints):
+        if reading_replica():
+            return random.choice(database_setting('REPLICAS'))
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = replica_reads.get()
+        if state:
+            state['enabled'] = False
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+
+class ReplicaReadMixin:
+    '''
+        Serve safe methods of an API view from the replicas, unless the
+        client wrote recently and is pinned to the primary.
+    '''
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS and not is_pinned(request):
+            self.replica_token = replica_reads.set({'enabled': True})
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, 'replica_token', None)
+        if token is not None:
+            replica_reads.reset(token)
+            self.replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,141 @@
+from django.utils import timezone
+
+from .slots import UTC_ZONES
+
+
+# Formatters turn database values into what the DRF field of the same
+# model field renders, so rows and model serializers answer alike
+def as_is(value, tz):
+    return value
+
+
+def decimal_string(value, tz):
+    return None if value is None else '{:f}'.format(value)
+
+
+def iso(value, tz):
+    return None if value is None else value.isoformat()
+
+
+def datetime_string(value, tz):
+    if value is None:
+        return None
+    if value.tzinfo not in UTC_ZONES or tz not in UTC_ZONES:
+        value = value.astimezone(tz)
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class ValuesSerializer:
+    '''
+        Read-only serializer over ``.values()`` rows.
+
+        ``fields`` lists (name, lookup, formatter) in output order, where a
+        ValuesSerializer subclass as formatter nests the related object
+        found under the lookup. Rows skip model instances and the DRF
+        field machinery, which is most of the cost of large list pages.
+    '''
+    fields = ()
+
+    def __init__(self, instance, many=False):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def lookups(cls, prefix=''):
+        lookups = []
+        for _, lookup, formatter in cls.fields:
+            if isinstance(formatter, type) and issubclass(formatter, ValuesSerializer):
+                lookups += formatter.lookups(f'{prefix}{lookup}__')
+            else:
+                lookups.append(prefix + lookup)
+        return lookups
+
+    @classmethod
+    def values(cls, queryset):
+        # Extra selects stay in, ordering may depend on them
+        return queryset.values(*cls.lookups(), *queryset.query.extra_select)
+
+    @classmethod
+    def plan(cls, prefix=''):
+        return [
+            (name, formatter.plan(f'{prefix}{lookup}__'), None)
+            if isinstance(formatter, type) and issubclass(formatter, ValuesSerializer)
+            else (name, prefix + lookup, formatter)
+            for name, lookup, formatter in cls.fields
+        ]
+
+    @staticmethod
+    def represent(plan, row, tz):
+        return {
+            name: formatter(row[key], tz) if formatter else ValuesSerializer.represent(key, row, tz)
+            for name, key, formatter in plan
+        }
+
+    @property
+    def data(self):
+        plan, tz = self.plan(), timezone.get_current_timezone()
+        if self.many:
+            return [self.represent(plan, row, tz) for row in self.instance]
+        return self.represent(plan, self.instance, tz)
+
+
+# Doctors and patients alike
+class UserDetailRows(ValuesSerializer):
+    fields = (('email', 'email', as_is), ('name', 'name', as_is), ('phone', 'phone', as_is))
+
+
+class ClinicListRows(ValuesSerializer):
+    fields = (
+        ('id', 'id', as_is),
+        ('schedule', 'schedule', as_is),
+        ('doctor', 'doctor', UserDetailRows),
+        ('price', 'price', decimal_string),
+        ('date', 'date', iso),
+        ('start_time', 'start_time', iso),
+        ('end_time', 'end_time', iso),
+        ('slot_minutes', 'slot_minutes', as_is),
+        ('is_active', 'is_active', as_is),
+    )
+
+    # Row of an unsaved day of a schedule, its doctor selected along with the schedule
+    @staticmethod
+    def occurrence(clinic):
+        doctor = clinic.schedule.doctor
+        return {
+            'id': None, 'schedule': clinic.schedule_id,
+            'doctor__email': doctor.email, 'doctor__name': doctor.name, 'doctor__phone': doctor.phone,
+            'price': clinic.price, 'date': clinic.date, 'start_time': clinic.start_time,
+            'end_time': clinic.end_time, 'slot_minutes': clinic.slot_minutes, 'is_active': clinic.is_active,
+        }
+
+
+class ClinicDetailRows(ValuesSerializer):
+    fields = (
+        ('doctor', 'doctor', as_is),
+        ('price', 'price', decimal_string),
+        ('date', 'date', iso),
+        ('start_time', 'start_time', iso),
+        ('end_time', 'end_time', iso),
+        ('description', 'description', as_is),
+    )
+
+
+class ClinicReservationRows(ValuesSerializer):
+    fields = (
+        ('id', 'id', as_is),
+        ('patient', 'patient', UserDetailRows),
+        ('created_at', 'created_at', datetime_string),
+        ('description', 'description', as_is),
+        ('time', 'time', datetime_string),
+    )
+
+
+class PatientReservationRows(ValuesSerializer):
+    fields = (
+        ('id', 'id', as_is),
+        ('clinic', 'clinic', ClinicDetailRows),
+        ('created_at', 'created_at', datetime_string),
+        ('description', 'description', as_is),
+        ('time', 'time', datetime_string),
+    )
@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+
+from .allocation import generate_slots
+from .models import Clinic, ClinicSchedule
+
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+
+# Longest date range expanded by one request
+MAX_EXPANSION_DAYS = 366
+
+
+def schedule_weekdays(schedule):
+    if schedule.weekdays:
+        return {WEEKDAYS.index(code) for code in schedule.weekdays}
+    if schedule.frequency == ClinicSchedule.WEEKLY:
+        return {schedule.starts_on.weekday()}
+    return set(range(7))
+
+
+def occurrence_dates(schedule, date_from, date_to):
+    '''
+        Dates the schedule runs on between date_from and date_to inclusive.
+
+        Daily schedules count their interval in days from starts_on, weekly
+        ones in weeks from the Monday of that week, as RRULE does with
+        WKST=MO.
+    '''
+    first = max(date_from, schedule.starts_on)
+    last = min(date_to, schedule.ends_on) if schedule.ends_on else date_to
+    weekdays = schedule_weekdays(schedule)
+    skipped = set(schedule.exceptions)
+    week_start = schedule.starts_on - timedelta(days=schedule.starts_on.weekday())
+    dates = []
+    for offset in range((last - first).days + 1):
+        date = first + timedelta(days=offset)
+        if date.weekday() not in weekdays or date.isoformat() in skipped:
+            continue
+        if schedule.frequency == ClinicSchedule.DAILY:
+            period = (date - schedule.starts_on).days
+        else:
+            period = (date - week_start).days // 7
+        if period % schedule.interval == 0:
+            dates.append(date)
+    return dates
+
+
+# Unsaved clinic of one day of a schedule
+def occurrence(schedule, date):
+    return Clinic(
+        schedule=schedule, doctor_id=schedule.doctor_id, date=date, price=schedule.price,
+        start_time=schedule.start_time, end_time=schedule.end_time, slot_minutes=schedule.slot_minutes,
+        description=schedule.description, is_active=True,
+    )
+
+
+# (schedule, date) of every materialized day in the range, deleted and inactive ones too
+def materialized_days(schedules, date_from, date_to):
+    return set(Clinic.objects.filter(
+        schedule__in=[schedule.pk for schedule in schedules], date__range=(date_from, date_to),
+    ).values_list('schedule', 'date'))
+
+
+def active_schedules(date_from, date_to, doctor=None):
+    schedules = ClinicSchedule.objects.filter(is_active=True, starts_on__lte=date_to).filter(
+        Q(ends_on__isnull=True) | Q(ends_on__gte=date_from),
+    )
+    return schedules.filter(doctor=doctor) if doctor is not None else schedules
+
+
+def expand(schedules, date_from, date_to, taken=None):
+    '''
+        Unsaved clinics of every day the schedules run on in the range,
+        leaving out days that already have a Clinic row. Nothing is written,
+        so listing a long range does not multiply rows.
+    '''
+    schedules = list(schedules)
+    if not schedules:
+        return []
+    if taken is None:
+        taken = materialized_days(schedules, date_from, date_to)
+    return [
+        occurrence(schedule, date)
+        for schedule in schedules for date in occurrence_dates(schedule, date_from, date_to)
+        if (schedule.pk, date) not in taken
+    ]
+
+
+def occurrences(date_from, date_to, doctor=None, schedule=None):
+    '''
+        Days of active schedules in the range ordered by date, the booked
+        ones as their Clinic rows and the others expanded.
+    '''
+    schedules = active_schedules(date_from, date_to, doctor)
+    if schedule is not None:
+        schedules = schedules.filter(pk=schedule)
+    schedules = list(schedules)
+    if not schedules:
+        return []
+    clinics = list(Clinic.objects.filter(
+        schedule__in=[schedule.pk for schedule in schedules], date__range=(date_from, date_to),
+    ))
+    taken = {(clinic.schedule_id, clinic.date) for clinic in clinics}
+    listed = [clinic for clinic in clinics if clinic.is_active] + expand(schedules, date_from, date_to, taken)
+    return sorted(listed, key=lambda clinic: (clinic.date, clinic.schedule_id))
+
+
+def materialize(schedule_id, date):
+    '''
+        Clinic row of one day of a schedule, created with its slots on the
+        first booking. Concurrent first bookings race on the unique
+        (schedule, date) constraint and the loser reads the winner's row.
+        Returns None when the schedule does not run on that date.
+    '''
+    clinic = Clinic.objects.filter(schedule=schedule_id, date=date).first()
+    if clinic is not None:
+        return clinic
+    schedule = ClinicSchedule.objects.filter(pk=schedule_id, is_active=True).first()
+    if schedule is None or not occurrence_dates(schedule, date, date):
+        return None
+    try:
+        with transaction.atomic():
+            clinic = occurrence(schedule, date)
+            clinic.save()
+            generate_slots(clinic)
+    except IntegrityError:
+        return Clinic.objects.filter(schedule=schedule_id, date=date).first()
+    return clinic
@@ -0,0 +1,130 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Clinic, ClinicSearch
+
+# The index tables themselves are created by migration 0005
+SEARCH_TABLE = ClinicSearch._meta.db_table
+
+
+# Split user input into plain word terms, dropping any query syntax
+def search_terms(query):
+    return re.findall(r'\w+', query or '')
+
+
+class SqliteSearchBackend:
+    '''
+        FTS5 index with bm25 ranking, rowid is the clinic id
+    '''
+    insert_sql = f'INSERT INTO {SEARCH_TABLE} (rowid, description, doctor_name) VALUES (%s, %s, %s)'
+    rank_descending = False
+
+    def insert_params(self, clinic_id, description, doctor_name):
+        return [clinic_id, description, doctor_name]
+
+    def match_query(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def where_sql(self, terms):
+        return f'{SEARCH_TABLE} MATCH %s', [self.match_query(terms)]
+
+    def rank_sql(self, terms):
+        return f'{SEARCH_TABLE}.rank', []
+
+
+class PostgresSearchBackend:
+    '''
+        tsvector index for descriptions and a trigram index for doctor names
+    '''
+    insert_sql = (
+        f'INSERT INTO {SEARCH_TABLE} (rowid, description, doctor_name, document) '
+        f"VALUES (%s, %s, %s, to_tsvector('simple', coalesce(%s, '') || ' ' || %s))"
+    )
+    rank_descending = True
+
+    def insert_params(self, clinic_id, description, doctor_name):
+        return [clinic_id, description, doctor_name, description, doctor_name]
+
+    def match_query(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def where_sql(self, terms):
+        return (
+            f"({SEARCH_TABLE}.document @@ to_tsquery('simple', %s) OR {SEARCH_TABLE}.doctor_name %% %s)",
+            [self.match_query(terms), ' '.join(terms)],
+        )
+
+    def rank_sql(self, terms):
+        return (
+            f"ts_rank({SEARCH_TABLE}.document, to_tsquery('simple', %s)) + similarity({SEARCH_TABLE}.doctor_name, %s)",
+            [self.match_query(terms), ' '.join(terms)],
+        )
+
+
+BACKENDS = {
+    'sqlite': SqliteSearchBackend(),
+    'postgresql': PostgresSearchBackend(),
+}
+
+
+# Search backend of the given connection, None when full-text is unsupported
+def get_backend(using=connection):
+    return BACKENDS.get(using.vendor)
+
+
+# Insert (clinic id, description, doctor name) rows for new clinics
+def index_documents(rows):
+    backend = get_backend()
+    if backend is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(backend.insert_sql, [backend.insert_params(*row) for row in rows])
+
+
+def index_clinics(clinics):
+    '''
+        Upsert the search documents of the given clinics.
+
+        Clinics are expected to come with their doctor selected.
+    '''
+    if get_backend() is None or not clinics:
+        return
+    ClinicSearch.objects.filter(clinic__in=[clinic.id for clinic in clinics]).delete()
+    index_documents([(clinic.id, clinic.description, clinic.doctor.name) for clinic in clinics])
+
+
+def remove_clinic(clinic_id):
+    if get_backend() is not None:
+        ClinicSearch.objects.filter(clinic=clinic_id).delete()
+
+
+def rebuild_index():
+    if get_backend() is None:
+        return
+    ClinicSearch.objects.all().delete()
+    index_documents(Clinic.objects.values_list('id', 'description', 'doctor__name').iterator())
+
+
+def search_clinics(queryset, query):
+    '''
+        Restrict a clinic queryset to full-text matches, best ranked first.
+
+        The search table is joined in so the index drives the query, which
+        is why the vendor specific match and rank go through extra().
+    '''
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+    backend = get_backend()
+    if backend is None:
+        condition = Q()
+        for term in terms:
+            condition &= Q(description__icontains=term) | Q(doctor__name__icontains=term)
+        return queryset.filter(condition)
+    where_sql, where_params = backend.where_sql(terms)
+    rank_sql, rank_params = backend.rank_sql(terms)
+    return queryset.filter(search_document__isnull=False).extra(
+        select={'search_rank': rank_sql}, select_params=rank_params, where=[where_sql], params=where_params,
+    ).order_by('-search_rank' if backend.rank_descending else 'search_rank', 'date', 'id')
@@ -1,92 +1,58 @@
-from datetime import datetime
+from datetime import timedelta
 
+from django.utils import timezone
 from rest_framework import serializers
 
-from .models import Reservation, Clinic, Patient, Doctor, BaseUser
-from .utils import tomorrow, before_or_after_delta
+from .models import Reservation, Clinic, ClinicDayStats, ClinicSchedule, ClinicSlot, Patient, Doctor, BaseUser
+from .allocation import allocate_reservation, generate_slots
+from .availability import MAX_AVAILABILITY_DAYS
+from .schedules import MAX_EXPANSION_DAYS, WEEKDAYS, materialize
+from .hashing import reject_password, verify_password
+from .jobs import enqueue
+from .tokens import CachedRefreshToken
 from .validators import phone_number
 from django.core.exceptions import ValidationError
-from django.contrib.auth import authenticate
 from django.contrib.auth.password_validation import validate_password
 
 from rest_framework import serializers
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.tokens import RefreshToken
 
 class ReservationSerializer(serializers.ModelSerializer):
     '''
-        Reservation serializer class
+        Reservation serializer class, books a clinic or a day of a schedule
     '''
+    schedule = serializers.IntegerField(write_only=True, required=False)
+    date = serializers.DateField(write_only=True, required=False)
 
     class Meta:
         model = Reservation
-        fields = ('patient', 'clinic', 'time', 'description')
+        fields = ('patient', 'clinic', 'time', 'description', 'schedule', 'date')
         extra_kwargs = {
+            'clinic': {'queryset': Clinic.objects.filter(deleted_at=None), 'required': False},
             'patient': {'read_only': True},
             'time': {'read_only': True},
         }
 
-    def create(self, validated_data):
-        clinic_id = validated_data['clinic'].id
-        patient = Patient.objects.get(pk=validated_data['patient'])
-        now = datetime.now()
-        try:
-            last_reservation = Reservation.objects.filter(clinic=clinic_id).latest('time')
-            clinic = Clinic.objects.get(id=clinic_id)
-            clinic_start_time = clinic.start_time
-            clinic_end_time = clinic.end_time
-
-            # Today
-            if last_reservation.time.date() == now.date():
-
-                if last_reservation.time.hour == clinic_end_time:
-                    time = tomorrow(clinic_start_time, last_reservation.time)
-
-                elif last_reservation.time.hour >= now.hour:
-                    time = before_or_after_delta(last_reservation.time)
-
-                elif last_reservation.time.hour < now.hour:
-                    time = before_or_after_delta(now)
-
-            # Before Today
-            elif last_reservation.time.date() < now.date():
-
-                if now.hour == clinic_end_time:
-                    time = tomorrow(clinic_start_time, now)
-
-                else:
-                    time = before_or_after_delta(now)
-
-            # After Today
-            elif last_reservation.time.date() > now.date():
-
-                if last_reservation.time.hour == clinic_end_time:
-                    time = tomorrow(clinic_start_time, last_reservation.time)
-
-                else:
-                    time = before_or_after_delta(last_reservation.time)
-
-            reservation = Reservation.objects.create(
-                patient=patient,
-                clinic=validated_data['clinic'],
-                description=validated_data.get('description'),
-                time=time
-            )
-
-        except Reservation.DoesNotExist:
-
-            if now.hour == clinic_end_time:
-                time = tomorrow(clinic_start_time, now)
-            else:
-                time = before_or_after_delta(now)
+    def validate(self, data):
+        if 'clinic' in data:
+            return data
+        if 'schedule' not in data or 'date' not in data:
+            raise serializers.ValidationError("Either clinic or schedule and date are required.")
+        if data['date'] < timezone.localdate():
+            raise serializers.ValidationError("Date is invalid.")
+        return data
 
-            reservation = Reservation.objects.create(
-                patient=patient,
-                clinic=validated_data['clinic'],
-                description=validated_data.get('description'),
-                time=time
-            )
-        return reservation
+    def create(self, validated_data):
+        clinic = validated_data.get('clinic')
+        if clinic is None:
+            clinic = materialize(validated_data['schedule'], validated_data['date'])
+            if clinic is None or clinic.deleted_at is not None:
+                raise serializers.ValidationError("The schedule has no clinic on this date.")
+        return allocate_reservation(
+            clinic.id,
+            validated_data['patient'],
+            validated_data.get('description'),
+        )
 
 
 class ClinicSerializer(serializers.ModelSerializer):
@@ -101,15 +67,17 @@ class ClinicSerializer(serializers.ModelSerializer):
     class Meta:
         model = Clinic
 
-        fields = ('id', 'doctor', 'price', 'date', 'start_time', 'end_time', 'description', 'active',)
+        fields = ('id', 'doctor', 'price', 'date', 'start_time', 'end_time', 'slot_minutes', 'description', 'is_active',)
         read_only_fields = ('id',)
 
     def validate(self, data):
-        now = datetime.now()
+        start_time = data.get("start_time", getattr(self.instance, "start_time", None))
+        end_time = data.get("end_time", getattr(self.instance, "end_time", None))
+        date = data.get("date", getattr(self.instance, "date", None))
 
-        if data["end_time"] < data["start_time"]:
+        if end_time < start_time:
             raise serializers.ValidationError("Start time must be earlier than end time.")
-        elif data["date"] < now.date():
+        elif date < timezone.localdate():
             raise serializers.ValidationError("Clinic Date is invalid.")
 
         return data
@@ -117,15 +85,99 @@ class ClinicSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         clinic = Clinic(**validated_data)
         clinic.save()
+        generate_slots(clinic)
         return clinic
 
     def update(self, instance, validated_data):
         for key, item in validated_data.items():
             setattr(instance, key, item)
         instance.save()
+        generate_slots(instance)
         return instance
 
 
+class ClinicScheduleSerializer(serializers.ModelSerializer):
+    '''
+        Recurring clinic, see ClinicSchedule for how the fields map to an RRULE
+    '''
+    weekdays = serializers.ListField(child=serializers.ChoiceField(choices=WEEKDAYS), required=False)
+    exceptions = serializers.ListField(child=serializers.DateField(), required=False)
+
+    class Meta:
+        model = ClinicSchedule
+        fields = (
+            'id', 'doctor', 'price', 'start_time', 'end_time', 'slot_minutes', 'description', 'is_active',
+            'frequency', 'interval', 'weekdays', 'starts_on', 'ends_on', 'exceptions',
+        )
+        read_only_fields = ('id',)
+
+    def validate(self, data):
+        start_time = data.get("start_time", getattr(self.instance, "start_time", None))
+        end_time = data.get("end_time", getattr(self.instance, "end_time", None))
+        starts_on = data.get("starts_on", getattr(self.instance, "starts_on", None))
+        ends_on = data.get("ends_on", getattr(self.instance, "ends_on", None))
+
+        if end_time < start_time:
+            raise serializers.ValidationError("Start time must be earlier than end time.")
+        elif ends_on is not None and ends_on < starts_on:
+            raise serializers.ValidationError("Schedule cannot end before it starts.")
+
+        # Stored as JSON, in a stable order
+        if 'weekdays' in data:
+            data['weekdays'] = sorted(set(data['weekdays']), key=WEEKDAYS.index)
+        if 'exceptions' in data:
+            data['exceptions'] = sorted({date.isoformat() for date in data['exceptions']})
+        return data
+
+
+class ClinicOccurrenceSerializer(serializers.ModelSerializer):
+    '''
+        A day of a schedule, id is null until the day is first booked
+    '''
+
+    class Meta:
+        model = Clinic
+        fields = (
+            'id', 'schedule', 'doctor', 'date', 'price', 'start_time', 'end_time', 'slot_minutes', 'description',
+        )
+
+
+class OccurrenceSerializer(serializers.Serializer):
+    '''
+        Filters of the schedule occurrence listing, four weeks from today by default
+    '''
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    doctor = serializers.IntegerField(required=False)
+    schedule = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        data.setdefault('date_from', timezone.localdate())
+        data.setdefault('date_to', data['date_from'] + timedelta(days=27))
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("date_to must not be earlier than date_from.")
+        if (data['date_to'] - data['date_from']).days >= MAX_EXPANSION_DAYS:
+            raise serializers.ValidationError(f"At most {MAX_EXPANSION_DAYS} days can be requested at once.")
+        return data
+
+
+class BulkClinicSerializer(ClinicSerializer):
+    '''
+        Clinic item of a batch, doctors are checked for the whole batch at once
+    '''
+    doctor = serializers.IntegerField()
+
+
+class BulkReservationSerializer(serializers.Serializer):
+    '''
+        Reservation item of a batch, clinics and patients are checked for the
+        whole batch at once
+    '''
+    patient = serializers.IntegerField()
+    clinic = serializers.IntegerField()
+    description = serializers.CharField(required=False, allow_blank=True, allow_null=True)
+
+
 class PatientSerializer(serializers.ModelSerializer):
     '''
         Patient Serializer class
@@ -145,6 +197,7 @@ class PatientSerializer(serializers.ModelSerializer):
         patient = Patient(**validated_data)
         patient.set_password()
         patient.save()
+        enqueue('welcome', {'user': patient.pk})
         return patient
 
     def update(self, instance, validated_data):
@@ -175,6 +228,7 @@ class DoctorSerializer(serializers.ModelSerializer):
         doctor = Doctor(**validated_data)
         doctor.set_password()
         doctor.save()
+        enqueue('welcome', {'user': doctor.pk})
         return doctor
 
     def update(self, instance, validated_data):
@@ -210,8 +264,8 @@ class ClinicListSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Clinic
-        fields = ('id', 'doctor', 'name', 'price', 'date', 'start_time', 'end_time', 'is_active')
-        read_only_fields = ('id', 'is_active')
+        fields = ('id', 'schedule', 'doctor', 'price', 'date', 'start_time', 'end_time', 'slot_minutes', 'is_active')
+        read_only_fields = ('id', 'schedule', 'is_active')
 
 
 class ClinicReservationSerializer(serializers.ModelSerializer):
@@ -230,6 +284,62 @@ class PatientReservationSerializer(serializers.ModelSerializer):
         fields = ('id', 'clinic', 'created_at', 'description', 'time',)
 
 
+class ClinicSlotSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ClinicSlot
+        fields = ('id', 'time')
+
+
+class ReservationExportSerializer(serializers.Serializer):
+    '''
+        Filters of a reservation export
+    '''
+    clinic = serializers.IntegerField(required=False)
+    patient = serializers.IntegerField(required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    output = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+
+
+class AvailabilitySerializer(serializers.Serializer):
+    '''
+        Filters of the availability calendar, a week from today by default
+    '''
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    doctor = serializers.IntegerField(required=False)
+    clinic = serializers.IntegerField(required=False)
+
+    def validate(self, data):
+        data.setdefault('date_from', timezone.localdate())
+        data.setdefault('date_to', data['date_from'] + timedelta(days=6))
+        if data['date_to'] < data['date_from']:
+            raise serializers.ValidationError("date_to must not be earlier than date_from.")
+        if (data['date_to'] - data['date_from']).days >= MAX_AVAILABILITY_DAYS:
+            raise serializers.ValidationError(f"At most {MAX_AVAILABILITY_DAYS} days can be requested at once.")
+        return data
+
+
+class ClinicDayStatsSerializer(serializers.ModelSerializer):
+    utilization = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ClinicDayStats
+        fields = ('clinic', 'doctor', 'date', 'capacity', 'booked', 'revenue', 'utilization')
+
+    def get_utilization(self, obj):
+        return round(obj.booked / obj.capacity, 4) if obj.capacity else None
+
+
+class DoctorDayRevenueSerializer(serializers.Serializer):
+    doctor = serializers.IntegerField()
+    date = serializers.DateField()
+    clinics = serializers.IntegerField()
+    capacity = serializers.IntegerField()
+    booked = serializers.IntegerField()
+    revenue = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
 class UserLoginSerializer(serializers.ModelSerializer):
     """
     A serializer for user login.
@@ -243,8 +353,7 @@ class UserLoginSerializer(serializers.ModelSerializer):
         extra_kwargs = {"password": {'write_only': True}}
 
     def get_token(self, obj):
-        user = BaseUser.objects.get(email=obj['email'])
-        refresh = RefreshToken.for_user(user)
+        refresh = CachedRefreshToken.for_base_user(obj['user'])
         response = {'refresh': str(refresh), 'access': str(
             refresh.access_token), }
         return response
@@ -253,9 +362,15 @@ class UserLoginSerializer(serializers.ModelSerializer):
         """
         Validate that entered email and password are correct.
         """
-        user = authenticate(**data)
-        if not user:
+        user = BaseUser.objects.filter(email=data['email'], patient__deleted_at=None).only('id', 'password').first()
+        if user is None:
+            reject_password(data['password'])
+            raise AuthenticationFailed('Invalid credentials, try again')
+        if not verify_password(data['password'], user.password, lambda encoded: self.rehash(user, encoded)):
             raise AuthenticationFailed('Invalid credentials, try again')
-        if not user.is_active:
-            raise AuthenticationFailed('Account is not active')
-        return data
\ No newline at end of file
+        data['user'] = user
+        return data
+
+    def rehash(self, user, encoded):
+        user.password = encoded
+        user.save(update_fields=['password'])
\ No newline at end of file
@@ -0,0 +1,88 @@
+from django.core.signals import request_started
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .allocation import release_slot
+from .cache import invalidate_directory
+from .conditional import bump_patients, bump_reservations
+from .db import database_setting
+from .jobs import enqueue_many
+from .models import Clinic, ClinicSchedule, Doctor, Patient, Reservation
+from .search import index_clinics, remove_clinic
+from .stats import record_bookings, sync_clinic
+from .tasks import booking_jobs
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, created, **kwargs):
+    bump_reservations([instance])
+    if created:
+        record_bookings(instance.clinic_id, 1)
+        enqueue_many(booking_jobs([instance]))
+
+
+@receiver(post_delete, sender=Reservation)
+def reservation_deleted(sender, instance, **kwargs):
+    bump_reservations([instance])
+    release_slot(instance.clinic_id, instance.time)
+    record_bookings(instance.clinic_id, -1)
+
+
+@receiver(post_save, sender=Clinic)
+def clinic_saved(sender, instance, **kwargs):
+    invalidate_directory()
+    index_clinics([instance])
+    sync_clinic(instance)
+
+
+@receiver(post_delete, sender=Clinic)
+def clinic_deleted(sender, instance, **kwargs):
+    invalidate_directory()
+    remove_clinic(instance.id)
+
+
+# Unbooked days of schedules are listed in the directory
+@receiver(post_save, sender=ClinicSchedule)
+@receiver(post_delete, sender=ClinicSchedule)
+def schedule_changed(sender, instance, **kwargs):
+    invalidate_directory()
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_saved(sender, instance, **kwargs):
+    clinics = list(Clinic.objects.filter(doctor=instance.pk).select_related('doctor'))
+    invalidate_directory()
+    index_clinics(clinics)
+
+
+@receiver(post_delete, sender=Doctor)
+def doctor_deleted(sender, instance, **kwargs):
+    invalidate_directory()
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def patient_changed(sender, instance, **kwargs):
+    bump_patients()
+
+
+@receiver(connection_created)
+def tune_connection(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"PRAGMA busy_timeout = {int(database_setting('SQLITE_BUSY_TIMEOUT'))}")
+        cursor.execute(f"PRAGMA journal_mode = {database_setting('SQLITE_JOURNAL_MODE')}")
+        cursor.execute(f"PRAGMA synchronous = {database_setting('SQLITE_SYNCHRONOUS')}")
+
+
+# Drop persistent connections that went away while idle, before a request uses them
+@receiver(request_started)
+def check_connections(sender, **kwargs):
+    if not database_setting('HEALTH_CHECKS'):
+        return
+    for connection in connections.all():
+        if connection.connection is not None and not connection.is_usable():
+            connection.close()
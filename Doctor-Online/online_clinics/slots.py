@@ -0,0 +1,91 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
+
+from django.utils import timezone
+
+from .utils import DELTA_TIME
+
+
+def slot_length(clinic):
+    return timedelta(minutes=getattr(clinic, 'slot_minutes', None) or DELTA_TIME)
+
+
+# Zones needing no localization, datetime's own UTC and the one Django uses
+UTC_ZONES = (dt_timezone.utc, timezone.utc)
+
+
+def day_bounds(date, start_time, end_time, tz=None):
+    '''
+        Start and end of a clinic day as aware UTC datetimes.
+
+        Wall-clock times are localized once per day, slots are then laid
+        out in UTC so every slot lasts its full length even on a day the
+        clock shifts.
+    '''
+    tz = tz or timezone.get_current_timezone()
+    if tz in UTC_ZONES:
+        return (datetime.combine(date, start_time, tzinfo=dt_timezone.utc),
+                datetime.combine(date, end_time, tzinfo=dt_timezone.utc))
+    start = timezone.make_aware(datetime.combine(date, start_time), tz).astimezone(dt_timezone.utc)
+    end = timezone.make_aware(datetime.combine(date, end_time), tz).astimezone(dt_timezone.utc)
+    return start, end
+
+
+# Number of whole slots between two aware datetimes
+def slot_count(start, end, length):
+    return max((end - start) // length, 0)
+
+
+# Offsets of every slot from the start of the day, shared by all days alike
+@lru_cache(maxsize=256)
+def slot_offsets(count, length):
+    return tuple(length * index for index in range(count))
+
+
+def day_slots(date, start_time, end_time, length, tz=None):
+    start, end = day_bounds(date, start_time, end_time, tz)
+    return [start + offset for offset in slot_offsets(slot_count(start, end, length), length)]
+
+
+def range_slots(first_date, last_date, start_time, end_time, length, tz=None):
+    '''
+        Slots of the same schedule on every day from first_date to
+        last_date inclusive, keyed by date.
+    '''
+    tz = tz or timezone.get_current_timezone()
+    days = (last_date - first_date).days + 1
+    return {
+        date: day_slots(date, start_time, end_time, length, tz)
+        for date in (first_date + timedelta(days=offset) for offset in range(days))
+    }
+
+
+def clinic_bounds(clinic):
+    return day_bounds(clinic.date, clinic.start_time, clinic.end_time)
+
+
+def clinic_capacity(clinic):
+    start, end = clinic_bounds(clinic)
+    return slot_count(start, end, slot_length(clinic))
+
+
+# All slot start times of a clinic
+def clinic_slots(clinic):
+    return day_slots(clinic.date, clinic.start_time, clinic.end_time, slot_length(clinic))
+
+
+def clinics_slots(clinics):
+    '''
+        Slot start times of many clinics, keyed by clinic id.
+
+        Clinics sharing a day and schedule share one computed list, the
+        usual case when a doctor opens the same hours in several rooms.
+    '''
+    tz = timezone.get_current_timezone()
+    computed, result = {}, {}
+    for clinic in clinics:
+        key = (clinic.date, clinic.start_time, clinic.end_time, slot_length(clinic))
+        if key not in computed:
+            computed[key] = day_slots(*key, tz)
+        result[clinic.pk] = computed[key]
+    return result
@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Value
+from django.utils import timezone
+
+from .models import Clinic, ClinicDayStats
+from .slots import clinic_capacity
+
+
+def stats_row(clinic, booked=0):
+    return ClinicDayStats(
+        clinic_id=clinic.id, doctor_id=clinic.doctor_id, date=clinic.date,
+        capacity=clinic_capacity(clinic), booked=booked, revenue=booked * clinic.price,
+    )
+
+
+def sync_clinic(clinic):
+    '''
+        Keep the stats row of a clinic in line with its schedule.
+
+        Bookings are left alone. Revenue is bookings times the current
+        price, as rebuild_stats computes it, so it is recomputed in case
+        the price was edited.
+    '''
+    revenue = ExpressionWrapper(
+        F('booked') * Value(clinic.price), output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    updated = ClinicDayStats.objects.filter(clinic=clinic.id).update(
+        doctor=clinic.doctor_id, date=clinic.date, capacity=clinic_capacity(clinic), revenue=revenue,
+        version=F('version') + 1, modified_at=timezone.now(),
+    )
+    if not updated:
+        rebuild_clinic(clinic.id)
+
+
+def sync_clinics_bulk(clinics):
+    ClinicDayStats.objects.bulk_create([stats_row(clinic) for clinic in clinics])
+
+
+def record_bookings(clinic_id, count):
+    '''
+        Add (or with a negative count remove) bookings of a clinic day.
+
+        Every clinic gets its row when it is created, a missing row means
+        the clinic is being deleted and there is nothing left to count.
+    '''
+    price = Subquery(Clinic.objects.filter(pk=OuterRef('clinic')).values('price')[:1])
+    ClinicDayStats.objects.filter(clinic=clinic_id).update(
+        booked=F('booked') + count, revenue=F('revenue') + price * count,
+        version=F('version') + 1, modified_at=timezone.now(),
+    )
+
+
+# Mark the slots of a clinic day as changed
+def touch_clinic(clinic_id):
+    ClinicDayStats.objects.filter(clinic=clinic_id).update(version=F('version') + 1, modified_at=timezone.now())
+
+
+# Recompute the stats row of one clinic from its live and archived reservations
+def rebuild_clinic(clinic_id):
+    clinic = Clinic.objects.filter(pk=clinic_id).annotate(booked=Count('history')).first()
+    if clinic is None:
+        return
+    with transaction.atomic():
+        ClinicDayStats.objects.filter(clinic=clinic_id).delete()
+        stats_row(clinic, clinic.booked).save()
+
+
+def rebuild_stats(batch_size=1000):
+    with transaction.atomic():
+        ClinicDayStats.objects.all().delete()
+        rows = []
+        for clinic in Clinic.objects.annotate(booked=Count('history')).iterator():
+            rows.append(stats_row(clinic, clinic.booked))
+            if len(rows) == batch_size:
+                ClinicDayStats.objects.bulk_create(rows)
+                rows = []
+        ClinicDayStats.objects.bulk_create(rows)
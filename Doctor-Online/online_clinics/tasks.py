@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import send_mass_mail
+from django.db import transaction
+from django.utils import timezone
+
+from .conditional import bump_reservations
+from .jobs import enqueue, job, jobs_setting, task
+from .models import ArchivedReservation, BaseUser, Clinic, ClinicSlot, Patient, Reservation
+
+
+def reservation_messages(payloads, subject, body):
+    reservations = Reservation.objects.filter(
+        pk__in=[payload['reservation'] for payload in payloads],
+    ).select_related('clinic__doctor', 'patient')
+    return [
+        (subject, body.format(reservation=reservation, time=timezone.localtime(reservation.time)),
+         settings.DEFAULT_FROM_EMAIL, [reservation.patient.email])
+        for reservation in reservations
+    ]
+
+
+# Cancelled reservations are simply not found any more and get no mail
+@task('reservation_confirmation', batch=True)
+def send_confirmations(payloads):
+    send_mass_mail(reservation_messages(
+        payloads, 'Your reservation is confirmed',
+        'Dear {reservation.patient.name}, you are booked with Dr. {reservation.clinic.doctor.name} '
+        'at {time:%Y-%m-%d %H:%M}.',
+    ))
+
+
+@task('reservation_reminder', batch=True)
+def send_reminders(payloads):
+    send_mass_mail(reservation_messages(
+        payloads, 'Reminder of your reservation',
+        'Dear {reservation.patient.name}, this is a reminder of your appointment with '
+        'Dr. {reservation.clinic.doctor.name} at {time:%Y-%m-%d %H:%M}.',
+    ))
+
+
+@task('welcome', batch=True)
+def send_welcomes(payloads):
+    users = BaseUser.objects.filter(pk__in=[payload['user'] for payload in payloads]).only('email', 'name')
+    send_mass_mail([
+        ('Welcome to Doctor Online', f'Dear {user.name}, your account is ready.', settings.DEFAULT_FROM_EMAIL,
+         [user.email])
+        for user in users
+    ])
+
+
+def booking_jobs(reservations):
+    '''
+        Confirmation and reminder jobs of new reservations. Reminders go
+        out REMINDER_HOURS before the slot, or not at all when booked later.
+    '''
+    now = timezone.now()
+    before = timedelta(hours=jobs_setting('REMINDER_HOURS'))
+    jobs = []
+    for reservation in reservations:
+        jobs.append(job('reservation_confirmation', {'reservation': reservation.pk}))
+        if reservation.time - before > now:
+            jobs.append(job('reservation_reminder', {'reservation': reservation.pk}, run_at=reservation.time - before))
+    return jobs
+
+
+def purge(task_name, payload, owner, dependents):
+    '''
+        Delete what hangs off a soft-deleted row, one batch per job.
+
+        Each run removes up to PURGE_BATCH_SIZE rows of the first dependent
+        that has any left and enqueues the next run, so no transaction
+        grows with the size of a history. Live reservations go through
+        delete() and their signals, which free slots, fix stats and bump
+        list versions, archived ones bump versions here. The row itself is
+        deleted once nothing is left.
+    '''
+    size = jobs_setting('PURGE_BATCH_SIZE')
+    with transaction.atomic():
+        for queryset in dependents:
+            batch = list(queryset.order_by('pk')[:size])
+            if batch:
+                queryset.model.objects.filter(pk__in=[row.pk for row in batch]).delete()
+                if queryset.model is ArchivedReservation:
+                    bump_reservations(batch)
+                enqueue(task_name, payload)
+                return
+        owner.delete()
+
+
+@task('purge_clinic')
+def purge_clinic(payload):
+    clinic_id = payload['clinic']
+    purge('purge_clinic', payload, Clinic.objects.filter(pk=clinic_id, deleted_at__isnull=False), [
+        Reservation.objects.filter(clinic=clinic_id).only('id'),
+        ArchivedReservation.objects.filter(clinic=clinic_id).only('clinic', 'patient'),
+        ClinicSlot.objects.filter(clinic=clinic_id).only('id'),
+    ])
+
+
+@task('purge_patient')
+def purge_patient(payload):
+    patient_id = payload['patient']
+    purge('purge_patient', payload, Patient.objects.filter(pk=patient_id, deleted_at__isnull=False), [
+        Reservation.objects.filter(patient=patient_id).only('id'),
+        ArchivedReservation.objects.filter(patient=patient_id).only('clinic', 'patient'),
+    ])
@@ -1,3 +1,1394 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import json
+import shutil
+import sqlite3
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from time import perf_counter, sleep
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.backends.signals import connection_created
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed, ParseError, ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .allocation import allocate_reservation, generate_slots
+from .cache import directory_stats, directory_version
+from .db import retry_on_contention
+from .export import reservation_queryset
+from .factories import seed
+from .hashing import needs_rehash, service, verify_password
+from .instrumentation import Recorder, RequestMetrics, recorder
+from .jobs import TASKS, Worker, claim, enqueue, execute, task
+from .models import (
+    ArchivedReservation, BaseUser, Clinic, ClinicDayStats, ClinicSchedule, ClinicSlot, Doctor, Job, Patient, Reservation,
+    ReservationHistory,
+)
+from .renderers import FastJSONParser, FastJSONRenderer
+from .routers import PIN_COOKIE
+from .rows import ClinicListRows, ClinicReservationRows, PatientReservationRows
+from .schedules import occurrence_dates
+from .serializers import (
+    ClinicListSerializer, ClinicReservationSerializer, PatientReservationSerializer, UserLoginSerializer,
+)
+from .slots import clinic_bounds, day_slots, range_slots
+from .stats import rebuild_stats
+from .throttling import EndpointThrottle, local_buckets, take
+from .tokens import CachedRefreshToken
+from .utils import DELTA_TIME
+from .views import LoginUserAPIView
+
+
+class AllocationTest(TestCase):
+
+    def setUp(self):
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(10, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+
+    def test_consecutive_bookings_get_consecutive_slots(self):
+        start, _ = clinic_bounds(self.clinic)
+        first = allocate_reservation(self.clinic.id, self.patient.id)
+        second = allocate_reservation(self.clinic.id, self.patient.id)
+        self.assertEqual(first.time, start)
+        self.assertEqual(second.time, start + timedelta(minutes=DELTA_TIME))
+
+    def test_full_clinic_is_rejected(self):
+        allocate_reservation(self.clinic.id, self.patient.id)
+        allocate_reservation(self.clinic.id, self.patient.id)
+        with self.assertRaises(ValidationError):
+            allocate_reservation(self.clinic.id, self.patient.id)
+
+    def test_only_slot_clashes_are_retried(self):
+        with self.assertRaises(IntegrityError):
+            allocate_reservation(self.clinic.id, None)
+        start, _ = clinic_bounds(self.clinic)
+        Reservation.objects.create(clinic=self.clinic, patient=self.patient, time=start)
+        with self.assertRaisesMessage(ValidationError, 'Clinic is busy, try again.'):
+            allocate_reservation(self.clinic.id, self.patient.id)
+
+    def test_unknown_patient_is_not_found(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create(username='staff'))
+        response = client.post(reverse('reservation', args=[self.patient.id + 100]), {'clinic': self.clinic.id})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_cancelled_reservation_frees_its_slot(self):
+        reservation = allocate_reservation(self.clinic.id, self.patient.id)
+        reservation.delete()
+        self.assertEqual(allocate_reservation(self.clinic.id, self.patient.id).time, reservation.time)
+
+    def test_edit_keeps_booked_slots(self):
+        reservation = allocate_reservation(self.clinic.id, self.patient.id)
+        self.clinic.end_time = time(11, 0)
+        self.clinic.save()
+        generate_slots(self.clinic)
+        self.assertEqual(ClinicSlot.objects.filter(clinic=self.clinic).count(), 4)
+        self.assertTrue(ClinicSlot.objects.get(clinic=self.clinic, time=reservation.time).is_booked)
+
+
+class SlotTimeTest(TestCase):
+
+    def test_per_clinic_slot_length(self):
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        clinic = Clinic.objects.create(
+            doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(10, 0), slot_minutes=15, is_active=True,
+        )
+        generate_slots(clinic)
+        start, _ = clinic_bounds(clinic)
+        self.assertEqual(
+            list(ClinicSlot.objects.filter(clinic=clinic).order_by('time').values_list('time', flat=True)),
+            [start + timedelta(minutes=15 * index) for index in range(4)],
+        )
+        self.assertEqual(ClinicDayStats.objects.get(clinic=clinic).capacity, 4)
+
+    @override_settings(TIME_ZONE='Europe/Berlin')
+    def test_slots_are_aware_across_clock_change(self):
+        # Clocks jump from 02:00 to 03:00, the clinic is open two real hours
+        slots = day_slots(date(2026, 3, 29), time(1, 0), time(4, 0), timedelta(minutes=30))
+        self.assertEqual(len(slots), 4)
+        self.assertTrue(all(timezone.is_aware(slot) for slot in slots))
+        self.assertEqual([timezone.localtime(slot).time() for slot in slots],
+                         [time(1, 0), time(1, 30), time(3, 0), time(3, 30)])
+
+    def test_range_of_days(self):
+        days = range_slots(date(2026, 5, 1), date(2026, 5, 3), time(9, 0), time(12, 0), timedelta(minutes=60))
+        self.assertEqual(list(days), [date(2026, 5, 1), date(2026, 5, 2), date(2026, 5, 3)])
+        self.assertEqual(days[date(2026, 5, 2)][-1], datetime(2026, 5, 2, 11, 0, tzinfo=timezone.utc))
+
+
+# SQLite builds the unique (clinic, time) constraint into the table as an autoindex
+LIVE_CLINIC_INDEX = 'unique_clinic_reservation_time|sqlite_autoindex_online_clinics_reservation'
+
+
+class QueryPlanTest(TestCase):
+    '''
+        The hot read queries must be answered from an index, not a table scan
+    '''
+
+    def setUp(self):
+        # An empty table is cheaper to scan, pretend the tables are huge
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        self.assertRegex(plan, r'(?i)index')
+        self.assertNotRegex(plan, rf'(?m)SCAN {table}$|SCAN {table} (?!USING)|Seq Scan')
+
+    def assertUsesIndexes(self, queryset, *indexes):
+        plan = queryset.explain()
+        for index in indexes:
+            self.assertRegex(plan, index)
+
+    def test_clinic_reservations_use_index(self):
+        now = timezone.now()
+        self.assertUsesIndex(Reservation.objects.filter(clinic=1).order_by('time'))
+        self.assertUsesIndex(Reservation.objects.filter(clinic=1, time__lt=now).order_by('-time'))
+        self.assertUsesIndex(Reservation.objects.filter(clinic=1, time__gte=now).order_by('time'))
+
+    def test_patient_reservations_use_index(self):
+        now = timezone.now()
+        self.assertUsesIndex(Reservation.objects.filter(patient=1).order_by('time'))
+        self.assertUsesIndex(Reservation.objects.filter(patient=1, time__lt=now).order_by('-time'))
+        self.assertUsesIndex(Reservation.objects.filter(patient=1, time__gte=now).order_by('time'))
+
+    def test_export_date_range_uses_time_indexes(self):
+        today = timezone.localdate()
+        queryset = reservation_queryset(clinic=1, date_from=today, date_to=today)
+        self.assertUsesIndexes(queryset, LIVE_CLINIC_INDEX, 'archived_clinic_time_idx')
+        self.assertRegex(queryset.explain(), r'\(clinic_id=\? AND time>\? AND time<\?\)|Index Cond')
+        queryset = reservation_queryset(patient=1, date_from=today, date_to=today)
+        self.assertUsesIndexes(queryset, 'reservation_patient_time_idx', 'archived_patient_time_idx')
+
+    # Reservation lists read the live and archived tables through the history view
+    def test_history_reservations_use_indexes(self):
+        now = timezone.now()
+        clinic = ClinicReservationRows.values(ReservationHistory.objects.all())
+        for queryset in (
+            clinic.filter(clinic=1),
+            clinic.filter(clinic=1, time__lt=now).order_by('-time'),
+            clinic.filter(clinic=1, time__gte=now).order_by('time'),
+        ):
+            self.assertUsesIndexes(queryset, LIVE_CLINIC_INDEX, 'archived_clinic_time_idx')
+        patient = PatientReservationRows.values(ReservationHistory.objects.all())
+        for queryset in (
+            patient.filter(patient=1),
+            patient.filter(patient=1, time__lt=now).order_by('-time'),
+            patient.filter(patient=1, time__gte=now).order_by('time'),
+        ):
+            self.assertUsesIndexes(queryset, 'reservation_patient_time_idx', 'archived_patient_time_idx')
+
+    def test_active_clinics_use_partial_date_index(self):
+        self.assertUsesIndex(Clinic.objects.filter(is_active=True).order_by('date', 'id'))
+
+    def test_free_slot_lookup_uses_index(self):
+        queryset = ClinicSlot.objects.filter(clinic=1, is_booked=False, time__gte=timezone.now()).order_by('time')
+        self.assertUsesIndex(queryset)
+
+
+class QueryCountTest(APITestCase):
+    '''
+        Listing endpoints must run a constant number of queries per page
+    '''
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinics = []
+
+    def add_rows(self, count):
+        date = timezone.now().date() + timedelta(days=1)
+        for _ in range(count):
+            clinic = Clinic.objects.create(
+                doctor=self.doctor, price=100, date=date, start_time=time(9, 0), end_time=time(12, 0), is_active=True,
+            )
+            generate_slots(clinic)
+            allocate_reservation(clinic.id, self.patient.id)
+            self.clinics.append(clinic)
+        allocate_reservation(self.clinics[0].id, self.patient.id)
+
+    def assertConstantQueries(self, expected, url, params=None):
+        '''
+            The same request runs ``expected`` queries with few and with
+            more rows, cached pages are dropped in between
+        '''
+        sizes = []
+        for count in (3, 8):
+            self.add_rows(count)
+            cache.clear()
+            with self.assertNumQueries(expected):
+                response = self.client.get(url(), params)
+            self.assertEqual(response.status_code, 200)
+            # Directory pages are numbered and counted, history pages are not
+            sizes.append(response.data.get('count', len(response.data['results'])))
+        self.assertLess(sizes[0], sizes[1])
+
+    def test_get_clinics(self):
+        self.assertConstantQueries(2, lambda: reverse('get-clinics'))
+
+    def test_clinic_reservations(self):
+        for ordering in ('', 'upcoming'):
+            self.assertConstantQueries(
+                1, lambda: reverse('clinic-controller', args=[self.clinics[0].id]), {'ordering': ordering},
+            )
+        self.add_rows(1)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('clinic-controller', args=[self.clinics[0].id]), {'ordering': 'past'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_patient_reservations(self):
+        for ordering in ('', 'upcoming'):
+            self.assertConstantQueries(1, lambda: reverse('patient', args=[self.patient.id]), {'ordering': ordering})
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('patient', args=[self.patient.id]), {'ordering': 'past'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_reservation_history_is_cursor_paginated(self):
+        self.add_rows(5)
+        url = reverse('patient', args=[self.patient.id])
+        response = self.client.get(url, {'page_size': 4})
+        first_page = response.data['results']
+        self.assertEqual(len(first_page), 4)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(len(response.data['results']), 2)
+        self.assertIsNone(response.data['next'])
+        times = [row['time'] for row in first_page + response.data['results']]
+        self.assertEqual(times, sorted(times))
+
+
+class ClinicDirectoryCacheTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(12, 0), is_active=True,
+        )
+        self.url = reverse('get-clinics')
+
+    def test_repeated_reads_skip_the_database(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['count'], 1)
+        self.assertEqual(directory_stats()['hits'], 1)
+        self.assertEqual(directory_stats()['misses'], 1)
+
+    def test_clinic_edit_invalidates(self):
+        self.client.get(self.url)
+        self.clinic.price = 250
+        self.clinic.save()
+        self.assertEqual(self.client.get(self.url).data['results'][0]['price'], '250.00')
+
+    def test_clinic_delete_invalidates(self):
+        self.client.get(self.url)
+        self.clinic.delete()
+        self.assertEqual(self.client.get(self.url).data['count'], 0)
+
+    def test_doctor_edit_invalidates(self):
+        self.client.get(self.url)
+        self.doctor.name = 'Renamed'
+        self.doctor.save()
+        self.assertEqual(self.client.get(self.url).data['results'][0]['doctor']['name'], 'Renamed')
+
+    def test_version_moves_again_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clinic.price = 250
+            self.clinic.save()
+            # What a request reading the old rows before the commit caches under
+            during = directory_version()
+        self.assertGreater(directory_version(), during)
+
+
+class ClinicSearchTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.date = timezone.now().date() + timedelta(days=1)
+        self.cardio = self.add_clinic('Ahmed Hassan', 'Cardiology and heart checkups', 300)
+        self.derma = self.add_clinic('Mona Ali', 'Dermatology clinic', 150, days=3)
+
+    def add_clinic(self, doctor_name, description, price, days=0):
+        doctor = Doctor.objects.create(email=f'{price}@example.com', name=doctor_name, phone='+123456789')
+        return Clinic.objects.create(
+            doctor=doctor, price=price, date=self.date + timedelta(days=days), description=description,
+            start_time=time(9, 0), end_time=time(12, 0), is_active=True,
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('get-clinics'), params)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_search_matches_description_and_doctor_prefix(self):
+        self.assertEqual(self.search(search='cardio'), [self.cardio.id])
+        self.assertEqual(self.search(search='mon'), [self.derma.id])
+
+    def test_search_ignores_query_syntax(self):
+        self.assertEqual(self.search(search='"heart" (checkups*'), [self.cardio.id])
+
+    def test_date_and_price_ranges(self):
+        self.assertEqual(self.search(price_max='200'), [self.derma.id])
+        self.assertEqual(self.search(date_to=str(self.date)), [self.cardio.id])
+        self.assertEqual(self.client.get(reverse('get-clinics'), {'price_min': 'x'}).status_code, 400)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.derma.description = 'Cardiology follow ups'
+        self.derma.save()
+        self.assertCountEqual(self.search(search='cardiology'), [self.cardio.id, self.derma.id])
+        self.cardio.delete()
+        self.assertEqual(self.search(search='cardiology'), [self.derma.id])
+        self.derma.doctor.name = 'Sara Youssef'
+        self.derma.doctor.save()
+        self.assertEqual(self.search(search='sara'), [self.derma.id])
+
+
+class AsyncReadViewTest(TransactionTestCase):
+    '''
+        Async routes run the views on the worker pool, so data must be committed
+    '''
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(12, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+        allocate_reservation(self.clinic.id, self.patient.id)
+
+    def assertSameResponse(self, sync_url, async_url):
+        sync_response = self.client.get(sync_url)
+        async_response = self.client.get(async_url)
+        self.assertEqual(async_response.status_code, 200)
+        self.assertEqual(async_response.json(), sync_response.json())
+
+    def test_async_routes_match_sync_routes(self):
+        self.assertSameResponse(reverse('get-clinics'), reverse('async-get-clinics'))
+        self.assertSameResponse(
+            reverse('clinic-controller', args=[self.clinic.id]),
+            reverse('async-clinic-reservations', args=[self.clinic.id]),
+        )
+        self.assertSameResponse(
+            reverse('patient', args=[self.patient.id]),
+            reverse('async-patient-reservations', args=[self.patient.id]),
+        )
+
+    # Drive a fresh ASGI handler, so the middleware is loaded with the current settings
+    def asgi_get(self, handler, path):
+        token = str(AccessToken.for_user(User.objects.get(username='staff')))
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': b'',
+            'root_path': '', 'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+            'headers': [
+                (b'host', b'localhost'), (b'authorization', f'Bearer {token}'.encode()),
+                (b'accept-encoding', b'gzip'),
+            ],
+        }
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            messages.append(message)
+
+        async def request():
+            await handler(scope, receive, send)
+
+        return request, messages
+
+    @override_settings(
+        RESPONSE_COMPRESSION={'ENABLED': True, 'MIN_SIZE': 0}, INSTRUMENTATION={'ENABLED': True, 'FLUSH_EVERY': 1},
+    )
+    def test_async_routes_run_concurrently_through_middleware(self):
+        path = reverse('async-clinic-reservations', args=[self.clinic.id])
+
+        # The reservation query stands in for a database across the network
+        def slow_query(execute, sql, params, many, context):
+            if ReservationHistory._meta.db_table in sql:
+                sleep(0.1)
+            return execute(sql, params, many, context)
+
+        def install_slow_query(connection, **kwargs):
+            if slow_query not in connection.execute_wrappers:
+                connection.execute_wrappers.append(slow_query)
+
+        # Seconds taken by ``count`` parallel requests, each through its own handler
+        def elapsed(count):
+            requests = [self.asgi_get(ASGIHandler(), path) for _ in range(count)]
+
+            async def run():
+                await asyncio.gather(*[request() for request, _ in requests])
+
+            started = perf_counter()
+            asyncio.run(run())
+            self.assertEqual([messages[0]['status'] for _, messages in requests], [200] * count)
+            for _, messages in requests:
+                self.assertIn((b'Content-Encoding', b'gzip'), messages[0]['headers'])
+                self.assertIn(b'Server-Timing', dict(messages[0]['headers']))
+            return perf_counter() - started
+
+        connection_created.connect(install_slow_query)
+        try:
+            single, parallel = elapsed(1), elapsed(4)
+        finally:
+            connection_created.disconnect(install_slow_query)
+        # Serialized on the sync thread, four requests would take four times as long
+        self.assertLess(parallel, single * 2.5)
+
+    def test_async_routes_are_read_only(self):
+        response = self.client.delete(reverse('async-clinic-reservations', args=[self.clinic.id]))
+        self.assertEqual(response.status_code, 405)
+
+
+class ConcurrentBookingTest(TransactionTestCase):
+    '''
+        Parallel bookings go through real connections and locks
+    '''
+    workers = 16
+
+    def setUp(self):
+        self.user = User.objects.create(username='staff')
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(21, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+
+    def test_parallel_bookings_all_succeed(self):
+        barrier = threading.Barrier(self.workers)
+        statuses = []
+
+        def book():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                response = client.post(reverse('reservation', args=[self.patient.id]), {'clinic': self.clinic.id},
+                                       format='json')
+                statuses.append(response.status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=book) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(statuses, [201] * self.workers)
+        times = list(Reservation.objects.values_list('time', flat=True))
+        self.assertEqual(len(set(times)), self.workers)
+        self.assertEqual(ClinicSlot.objects.filter(is_booked=True).count(), self.workers)
+        self.assertEqual(ClinicDayStats.objects.get(clinic=self.clinic).booked, self.workers)
+
+    @override_settings(DATABASE_TUNING={'RETRY_BACKOFF': 0})
+    def test_retry_on_contention(self):
+        calls = []
+
+        @retry_on_contention
+        def write():
+            calls.append(1)
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'done'
+
+        self.assertEqual(write(), 'done')
+        self.assertEqual(len(calls), 3)
+        calls.clear()
+        with self.assertRaises(OperationalError), transaction.atomic():
+            write()
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(DATABASE_TUNING={'REPLICAS': ['replica'], 'REPLICA_PIN_SECONDS': 60})
+class ReplicaRoutingTest(TransactionTestCase):
+    '''
+        A second SQLite file acts as a replica that lags behind the primary.
+        It is refreshed from the primary on every setUp, so the test runner
+        need not know about it.
+    '''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.directory = tempfile.mkdtemp()
+        connections.settings['replica'] = {
+            **connections['default'].settings_dict, 'NAME': f'{cls.directory}/replica.sqlite3',
+        }
+
+    @classmethod
+    def tearDownClass(cls):
+        connections['replica'].close()
+        del connections.settings['replica']
+        shutil.rmtree(cls.directory)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(12, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.replicate()
+        allocate_reservation(self.clinic.id, self.patient.id)
+
+    # Copy the primary into the replica file
+    def replicate(self):
+        connections['replica'].close()
+        connections['default'].ensure_connection()
+        replica = sqlite3.connect(connections['replica'].settings_dict['NAME'])
+        connections['default'].connection.backup(replica)
+        replica.close()
+
+    def reservations(self, client, view, pk):
+        return len(client.get(reverse(view, args=[pk])).data['results'])
+
+    def test_reads_go_to_replica(self):
+        self.assertEqual(self.reservations(self.client, 'clinic-controller', self.clinic.id), 1)
+        self.assertEqual(self.reservations(self.client, 'patient', self.patient.id), 1)
+
+    def test_writer_is_pinned_to_primary(self):
+        response = self.client.post(reverse('reservation', args=[self.patient.id]), {'clinic': self.clinic.id},
+                                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.reservations(self.client, 'clinic-controller', self.clinic.id), 3)
+
+        other = APIClient()
+        other.force_authenticate(User.objects.create(username='other'))
+        self.assertEqual(self.reservations(other, 'clinic-controller', self.clinic.id), 1)
+
+    def test_replica_pages_are_not_cached_or_tagged(self):
+        response = self.client.get(reverse('clinic-controller', args=[self.clinic.id]))
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertNotIn('ETag', response)
+
+        Clinic.objects.create(
+            doctor=self.clinic.doctor, price=100, date=self.clinic.date,
+            start_time=time(13, 0), end_time=time(15, 0), is_active=True,
+        )
+        response = self.client.get(reverse('get-clinics'))
+        self.assertEqual(response.data['count'], 1)
+        self.assertNotIn('ETag', response)
+        self.client.cookies[PIN_COOKIE] = '1'
+        response = self.client.get(reverse('get-clinics'))
+        self.assertEqual(response.data['count'], 2)
+        self.assertIn('ETag', response)
+
+        # Once the staleness window is over the writer reads the replica again
+        cache.clear()
+        self.client.cookies.clear()
+        self.assertEqual(self.reservations(self.client, 'clinic-controller', self.clinic.id), 1)
+
+
+class PasswordHashingTest(APITestCase):
+
+    def register(self):
+        return self.client.post(reverse('register-patient'), {
+            'email': 'patient@example.com', 'password': 'secret-pass', 'name': 'Patient', 'phone': '+123456789',
+        })
+
+    def login(self, password='secret-pass'):
+        return UserLoginSerializer(data={'email': 'patient@example.com', 'password': password}).is_valid()
+
+    def test_register_and_login(self):
+        self.assertEqual(self.register().status_code, 201)
+        self.assertNotEqual(Patient.objects.get().password, 'secret-pass')
+        self.assertTrue(self.login())
+        with self.assertRaises(AuthenticationFailed):
+            self.login('wrong')
+        self.assertGreaterEqual(service.stats()['verify']['count'], 2)
+
+    def test_unknown_email_still_verifies_a_hash(self):
+        self.register()
+        verified = service.stats().get('verify', {}).get('count', 0)
+        with self.assertRaises(AuthenticationFailed):
+            UserLoginSerializer(data={'email': 'nobody@example.com', 'password': 'secret-pass'}).is_valid()
+        self.assertEqual(service.stats()['verify']['count'], verified + 1)
+
+    def test_login_rehashes_to_configured_cost(self):
+        self.register()
+        with override_settings(PASSWORD_HASHING={'ITERATIONS': 1000}):
+            self.assertTrue(self.login())
+        self.assertTrue(Patient.objects.get().password.startswith('pbkdf2_sha256$1000$'))
+        self.assertTrue(self.login())
+
+    @override_settings(
+        PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'],
+        PASSWORD_HASHING={'HASHER': 'md5', 'ITERATIONS': 1000},
+    )
+    def test_iterations_only_apply_to_pbkdf2(self):
+        self.assertEqual(self.register().status_code, 201)
+        self.assertTrue(Patient.objects.get().password.startswith('md5$'))
+        self.assertTrue(self.login())
+        self.assertFalse(needs_rehash(Patient.objects.get().password))
+
+    def test_saturated_pool_answers_429(self):
+        acquired = 0
+        while service.slots.acquire(blocking=False):
+            acquired += 1
+        try:
+            response = self.register()
+        finally:
+            for _ in range(acquired):
+                service.slots.release()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+        self.assertFalse(Patient.objects.exists())
+
+
+class LoginTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.post(reverse('register-patient'), {
+            'email': 'patient@example.com', 'password': 'secret-pass', 'name': 'Patient', 'phone': '+123456789',
+        })
+
+    def login(self):
+        return self.client.post(reverse('login'), {'email': 'patient@example.com', 'password': 'secret-pass'})
+
+    def test_login_runs_a_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.login()
+        self.assertEqual(response.status_code, 200)
+        refresh = CachedRefreshToken(response.data['token']['refresh'])
+        self.assertEqual(refresh['user_id'], Patient.objects.get().id)
+
+    def test_refresh_caches_blacklist_state(self):
+        refresh = self.login().data['token']['refresh']
+        self.assertEqual(self.client.post(reverse('token-refresh'), {'refresh': refresh}).status_code, 200)
+        with self.assertNumQueries(0):
+            response = self.client.post(reverse('token-refresh'), {'refresh': refresh})
+        self.assertIn('access', response.data)
+
+    def test_blacklisted_refresh_is_rejected(self):
+        refresh = self.login().data['token']['refresh']
+        self.client.post(reverse('token-refresh'), {'refresh': refresh})
+        CachedRefreshToken(refresh).blacklist()
+        self.assertEqual(self.client.post(reverse('token-refresh'), {'refresh': refresh}).status_code, 401)
+
+
+class BulkCreateTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.date = timezone.now().date() + timedelta(days=1)
+
+    def clinic_item(self, **overrides):
+        item = {
+            'doctor': self.doctor.id, 'price': '100.00', 'date': str(self.date),
+            'start_time': '09:00', 'end_time': '10:00', 'is_active': True, 'description': 'Bulk clinic',
+        }
+        item.update(overrides)
+        return item
+
+    def test_bulk_clinics_report_item_errors(self):
+        response = self.client.post(reverse('bulk-clinics'), [
+            self.clinic_item(), self.clinic_item(doctor=999), self.clinic_item(end_time='08:00'), self.clinic_item(),
+        ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1, 2])
+        self.assertEqual(Clinic.objects.count(), 2)
+        self.assertEqual(ClinicSlot.objects.count(), 4)
+        self.assertEqual(
+            sorted(row['id'] for row in response.data['created']),
+            sorted(Clinic.objects.values_list('id', flat=True)),
+        )
+        self.assertEqual(self.client.get(reverse('get-clinics'), {'search': 'bulk'}).data['count'], 2)
+
+    def test_bulk_reservations_allocate_in_one_pass(self):
+        clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=self.date, start_time=time(9, 0), end_time=time(10, 0), is_active=True,
+        )
+        generate_slots(clinic)
+        item = {'patient': self.patient.id, 'clinic': clinic.id}
+        # Reading back the new ids and enqueueing notifications take one query each
+        with self.assertNumQueries(12):
+            response = self.client.post(reverse('bulk-reservations'), [
+                item, {'patient': 999, 'clinic': clinic.id}, item, item,
+            ], format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(len({row['time'] for row in response.data['created']}), 2)
+        self.assertEqual(response.data['errors'], [
+            {'index': 1, 'errors': {'patient': ['Patient does not exist.']}},
+            {'index': 3, 'errors': {'clinic': ['No free slots left in this clinic.']}},
+        ])
+        self.assertFalse(ClinicSlot.objects.filter(clinic=clinic, is_booked=False).exists())
+
+    def test_bulk_rejects_non_list_payload(self):
+        self.assertEqual(self.client.post(reverse('bulk-reservations'), {}, format='json').status_code, 400)
+
+
+class ReservationExportTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinics = []
+        for days in (1, 2):
+            clinic = Clinic.objects.create(
+                doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=days),
+                start_time=time(9, 0), end_time=time(10, 0), is_active=True,
+            )
+            generate_slots(clinic)
+            allocate_reservation(clinic.id, self.patient.id, 'Checkup, "first" visit')
+            self.clinics.append(clinic)
+
+    def export(self, **params):
+        response = self.client.get(reverse('reservation-export'), params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv_export(self):
+        lines = self.export().splitlines()
+        self.assertEqual(lines[0], 'id,clinic,doctor,patient,patient_name,patient_email,time,created_at,description')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].endswith('"Checkup, ""first"" visit"'))
+
+    def test_ndjson_export_filters(self):
+        rows = [json.loads(line) for line in self.export(output='ndjson', clinic=self.clinics[1].id).splitlines()]
+        self.assertEqual([row['clinic'] for row in rows], [self.clinics[1].id])
+        date = str(self.clinics[0].date)
+        self.assertEqual(len(self.export(output='ndjson', date_from=date, date_to=date).splitlines()), 1)
+
+    def test_export_requires_admin(self):
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.assertEqual(self.client.get(reverse('reservation-export')).status_code, 403)
+
+    def test_export_command(self):
+        out = StringIO()
+        call_command('export_reservations', '--format', 'ndjson', '--patient', str(self.patient.id), stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 2)
+
+
+class ClinicStatsTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='admin', is_staff=True))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(11, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+
+    def stats(self):
+        return ClinicDayStats.objects.get(clinic=self.clinic)
+
+    def test_bookings_update_stats_incrementally(self):
+        self.assertEqual((self.stats().capacity, self.stats().booked), (4, 0))
+        first = allocate_reservation(self.clinic.id, self.patient.id)
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.assertEqual((self.stats().booked, self.stats().revenue), (2, 200))
+        first.delete()
+        self.assertEqual((self.stats().booked, self.stats().revenue), (1, 100))
+        self.client.post(reverse('bulk-reservations'), [{'patient': self.patient.id, 'clinic': self.clinic.id}] * 2,
+                         format='json')
+        self.assertEqual(self.stats().booked, 3)
+
+    def test_clinic_edit_updates_capacity_and_delete_cascades(self):
+        self.clinic.end_time = time(12, 0)
+        self.clinic.save()
+        self.assertEqual(self.stats().capacity, 6)
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.clinic.delete()
+        self.assertFalse(ClinicDayStats.objects.exists())
+
+    def test_rebuild_matches_incremental_rows(self):
+        allocate_reservation(self.clinic.id, self.patient.id)
+        before = list(ClinicDayStats.objects.values('clinic', 'date', 'capacity', 'booked', 'revenue'))
+        call_command('rebuild_clinic_stats', stdout=StringIO())
+        self.assertEqual(list(ClinicDayStats.objects.values('clinic', 'date', 'capacity', 'booked', 'revenue')), before)
+
+    def test_price_edit_matches_rebuild(self):
+        allocate_reservation(self.clinic.id, self.patient.id)
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.client.put(reverse('clinic-controller', args=[self.clinic.id]), {'price': '150.00'}, format='json')
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.assertEqual(self.stats().revenue, Decimal('450.00'))
+        call_command('rebuild_clinic_stats', stdout=StringIO())
+        self.assertEqual(self.stats().revenue, Decimal('450.00'))
+
+    def test_stats_endpoints(self):
+        allocate_reservation(self.clinic.id, self.patient.id)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('clinic-stats'), {'doctor': self.doctor.id})
+        self.assertEqual(response.data['results'][0]['utilization'], 0.25)
+        response = self.client.get(reverse('doctor-revenue'), {'date_from': str(self.clinic.date)})
+        self.assertEqual(response.data['results'][0]['revenue'], '100.00')
+        self.assertEqual(response.data['results'][0]['booked'], 1)
+
+
+class FactoryTest(TestCase):
+    def test_seed_keeps_derived_tables_consistent(self):
+        seeded = seed(doctors=3, patients=5, clinics=4, reservations=30)
+        self.assertEqual(Doctor.objects.filter(email__startswith=seeded['prefix']).count(), 3)
+        self.assertEqual(Patient.objects.filter(email__startswith=seeded['prefix']).count(), 5)
+        self.assertEqual(Reservation.objects.count(), 30)
+        self.assertEqual(ClinicSlot.objects.filter(is_booked=True).count(), 30)
+        self.assertEqual(sum(ClinicDayStats.objects.values_list('booked', flat=True)), 30)
+        patient = Patient.objects.filter(email__startswith=seeded['prefix']).first()
+        self.assertTrue(verify_password('benchmark-pass', patient.password))
+
+
+@override_settings(INSTRUMENTATION={'ENABLED': True, 'FLUSH_EVERY': 1, 'N_PLUS_ONE_THRESHOLD': 3})
+class InstrumentationTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff', is_staff=True))
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        Clinic.objects.create(
+            doctor=doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(12, 0), is_active=True,
+        )
+
+    def test_server_timing_and_report(self):
+        response = self.client.get(reverse('get-clinics'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="2 queries", render;dur=[\d.]+, total;dur=')
+        self.client.get(reverse('get-clinics'))
+        data = self.client.get(reverse('instrumentation')).data
+        self.assertIn('password_hashing', data)
+        report = {row['view']: row for row in data['views']}
+        self.assertEqual(report['get-clinics']['requests'], 2)
+        self.assertEqual(report['get-clinics']['mean_queries'], 1.0)
+        self.assertEqual(sum(report['get-clinics']['query_histogram'].values()), 2)
+
+    def test_duplicate_and_n_plus_one_flags(self):
+        metrics = RequestMetrics()
+        for params in ([1], [2], [3], [3]):
+            metrics.add_query('SELECT * FROM doctor WHERE id = %s', params, 0.001)
+        self.assertEqual(metrics.duplicates(), ['SELECT * FROM doctor WHERE id = %s'])
+        self.assertEqual(metrics.n_plus_one(), ['SELECT * FROM doctor WHERE id = %s'])
+        with self.assertLogs('online_clinics.instrumentation', 'WARNING'):
+            recorder.record('clinic-controller', metrics, 10)
+        row = next(row for row in recorder.report() if row['view'] == 'clinic-controller')
+        self.assertEqual((row['duplicate_requests'], row['n_plus_one_requests']), (1, 1))
+
+    @override_settings(INSTRUMENTATION={'ENABLED': True, 'FLUSH_EVERY': 100})
+    def test_concurrent_flushes_keep_both_counts(self):
+        first, second = Recorder(), Recorder()
+        first.record('clinic-controller', RequestMetrics(), 10)
+        second.record('clinic-controller', RequestMetrics(), 10)
+        cache_set = cache.set
+
+        # The second worker flushes while the first one is writing
+        def flush_second_then_set(*args, **kwargs):
+            patched.stop()
+            second.flush()
+            return cache_set(*args, **kwargs)
+
+        patched = mock.patch.object(cache, 'set', side_effect=flush_second_then_set)
+        patched.start()
+        first.flush()
+        row = next(row for row in first.report() if row['view'] == 'clinic-controller')
+        self.assertEqual(row['requests'], 2)
+
+    @override_settings(INSTRUMENTATION={'ENABLED': False})
+    def test_disabled_by_default(self):
+        self.assertNotIn('Server-Timing', self.client.get(reverse('get-clinics')))
+
+
+class AvailabilityTest(APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.date = timezone.now().date() + timedelta(days=1)
+        self.clinics = []
+        for start in (time(9, 0), time(14, 0)):
+            clinic = Clinic.objects.create(
+                doctor=self.doctor, price=100, date=self.date, start_time=start,
+                end_time=start.replace(hour=start.hour + 2), is_active=True,
+            )
+            generate_slots(clinic)
+            self.clinics.append(clinic)
+        self.params = {'date_from': str(self.date), 'date_to': str(self.date)}
+
+    def test_free_and_booked_slots(self):
+        allocate_reservation(self.clinics[0].id, self.patient.id)
+        # Clinic days, recurring schedules and slots
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('availability'), self.params)
+        first, second = response.data['results']
+        self.assertEqual((len(first['free']), len(first['booked'])), (3, 1))
+        self.assertEqual((len(second['free']), len(second['booked'])), (4, 0))
+        self.assertNotEqual(first['etag'], second['etag'])
+
+    def test_conditional_get(self):
+        etag = self.client.get(reverse('availability'), self.params)['ETag']
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('availability'), self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        allocate_reservation(self.clinics[1].id, self.patient.id)
+        response = self.client.get(reverse('availability'), self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        etag = response['ETag']
+        self.client.put(reverse('clinic-controller', args=[self.clinics[0].id]), {'end_time': '12:00'}, format='json')
+        response = self.client.get(reverse('availability'), self.params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(len(response.data['results'][0]['free']), 6)
+
+    def test_range_is_bounded(self):
+        response = self.client.get(reverse('availability'), {
+            'date_from': str(self.date), 'date_to': str(self.date + timedelta(days=40)),
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class JobQueueTest(TestCase):
+
+    def setUp(self):
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=timezone.now().date() + timedelta(days=3),
+            start_time=time(9, 0), end_time=time(11, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+
+    def tearDown(self):
+        TASKS.pop('failing', None)
+
+    def test_booking_sends_confirmation_and_schedules_reminder(self):
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.assertEqual(
+            sorted(Job.objects.values_list('task', flat=True)), ['reservation_confirmation', 'reservation_reminder'],
+        )
+        self.assertEqual(Worker().run_once(), 1)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['patient@example.com'])
+        self.assertEqual(Job.objects.get(task='reservation_reminder').status, Job.QUEUED)
+
+    def test_claim_takes_due_jobs_once(self):
+        for n in range(5):
+            enqueue('welcome', {'user': self.patient.pk})
+        enqueue('welcome', {'user': self.patient.pk}, run_at=timezone.now() + timedelta(hours=1))
+        with self.assertNumQueries(1):
+            jobs = claim('worker-1', limit=3)
+        self.assertEqual(len(jobs), 3)
+        self.assertEqual(len(claim('worker-2')), 2)
+        self.assertEqual(claim('worker-3'), [])
+        with self.assertNumQueries(2):
+            execute(jobs)
+        # One welcome per user, however often it was queued
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 3)
+
+    def test_failing_job_backs_off_then_fails(self):
+        @task('failing')
+        def failing(payload):
+            raise ValueError('boom')
+
+        created = enqueue('failing', {})
+        Job.objects.filter(pk=created.pk).update(max_attempts=2)
+        execute(claim('worker'))
+        retried = Job.objects.get(pk=created.pk)
+        self.assertEqual((retried.status, retried.attempts), (Job.QUEUED, 1))
+        self.assertGreater(retried.run_at, timezone.now())
+        self.assertIn('boom', retried.last_error)
+
+        Job.objects.filter(pk=created.pk).update(run_at=timezone.now())
+        execute(claim('worker'))
+        self.assertEqual(Job.objects.get(pk=created.pk).status, Job.FAILED)
+
+
+class ThrottlingTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_buckets.full_at.clear()
+
+    def login(self, email='patient@example.com', address='10.0.0.1'):
+        return self.client.post(reverse('login'), {'email': email, 'password': 'wrong'}, REMOTE_ADDR=address)
+
+    def test_bucket_refills_over_time(self):
+        for store in ('default', None):
+            with override_settings(THROTTLING={'CACHE': store}):
+                key = f'bucket-{store}'
+                self.assertEqual([take(key, '2/s', now=100) for _ in range(2)], [0, 0])
+                self.assertAlmostEqual(take(key, '2/s', now=100), 0.5)
+                self.assertAlmostEqual(take(key, '2/s', now=100.25), 0.25)
+                self.assertEqual(take(key, '2/s', now=100.5), 0)
+                self.assertEqual([take(key, '2/s', now=200) for _ in range(2)], [0, 0])
+
+    @override_settings(THROTTLING={'RATES': {'ip': '3/m', 'email': '100/m', 'endpoint': '100/s'}})
+    def test_address_is_throttled_with_retry_after(self):
+        for n in range(3):
+            self.assertEqual(self.login(f'user-{n}@example.com').status_code, 401)
+        response = self.login('other@example.com')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '20')
+        self.assertEqual(self.login(address='10.0.0.2').status_code, 401)
+
+    @override_settings(THROTTLING={'RATES': {'ip': '100/m', 'email': '2/m', 'endpoint': '100/s'}})
+    def test_email_is_throttled_across_addresses(self):
+        self.assertEqual(self.login(address='10.0.0.1').status_code, 401)
+        self.assertEqual(self.login(' Patient@Example.com', address='10.0.0.2').status_code, 401)
+        self.assertEqual(self.login(address='10.0.0.3').status_code, 429)
+        self.assertEqual(self.login('other@example.com', address='10.0.0.3').status_code, 401)
+
+    @override_settings(THROTTLING={'RATES': {'ip': '100/m', 'email': '100/m', 'endpoint': '2/m'}})
+    def test_endpoint_bucket_is_shared_by_every_client(self):
+        self.assertEqual(self.login('first@example.com', address='10.0.0.1').status_code, 401)
+        self.assertEqual(self.login('second@example.com', address='10.0.0.2').status_code, 401)
+        self.assertEqual(self.login('third@example.com', address='10.0.0.3').status_code, 429)
+
+    def test_endpoint_bucket_is_off_by_default(self):
+        self.assertIsNone(EndpointThrottle().rate(LoginUserAPIView()))
+        with override_settings(THROTTLING={'RATES': {'ip': '100/m', 'email': '100/m'}}):
+            statuses = [self.login(f'user-{n}@example.com', address=f'10.0.0.{n}').status_code for n in range(5)]
+        self.assertEqual(statuses, [401] * 5)
+
+    @override_settings(THROTTLING={'ENABLED': False, 'RATES': {'ip': '1/d'}})
+    def test_disabled(self):
+        self.assertEqual([self.login().status_code for _ in range(3)], [401] * 3)
+
+
+class FastJSONTest(TestCase):
+
+    def setUp(self):
+        doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=doctor, price=Decimal('99.50'), date=timezone.now().date() + timedelta(days=1),
+            start_time=time(9, 0), end_time=time(11, 0), description='Cardiology', is_active=True,
+        )
+        generate_slots(self.clinic)
+        allocate_reservation(self.clinic.id, self.patient.id)
+        Reservation.objects.update(description='First visit \u2028 ok')
+
+    def test_rows_match_model_serializers(self):
+        cases = [
+            (ClinicListRows, ClinicListSerializer, Clinic.objects.all()),
+            (ClinicReservationRows, ClinicReservationSerializer, Reservation.objects.all()),
+            (PatientReservationRows, PatientReservationSerializer, Reservation.objects.all()),
+        ]
+        for rows, serializer, queryset in cases:
+            self.assertEqual(rows(rows.values(queryset), many=True).data, serializer(queryset, many=True).data)
+
+    def test_renderer_matches_stock_renderer(self):
+        data = {
+            'results': ClinicReservationSerializer(Reservation.objects.all(), many=True).data,
+            'price': Decimal('10.50'), 'at': timezone.now(), 'on': date(2026, 1, 1), 'keys': {1: 'one'},
+        }
+        self.assertEqual(FastJSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(FastJSONRenderer().render(data, 'application/json; indent=2'), JSONRenderer().render(
+            data, 'application/json; indent=2',
+        ))
+
+    def test_parser(self):
+        parser = FastJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"name": "Müller"}'.encode())), {'name': 'Müller'})
+        with self.assertRaises(ParseError):
+            parser.parse(BytesIO(b'{"name": '))
+
+
+class HttpCachingTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        self.clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(8, 0), end_time=time(20, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+        for _ in range(20):
+            allocate_reservation(self.clinic.id, self.patient.id)
+
+    def assertRevalidates(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual((cached.status_code, cached.content), (304, b''))
+        return response['ETag']
+
+    def test_clinic_list(self):
+        etag = self.assertRevalidates(reverse('get-clinics'))
+        self.clinic.price = 250
+        self.clinic.save()
+        self.assertNotEqual(self.client.get(reverse('get-clinics'))['ETag'], etag)
+
+    def test_clinic_reservations(self):
+        url = reverse('clinic-controller', args=[self.clinic.id])
+        etag = self.assertRevalidates(url)
+        self.assertNotEqual(self.assertRevalidates(url, {'page_size': 5}), etag)
+        self.patient.name = 'Renamed'
+        self.patient.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        allocate_reservation(self.clinic.id, self.patient.id)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_patient_reservations(self):
+        url = reverse('patient', args=[self.patient.id])
+        etag = self.assertRevalidates(url, {'ordering': 'upcoming'})
+        self.client.put(reverse('clinic-controller', args=[self.clinic.id]), {'price': '120.00'}, format='json')
+        response = self.client.get(url, {'ordering': 'upcoming'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.data['results'][0]['clinic']['price'], '120.00')
+        Reservation.objects.first().delete()
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+
+    def test_large_pages_are_compressed(self):
+        url = reverse('patient', args=[self.patient.id])
+        plain = self.client.get(url, {'page_size': 100})
+        compressed = self.client.get(url, {'page_size': 100}, HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity; q=0.5')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        # Reservation pages repeat the same keys and clinic on every row
+        self.assertLess(len(compressed.content), len(plain.content) / 5)
+
+    def test_small_and_refused_responses_are_left_alone(self):
+        response = self.client.get(reverse('get-clinics'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(reverse('patient', args=[self.patient.id]), HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+
+class ArchiveTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create_patient(
+            email='patient@example.com', password='secret-pass', name='Patient', phone='+123456789',
+        )
+        started = timezone.now() - timedelta(days=400)
+        self.old_clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=started.date(), start_time=time(8, 0), end_time=time(20, 0),
+        )
+        Reservation.objects.bulk_create([
+            Reservation(clinic=self.old_clinic, patient=self.patient, time=started + timedelta(minutes=15 * n))
+            for n in range(5)
+        ])
+        self.clinic = Clinic.objects.create(
+            doctor=self.doctor, price=100, date=timezone.now().date() + timedelta(days=1),
+            start_time=time(8, 0), end_time=time(10, 0), is_active=True,
+        )
+        generate_slots(self.clinic)
+        for _ in range(3):
+            allocate_reservation(self.clinic.id, self.patient.id)
+
+    def run_jobs(self):
+        while Worker().run_once():
+            pass
+
+    def test_old_reservations_are_archived_in_batches(self):
+        history = self.client.get(reverse('patient', args=[self.patient.id]), {'page_size': 100}).data['results']
+        out = StringIO()
+        call_command('archive_reservations', days=30, batch_size=2, verbosity=2, stdout=out)
+        self.assertEqual(out.getvalue().count('moved'), 3)
+        self.assertEqual(ArchivedReservation.objects.count(), 5)
+        self.assertFalse(Reservation.objects.filter(clinic=self.old_clinic).exists())
+        self.assertEqual(ClinicSlot.objects.filter(clinic=self.clinic, is_booked=True).count(), 3)
+        url = reverse('patient', args=[self.patient.id])
+        self.assertEqual(self.client.get(url, {'page_size': 100}).data['results'], history)
+        past = self.client.get(url, {'ordering': 'past'}).data['results']
+        self.assertEqual([row['id'] for row in past], [row['id'] for row in history[4::-1]])
+        response = self.client.get(reverse('clinic-controller', args=[self.old_clinic.id]))
+        self.assertEqual(len(response.data['results']), 5)
+        rebuild_stats()
+        self.assertEqual(ClinicDayStats.objects.get(clinic=self.old_clinic).booked, 5)
+
+    @override_settings(JOBS={'PURGE_BATCH_SIZE': 2})
+    def test_clinic_delete_is_soft_and_purged_in_batches(self):
+        call_command('archive_reservations', days=30, stdout=StringIO())
+        url = reverse('clinic-controller', args=[self.clinic.id])
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        self.assertEqual(self.client.delete(url).status_code, 404)
+        self.assertEqual(self.client.get(reverse('get-clinics')).data['results'], [])
+        response = self.client.post(reverse('reservation', args=[self.patient.id]), {'clinic': self.clinic.id})
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(Clinic.objects.filter(pk=self.clinic.id).exists())
+
+        self.client.delete(reverse('clinic-controller', args=[self.old_clinic.id]))
+        self.run_jobs()
+        self.assertFalse(Clinic.objects.filter(pk__in=[self.clinic.id, self.old_clinic.id]).exists())
+        self.assertFalse(ArchivedReservation.objects.exists())
+        self.assertFalse(ClinicSlot.objects.exists())
+        self.assertGreater(Job.objects.filter(task='purge_clinic', status=Job.DONE).count(), 4)
+
+    def test_patient_delete_frees_slots_and_blocks_login(self):
+        self.assertEqual(self.client.delete(reverse('patient', args=[self.patient.id])).status_code, 204)
+        response = self.client.post(reverse('reservation', args=[self.patient.id]), {'clinic': self.clinic.id})
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(reverse('login'), {'email': 'patient@example.com', 'password': 'secret-pass'})
+        self.assertEqual(response.status_code, 401)
+        self.run_jobs()
+        self.assertFalse(BaseUser.objects.filter(pk=self.patient.id).exists())
+        self.assertFalse(ClinicSlot.objects.filter(is_booked=True).exists())
+        self.assertEqual(ClinicDayStats.objects.get(clinic=self.clinic).booked, 0)
+
+
+class ScheduleTest(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(User.objects.create(username='staff'))
+        self.doctor = Doctor.objects.create(email='doctor@example.com', name='Doctor', phone='+123456789')
+        self.patient = Patient.objects.create(email='patient@example.com', name='Patient', phone='+123456789')
+        today = timezone.localdate()
+        self.monday = today + timedelta(days=7 - today.weekday())
+        response = self.client.post(reverse('schedules'), {
+            'doctor': self.doctor.id, 'price': '80.00', 'start_time': '09:00', 'end_time': '11:00',
+            'weekdays': ['FR', 'MO', 'WE'], 'starts_on': self.monday, 'exceptions': [self.monday + timedelta(days=2)],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.schedule = ClinicSchedule.objects.get(pk=response.data['id'])
+
+    def book(self, date):
+        return self.client.post(
+            reverse('reservation', args=[self.patient.id]), {'schedule': self.schedule.id, 'date': date}, format='json',
+        )
+
+    def test_occurrence_dates(self):
+        self.assertEqual(self.schedule.weekdays, ['MO', 'WE', 'FR'])
+        week = occurrence_dates(self.schedule, self.monday, self.monday + timedelta(days=6))
+        self.assertEqual(week, [self.monday, self.monday + timedelta(days=4)])
+        fortnightly = ClinicSchedule(
+            frequency=ClinicSchedule.WEEKLY, interval=2, starts_on=self.monday + timedelta(days=2),
+            ends_on=self.monday + timedelta(days=30),
+        )
+        self.assertEqual(
+            occurrence_dates(fortnightly, self.monday, self.monday + timedelta(days=60)),
+            [self.monday + timedelta(days=days) for days in (2, 16, 30)],
+        )
+        every_third_day = ClinicSchedule(frequency=ClinicSchedule.DAILY, interval=3, starts_on=self.monday)
+        self.assertEqual(
+            occurrence_dates(every_third_day, self.monday + timedelta(days=1), self.monday + timedelta(days=9)),
+            [self.monday + timedelta(days=days) for days in (3, 6, 9)],
+        )
+
+    def test_listing_a_year_writes_no_rows(self):
+        response = self.client.get(reverse('schedule-occurrences'), {
+            'date_from': self.monday, 'date_to': self.monday + timedelta(days=363),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 52 * 3 - 1)
+        self.assertIsNone(response.data['results'][0]['id'])
+        self.assertFalse(Clinic.objects.exists())
+        self.assertFalse(ClinicSlot.objects.exists())
+        response = self.client.get(reverse('availability'), {'date_from': self.monday, 'date_to': self.monday})
+        day, = response.data['results']
+        self.assertEqual((day['clinic'], day['schedule'], len(day['free'])), (None, self.schedule.id, 4))
+
+    def test_booking_materializes_the_day_once(self):
+        first, second = self.book(self.monday), self.book(self.monday)
+        self.assertEqual((first.status_code, second.status_code), (201, 201))
+        self.assertEqual(first.data['clinic'], second.data['clinic'])
+        clinic = Clinic.objects.get(schedule=self.schedule)
+        self.assertEqual((clinic.date, clinic.price, clinic.is_active), (self.monday, Decimal('80.00'), True))
+        self.assertEqual(ClinicSlot.objects.filter(clinic=clinic, is_booked=True).count(), 2)
+        self.assertEqual(self.book(self.monday + timedelta(days=1)).status_code, 400)
+        self.assertEqual(self.book(self.monday + timedelta(days=2)).status_code, 400)
+
+        response = self.client.get(reverse('availability'), {'date_from': self.monday, 'date_to': self.monday})
+        day, = response.data['results']
+        self.assertEqual((day['clinic'], len(day['free']), len(day['booked'])), (clinic.id, 2, 2))
+        response = self.client.get(reverse('schedule-occurrences'), {'date_from': self.monday})
+        self.assertEqual(response.data['results'][0]['id'], clinic.id)
+
+    def test_deleting_a_booked_day_skips_it(self):
+        clinic_id = self.book(self.monday).data['clinic']
+        self.client.delete(reverse('clinic-controller', args=[clinic_id]))
+        self.schedule.refresh_from_db()
+        self.assertIn(self.monday.isoformat(), self.schedule.exceptions)
+        response = self.client.get(reverse('schedule-occurrences'), {'date_from': self.monday})
+        self.assertNotIn(str(self.monday), [day['date'] for day in response.data['results']])
+        self.assertEqual(self.book(self.monday).status_code, 400)
+
+    def test_directory_lists_unbooked_days_of_a_window(self):
+        window = {'date_from': self.monday, 'date_to': self.monday + timedelta(days=6)}
+        response = self.client.get(reverse('get-clinics'), window)
+        self.assertEqual(response.data['count'], 2)
+        first = response.data['results'][0]
+        self.assertEqual((first['id'], first['schedule'], first['date']), (None, self.schedule.id, str(self.monday)))
+        self.assertEqual((first['price'], first['doctor']['email']), ('80.00', 'doctor@example.com'))
+        self.assertEqual(self.client.get(reverse('get-clinics'), {**window, 'price_max': '50'}).data['count'], 0)
+        self.assertEqual(self.client.get(reverse('get-clinics')).data['count'], 0)
+
+        clinic_id = self.book(self.monday).data['clinic']
+        self.client.put(reverse('schedule', args=[self.schedule.id]), {'price': '90.00'}, format='json')
+        results = self.client.get(reverse('get-clinics'), window).data['results']
+        self.assertEqual([(row['id'], row['price']) for row in results], [(clinic_id, '80.00'), (None, '90.00')])
+        self.assertEqual(self.client.get(reverse('get-clinics')).data['count'], 1)
+
+    def test_directory_pages_clinic_rows_in_sql(self):
+        window = {'date_from': self.monday, 'date_to': self.monday + timedelta(days=6)}
+        clinics = [
+            Clinic.objects.create(
+                doctor=self.doctor, price=50, date=self.monday + timedelta(days=days),
+                start_time=time(12), end_time=time(13), is_active=True,
+            ).id
+            for days in (1, 1, 4, 4)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('get-clinics'), {**window, 'page': 2})
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(
+            [(row['id'], row['date']) for row in response.data['results']],
+            [(clinics[2], str(self.monday + timedelta(days=4))), (clinics[3], str(self.monday + timedelta(days=4))),
+             (None, str(self.monday + timedelta(days=4)))],
+        )
+        self.assertIn('LIMIT 2 OFFSET 2', [query['sql'] for query in queries if 'ORDER BY' in query['sql']][-1])
+        results = self.client.get(reverse('get-clinics'), window).data['results']
+        self.assertEqual([row['id'] for row in results], [None, clinics[0], clinics[1]])
@@ -0,0 +1,207 @@
+import hashlib
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+# RATES are 'requests/period' with period s, m, h or d. A bucket holds that
+# many tokens and refills evenly over the period, so a client may burst the
+# whole rate at once and then go on at the average pace. A rate under
+# '<scope>:<endpoint>' overrides the scope's rate for one endpoint. Buckets
+# live in the CACHE alias, which needs an atomic incr (locmem, memcached,
+# redis) and is shared by every worker using the same cache. With CACHE set
+# to None they are kept in process memory instead. A rate of None turns the
+# scope off; 'endpoint' is off by default, see EndpointThrottle.
+DEFAULTS = {
+    'ENABLED': True,
+    'CACHE': 'default',
+    'RATES': {
+        'ip': '30/m',
+        'email': '10/m',
+        'endpoint': None,
+    },
+}
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+MICROSECONDS = 1000000
+# Seconds a bucket is kept at least, so it cannot expire mid-request
+MIN_TIMEOUT = 60
+MAX_LOCAL_BUCKETS = 100000
+
+
+def throttling_setting(name):
+    return getattr(settings, 'THROTTLING', {}).get(name, DEFAULTS[name])
+
+
+# Microseconds between two tokens and the bucket size of a rate
+@lru_cache(maxsize=64)
+def parse_rate(rate):
+    count, period = rate.split('/')
+    return PERIODS[period[0]] * MICROSECONDS // int(count), int(count)
+
+
+class CacheBuckets:
+    '''
+        Buckets in a cache shared by every worker using it.
+
+        A bucket is stored as the time it is full again, so taking a token
+        is one atomic incr and concurrent workers never share a token. A
+        refused request hands its token back. Keys are kept until the
+        bucket would be full, longer while a client is refused.
+    '''
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def take(self, key, interval, burst, now):
+        cache = self.cache
+        timeout = max(burst // MICROSECONDS, MIN_TIMEOUT)
+        cache.add(key, now, timeout)
+        try:
+            full_at = cache.incr(key, interval)
+            if full_at < now + interval:
+                # The bucket refilled while idle, start counting from now
+                full_at = cache.incr(key, now + interval - full_at)
+        except ValueError:
+            # Expired in between, which only happens to a full bucket
+            cache.add(key, now + interval, timeout)
+            return 0
+        owed = full_at - now
+        if owed <= burst:
+            if owed > burst // 2:
+                cache.touch(key, timeout)
+            return 0
+        try:
+            cache.decr(key, interval)
+        except ValueError:
+            pass
+        cache.touch(key, max(owed // MICROSECONDS + 1, MIN_TIMEOUT))
+        return owed - burst
+
+
+class LocalBuckets:
+    '''
+        Buckets in a dict shared by the threads of one process, several
+        times faster than a cache but counting every process separately.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.full_at = {}
+        self.pruned_at = 0
+
+    def take(self, key, interval, burst, now):
+        with self.lock:
+            full_at = max(self.full_at.get(key, now), now) + interval
+            if full_at - now > burst:
+                return full_at - now - burst
+            self.full_at[key] = full_at
+            if len(self.full_at) > MAX_LOCAL_BUCKETS and now - self.pruned_at > MICROSECONDS:
+                self.prune(now)
+            return 0
+
+    # Full buckets hold no state worth keeping
+    def prune(self, now):
+        self.full_at = {key: full_at for key, full_at in self.full_at.items() if full_at > now}
+        self.pruned_at = now
+
+
+local_buckets = LocalBuckets()
+
+
+def buckets():
+    alias = throttling_setting('CACHE')
+    return CacheBuckets(alias) if alias else local_buckets
+
+
+def take(key, rate, now=None):
+    '''
+        Take a token from the bucket at ``key``. Returns 0 when granted,
+        otherwise the seconds until the next token.
+    '''
+    interval, size = parse_rate(rate)
+    now = int((now or time.time()) * MICROSECONDS)
+    return buckets().take(key, interval, interval * size, now) / MICROSECONDS
+
+
+# The name buckets of a view are kept under
+def endpoint(view):
+    return getattr(view, 'throttle_scope', None) or type(view).__name__
+
+
+class TokenBucketThrottle(BaseThrottle):
+    '''
+        DRF throttle taking a token per request from a bucket of ``scope``.
+
+        Subclasses name the client the bucket belongs to, None skips the
+        request. Refused requests answer 429 with Retry-After.
+    '''
+    scope = None
+
+    def client(self, request, view):
+        raise NotImplementedError
+
+    def rate(self, view):
+        rates = throttling_setting('RATES')
+        return rates.get(f'{self.scope}:{endpoint(view)}') or rates.get(self.scope)
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not throttling_setting('ENABLED'):
+            return True
+        rate = self.rate(view)
+        if not rate:
+            return True
+        client = self.client(request, view)
+        if client is None:
+            return True
+        self.retry_after = take(f'throttle:{self.scope}:{endpoint(view)}:{client}', rate)
+        return not self.retry_after
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPThrottle(TokenBucketThrottle):
+    scope = 'ip'
+
+    def client(self, request, view):
+        return self.get_ident(request)
+
+
+class EmailThrottle(TokenBucketThrottle):
+    '''
+        One bucket per submitted email, however many addresses a credential
+        stuffing run spreads its attempts for one account over.
+    '''
+    scope = 'email'
+
+    def client(self, request, view):
+        email = request.data.get('email') if hasattr(request.data, 'get') else None
+        if not isinstance(email, str) or not email.strip():
+            return None
+        # Hashed to keep keys short and free of characters memcached refuses
+        return hashlib.sha1(email.strip().lower().encode()).hexdigest()
+
+
+class EndpointThrottle(TokenBucketThrottle):
+    '''
+        One bucket shared by every client of an endpoint, a global circuit
+        breaker capping how much password hashing the endpoint does.
+
+        Once it is empty every client is refused, legitimate ones included,
+        so a single attacker can lock everybody out. It is off by default;
+        set its rate well above the normal peak when hashing cost has to be
+        capped.
+    '''
+    scope = 'endpoint'
+
+    def client(self, request, view):
+        return ''
+
+
+# Throttles of the anonymous endpoints that hash passwords
+AUTH_THROTTLES = [IPThrottle, EmailThrottle, EndpointThrottle]
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+def blacklist_key(jti):
+    return f'jwt-blacklist:{jti}'
+
+
+def blacklist_ttl():
+    return getattr(settings, 'JWT_BLACKLIST_CACHE_TTL', 60)
+
+
+class CachedRefreshToken(RefreshToken):
+    '''
+        Refresh token whose blacklist state is cached for a short TTL.
+
+        A token blacklisted through this process is seen at once, other
+        processes notice within JWT_BLACKLIST_CACHE_TTL seconds.
+    '''
+
+    @classmethod
+    def for_base_user(cls, user):
+        # Issued without an OutstandingToken row, blacklist() creates one on demand
+        token = cls()
+        token[api_settings.USER_ID_CLAIM] = getattr(user, api_settings.USER_ID_FIELD)
+        return token
+
+    def check_blacklist(self):
+        key = blacklist_key(self.payload[api_settings.JTI_CLAIM])
+        blacklisted = cache.get(key)
+        if blacklisted is None:
+            blacklisted = BlacklistedToken.objects.filter(token__jti=self.payload[api_settings.JTI_CLAIM]).exists()
+            cache.set(key, blacklisted, blacklist_ttl())
+        if blacklisted:
+            raise TokenError('Token is blacklisted')
+
+    def blacklist(self):
+        result = super().blacklist()
+        cache.set(blacklist_key(self.payload[api_settings.JTI_CLAIM]), True, blacklist_ttl())
+        return result
+
+
+class CachedTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = CachedRefreshToken
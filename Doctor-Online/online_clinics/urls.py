@@ -1,14 +1,34 @@
 from django.urls import path
 
-from .views import ClinicView, PatientView, ListClinic, ReservationView, RegisterPatientAPIView, RegisterDoctorAPIView, \
-    LoginUserAPIView
+from . import async_views
+from .views import ClinicView, PatientView, ListClinic, ListFreeSlots, ReservationView, RegisterPatientAPIView, RegisterDoctorAPIView, \
+    LoginUserAPIView, RefreshTokenAPIView, BulkClinicView, BulkReservationView, ReservationExportView, \
+    ClinicStatsView, DoctorRevenueView, InstrumentationView, AvailabilityView, ScheduleListView, ScheduleView, \
+    ScheduleOccurrenceView
 
 urlpatterns = [
-    path('clinic', ClinicView.as_view(), name='clinic-controller'),
-    path('patient', PatientView.as_view(), name='patient'),
+    path('clinic/<int:id>', ClinicView.as_view(), name='clinic-controller'),
+    path('clinic/<int:id>/slots', ListFreeSlots.as_view(), name='clinic-free-slots'),
+    path('patient/<int:id>', PatientView.as_view(), name='patient'),
     path('get-clinics', ListClinic.as_view(), name='get-clinics'),
-    path('reserve', ReservationView.as_view(), name='reservation'),
+    path('availability', AvailabilityView.as_view(), name='availability'),
+    path('schedules', ScheduleListView.as_view(), name='schedules'),
+    path('schedules/occurrences', ScheduleOccurrenceView.as_view(), name='schedule-occurrences'),
+    path('schedule/<int:id>', ScheduleView.as_view(), name='schedule'),
+    path('clinics/bulk', BulkClinicView.as_view(), name='bulk-clinics'),
+    path('reserve/bulk', BulkReservationView.as_view(), name='bulk-reservations'),
+    path('reservations/export', ReservationExportView.as_view(), name='reservation-export'),
+    path('reserve/<int:patient_id>', ReservationView.as_view(), name='reservation'),
+    path('stats/clinics', ClinicStatsView.as_view(), name='clinic-stats'),
+    path('stats/doctors', DoctorRevenueView.as_view(), name='doctor-revenue'),
+    path('stats/instrumentation', InstrumentationView.as_view(), name='instrumentation'),
     path('register/doctor/', RegisterDoctorAPIView.as_view(), name='register-doctor'),
     path('register/patient/', RegisterPatientAPIView.as_view(), name='register-patient'),
     path('login/', LoginUserAPIView.as_view(), name='login'),
+    path('login/refresh/', RefreshTokenAPIView.as_view(), name='token-refresh'),
+
+    # Read endpoints served from the event loop under ASGI
+    path('async/get-clinics', async_views.list_clinics, name='async-get-clinics'),
+    path('async/clinic/<int:id>', async_views.clinic_reservations, name='async-clinic-reservations'),
+    path('async/patient/<int:id>', async_views.patient_reservations, name='async-patient-reservations'),
 ]
@@ -1,135 +1,412 @@
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from rest_framework import filters, generics
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.utils import timezone
+from rest_framework import generics
 from rest_framework import status
 from rest_framework.generics import ListAPIView
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from rest_framework_simplejwt.views import TokenRefreshView
 
+from .availability import availability, clinic_days, days_etag, last_modified
+from .bulk import MAX_BATCH_SIZE, create_clinics, create_reservations
+from .cache import directory_version, get_page, set_page
+from .conditional import clock_version, not_modified, patients_version, private, reservations_version, weak_etag
+from .export import export_lines
+from .filters import ClinicSearchFilter, StatsFilter
+from .hashing import service as hashing_service
+from .instrumentation import recorder
+from .jobs import enqueue
+from .models import ClinicSchedule, ReservationHistory
+from .pagination import MergedRows, ReservationCursorPagination
+from .routers import ReplicaReadMixin, reading_replica
+from .rows import ClinicListRows, ClinicReservationRows, PatientReservationRows
+from .schedules import MAX_EXPANSION_DAYS, active_schedules, expand, occurrences
 from .serializers import *
+from .throttling import AUTH_THROTTLES
+from .tokens import CachedTokenRefreshSerializer
 
 
-class ListClinic(ListAPIView):
+class ListClinic(ReplicaReadMixin, ListAPIView):
     '''
         Get all active clinics
     '''
     permission_classes = [IsAuthenticated, ]
-    queryset = Clinic.objects.filter(is_active=True)
+    queryset = Clinic.objects.filter(is_active=True).order_by('date', 'id')
     serializer_class = ClinicListSerializer
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['name']
+    filter_backends = [ClinicSearchFilter]
 
+    # Serve the directory from cache, it only changes on clinic, doctor or
+    # schedule edits. Pages are built from rows, ClinicListSerializer
+    # describes their shape. Pages read from a replica are neither cached
+    # nor tagged, they may be older than the version.
+    def list(self, request, *args, **kwargs):
+        etag = weak_etag(request, directory_version())
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        data = get_page(request)
+        if data is None:
+            rows = ClinicListRows.values(self.filter_queryset(self.get_queryset()))
+            occurrences = self.occurrence_rows(request)
+            if occurrences:
+                rows = MergedRows(rows, occurrences)
+            page = self.paginate_queryset(rows)
+            data = self.get_paginated_response(ClinicListRows(page, many=True).data).data
+            if reading_replica():
+                etag = None
+            else:
+                set_page(request, data)
+        return private(Response(data), etag)
 
-class ClinicView(APIView):
+    # Days of schedules nobody booked yet have no row, they are expanded when
+    # date_from and date_to bound a window of at most MAX_EXPANSION_DAYS.
+    # Search reads the index of clinic rows, which such days are not in.
+    def occurrence_rows(self, request):
+        lookups = ClinicSearchFilter().lookups(request)
+        date_from, date_to = lookups.get('date__gte'), lookups.get('date__lte')
+        if request.query_params.get('search') or date_from is None or date_to is None:
+            return []
+        if not 0 <= (date_to - date_from).days < MAX_EXPANSION_DAYS:
+            return []
+        prices = {lookup: value for lookup, value in lookups.items() if lookup.startswith('price__')}
+        schedules = active_schedules(date_from, date_to).filter(**prices).select_related('doctor')
+        return [ClinicListRows.occurrence(clinic) for clinic in expand(schedules, date_from, date_to)]
+
+
+class ListFreeSlots(ListAPIView):
+    '''
+        Get upcoming free slots of a clinic
+    '''
+    permission_classes = [IsAuthenticated, ]
+    serializer_class = ClinicSlotSerializer
+
+    def get_queryset(self):
+        return ClinicSlot.objects.filter(
+            clinic=self.kwargs['id'], is_booked=False, time__gte=timezone.now()
+        ).order_by('time')
+
+
+class AvailabilityView(ReplicaReadMixin, APIView):
+    '''
+        Free and booked slots of active clinics over a date range.
+
+        Answers 304 to a matching If-None-Match or If-Modified-Since after a
+        single query on the clinic day versions, slots are only read when
+        something changed.
+    '''
+    permission_classes = [IsAuthenticated, ]
+
+    def get(self, request):
+        serializer = AvailabilitySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = serializer.validated_data
+        days = clinic_days(**filters)
+        etag, modified = days_etag(days, filters), last_modified(days)
+        modified = int(modified.timestamp()) if modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=modified)
+        if response is None:
+            response = Response({
+                'date_from': filters['date_from'], 'date_to': filters['date_to'],
+                'results': availability(days, **filters),
+            })
+        if modified:
+            response['Last-Modified'] = http_date(modified)
+        return private(response, etag)
+
+
+class ClinicView(ReplicaReadMixin, APIView):
     '''
         Clinic view class
     '''
     permission_classes = [IsAuthenticated, ]
 
+    # Get clinic's reservations, one cursor page at a time. Archived ones
+    # are read through the history view as if they were still live. Pages
+    # read from a replica carry no ETag, they may be older than the version.
     def get(self, request, *args, **kwargs):
-        now = datetime.now()
+        now = timezone.now()
         params = request.query_params
+        etag = weak_etag(
+            request, reservations_version('clinic', kwargs['id']), patients_version(), clock_version(params),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        reservations = ClinicReservationRows.values(ReservationHistory.objects.all())
         if params.get('ordering') == 'past':
-            queryset = Reservation.objects.filter(clinic=kwargs['id'], time__lt=now)
+            queryset = reservations.filter(clinic=kwargs['id'], time__lt=now)
         elif params.get('ordering') == 'upcoming':
-            queryset = Reservation.objects.filter(clinic=kwargs['id'], time__gte=now)
+            queryset = reservations.filter(clinic=kwargs['id'], time__gte=now)
         else:
-            queryset = Reservation.objects.filter(clinic=kwargs['id'])
-        serializer = ClinicReservationSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+            queryset = reservations.filter(clinic=kwargs['id'])
+        paginator = ReservationCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = ClinicReservationRows(page, many=True)
+        return private(paginator.get_paginated_response(serializer.data), None if reading_replica() else etag)
 
     # Edit clinic
     def put(self, request, *args, **kwargs):
-        clinic = get_object_or_404(Clinic, pk=kwargs['id'])
+        clinic = get_object_or_404(Clinic, pk=kwargs['id'], deleted_at=None)
         serializer = ClinicSerializer(clinic, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # Delete clinic
+    # Delete clinic, its reservations are removed in batches by a job
     def delete(self, request, *args, **kwargs):
-        clinic = get_object_or_404(Clinic, pk=kwargs['id'])
-        clinic.delete()
+        clinic = get_object_or_404(Clinic, pk=kwargs['id'], deleted_at=None)
+        with transaction.atomic():
+            clinic.soft_delete()
+            enqueue('purge_clinic', {'clinic': clinic.pk})
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class PatientView(APIView):
+class PatientView(ReplicaReadMixin, APIView):
     '''
         Patient view class
     '''
     permission_classes = [IsAuthenticated, ]
 
-    # Get patient's reservations
+    # Get patient's reservations, one cursor page at a time, archived ones
+    # included. Clinic details are embedded, so clinic edits change the
+    # ETag as well. Pages read from a replica carry no ETag.
     def get(self, request, *args, **kwargs):
-        now = datetime.now()
+        now = timezone.now()
         params = request.query_params
+        etag = weak_etag(
+            request, reservations_version('patient', kwargs['id']), directory_version(), clock_version(params),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        reservations = PatientReservationRows.values(ReservationHistory.objects.all())
         if params.get('ordering') == 'past':
-            queryset = Reservation.objects.filter(patient=kwargs['id'], time__lt=now)
+            queryset = reservations.filter(patient=kwargs['id'], time__lt=now)
         elif params.get('ordering') == 'upcoming':
-            queryset = Reservation.objects.filter(patient=kwargs['id'], time__gte=now)
+            queryset = reservations.filter(patient=kwargs['id'], time__gte=now)
         else:
-            queryset = Reservation.objects.filter(patient=kwargs['id'])
-        serializer = PatientReservationSerializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+            queryset = reservations.filter(patient=kwargs['id'])
+        paginator = ReservationCursorPagination()
+        page = paginator.paginate_queryset(queryset, request, view=self)
+        serializer = PatientReservationRows(page, many=True)
+        return private(paginator.get_paginated_response(serializer.data), None if reading_replica() else etag)
 
     # Edit patient
     def put(self, request, *args, **kwargs):
-        patient = get_object_or_404(Patient, pk=kwargs['id'])
+        patient = get_object_or_404(Patient, pk=kwargs['id'], deleted_at=None)
         serializer = PatientSerializer(patient, data=request.data, partial=True)
         if serializer.is_valid():
             serializer.save()
             return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-    # Delete patient
+    # Delete patient, their reservations are removed in batches by a job
     def delete(self, request, *args, **kwargs):
-        patient = get_object_or_404(Clinic, pk=kwargs['id'])
-        patient.delete()
+        patient = get_object_or_404(Patient, pk=kwargs['id'], deleted_at=None)
+        with transaction.atomic():
+            patient.soft_delete()
+            enqueue('purge_patient', {'patient': patient.pk})
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
+class ScheduleListView(generics.ListCreateAPIView):
+    '''
+        List and create recurring clinics
+    '''
+    permission_classes = [IsAuthenticated, ]
+    queryset = ClinicSchedule.objects.order_by('id')
+    serializer_class = ClinicScheduleSerializer
+
+
+class ScheduleView(APIView):
+    '''
+        Schedule view class. Edits apply to days not booked yet, booked
+        days keep the clinic row they were given.
+    '''
+    permission_classes = [IsAuthenticated, ]
+
+    # Edit schedule
+    def put(self, request, *args, **kwargs):
+        schedule = get_object_or_404(ClinicSchedule, pk=kwargs['id'])
+        serializer = ClinicScheduleSerializer(schedule, data=request.data, partial=True)
+        if serializer.is_valid():
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    # Delete schedule, booked days stay as plain clinics
+    def delete(self, request, *args, **kwargs):
+        get_object_or_404(ClinicSchedule, pk=kwargs['id']).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ScheduleOccurrenceView(ReplicaReadMixin, APIView):
+    '''
+        Days of recurring clinics over a date range, expanded per request
+    '''
+    permission_classes = [IsAuthenticated, ]
+
+    def get(self, request):
+        serializer = OccurrenceSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = serializer.validated_data
+        return Response({
+            'date_from': filters['date_from'], 'date_to': filters['date_to'],
+            'results': ClinicOccurrenceSerializer(occurrences(**filters), many=True).data,
+        })
+
+
 class ReservationView(APIView):
     '''
         Reservation view class
     '''
     permission_classes = [IsAuthenticated, ]
 
-    # Create reservation for patient
+    # Create reservation for patient, deleted patients cannot book
     def post(self, request, *args, **kwargs):
+        patient = get_object_or_404(Patient, pk=kwargs['patient_id'], deleted_at=None)
         serializer = ReservationSerializer(data=request.data)
         if serializer.is_valid():
-            reservation = serializer.save(patient=kwargs['patient_id'])
-            return Response(reservation.data, status=status.HTTP_201_CREATED)
+            serializer.save(patient=patient.pk)
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkView(APIView):
+    '''
+        Base view for batch creation endpoints.
+
+        Answers 201 when every item was created, 207 when only some were
+        and 400 when none were, with the errors listed by item index.
+    '''
+    permission_classes = [IsAuthenticated, ]
+    create_items = None
+    serializer_class = None
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'detail': 'Expected a non-empty list.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > MAX_BATCH_SIZE:
+            return Response(
+                {'detail': f'At most {MAX_BATCH_SIZE} items per request.'}, status=status.HTTP_400_BAD_REQUEST,
+            )
+        created, errors = self.create_items(items)
+        if not errors:
+            code = status.HTTP_201_CREATED
+        elif created:
+            code = status.HTTP_207_MULTI_STATUS
+        else:
+            code = status.HTTP_400_BAD_REQUEST
+        return Response({
+            'created': self.serializer_class(created, many=True).data,
+            'errors': [{'index': index, 'errors': error} for index, error in sorted(errors.items())],
+        }, status=code)
+
+
+class BulkClinicView(BulkView):
+    '''
+        Create many clinics in one request
+    '''
+    create_items = staticmethod(create_clinics)
+    serializer_class = ClinicSerializer
+
+
+class BulkReservationView(BulkView):
+    '''
+        Book many reservations in one request
+    '''
+    create_items = staticmethod(create_reservations)
+    serializer_class = ReservationSerializer
+
+
+class ReservationExportView(APIView):
+    '''
+        Stream reservations as CSV or NDJSON, filtered by clinic, patient and date range
+    '''
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request, *args, **kwargs):
+        serializer = ReservationExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        lines, content_type = export_lines(**serializer.validated_data)
+        response = StreamingHttpResponse(lines, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="reservations.{serializer.validated_data["output"]}"'
+        return response
+
+
+class ClinicStatsView(ListAPIView):
+    '''
+        Utilization and revenue per clinic day, read from precomputed rows
+    '''
+    permission_classes = [IsAdminUser, ]
+    queryset = ClinicDayStats.objects.order_by('date', 'clinic')
+    serializer_class = ClinicDayStatsSerializer
+    filter_backends = [StatsFilter]
+
+
+class DoctorRevenueView(ListAPIView):
+    '''
+        Bookings and revenue per doctor per day, summed over precomputed rows
+    '''
+    permission_classes = [IsAdminUser, ]
+    queryset = ClinicDayStats.objects.values('doctor', 'date').annotate(
+        clinics=Count('id'), capacity=Sum('capacity'), booked=Sum('booked'), revenue=Sum('revenue'),
+    ).order_by('date', 'doctor')
+    serializer_class = DoctorDayRevenueSerializer
+    filter_backends = [StatsFilter]
+
+
+class InstrumentationView(APIView):
+    '''
+        Rolling per-view timing and query histograms, slowest views first,
+        with password hashing latency and pool rejections of this process
+    '''
+    permission_classes = [IsAdminUser, ]
+
+    def get(self, request):
+        return Response({'views': recorder.report(), 'password_hashing': hashing_service.stats()})
+
+
 class RegisterDoctorAPIView(generics.CreateAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLES
+    throttle_scope = 'register'
 
     # Create clinic
     def post(self, request):
         serializer = ClinicSerializer(data=request.data)
         if serializer.is_valid():
-            clinic = serializer.save()
-            return Response(clinic.data, status=status.HTTP_201_CREATED)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class RegisterPatientAPIView(generics.CreateAPIView):
     permission_classes = [AllowAny]
+    throttle_classes = AUTH_THROTTLES
+    throttle_scope = 'register'
 
     # Create patient
     def post(self, request):
         serializer = PatientSerializer(data=request.data)
         if serializer.is_valid():
-            patient = serializer.save()
-            return Response(patient.data, status=status.HTTP_201_CREATED)
+            serializer.save()
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 class LoginUserAPIView(generics.GenericAPIView):
     permission_classes = [AllowAny, ]
+    throttle_classes = AUTH_THROTTLES
+    throttle_scope = 'login'
     serializer_class = UserLoginSerializer
 
     def post(self, request, *args, **kwargs):
@@ -137,3 +414,8 @@ class LoginUserAPIView(generics.GenericAPIView):
         if serializer.is_valid(raise_exception=True):
             return Response(serializer.data, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+class RefreshTokenAPIView(TokenRefreshView):
+    permission_classes = [AllowAny, ]
+    serializer_class = CachedTokenRefreshSerializer